@@ -0,0 +1,81 @@
+"""Стоимость импорта аналитики для воркера gunicorn
+
+Сравнивает время и память на запуск интерпретатора, django.setup() и
+импорт модулей приложения с прежними импортами pandas/plotly уровня
+модуля (before) и без них (after).
+
+pandas больше нет в requirements.txt; для сценария before его нужно
+поставить отдельно (pip install pandas), иначе сценарий пропускается.
+
+    python benchmarks/import_cost.py --runs 7
+"""
+import argparse
+import importlib.util
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+CHILD = '''
+import json, os, resource, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+{heavy}
+import wardrobe.views
+import wardrobe.analytics_utils
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_kb / 1024}}))
+'''
+
+SCENARIOS = {
+    'before': 'import pandas, plotly.express, plotly.offline',
+    'after': '',
+}
+
+# Модули, без которых сценарий не запустить
+REQUIRED_MODULES = {
+    'before': ('pandas', 'plotly'),
+    'after': (),
+}
+
+
+def measure(heavy, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD.format(heavy=heavy)],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    return {
+        'seconds': statistics.median(r['seconds'] for r in results),
+        'rss_mb': statistics.median(r['rss_mb'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, heavy in SCENARIOS.items():
+        missing = [module for module in REQUIRED_MODULES[name] if importlib.util.find_spec(module) is None]
+        if missing:
+            print(f"{name:>7}: пропущен, не установлено: {', '.join(missing)} (pip install {' '.join(missing)})")
+            continue
+        result = measure(heavy, args.runs)
+        print(f"{name:>7}: {result['seconds'] * 1000:8.1f} ms  {result['rss_mb']:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
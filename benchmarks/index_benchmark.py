@@ -0,0 +1,189 @@
+"""Составные индексы по пользователю: планы запросов и задержка
+
+Создает временную базу SQLite, заполняет ее (по умолчанию 100 000 вещей
+у 1 000 пользователей), затем измеряет типичные запросы приложения без
+составных индексов миграции 0004 (before) и с ними (after).
+
+    python benchmarks/index_benchmark.py --users 1000 --items-per-user 100
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+from django.conf import settings  # noqa: E402
+
+DB_PATH = Path(tempfile.mkdtemp()) / 'index_benchmark.sqlite3'
+settings.DATABASES['default']['NAME'] = DB_PATH
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from wardrobe.models import ClothingItem, Outfit  # noqa: E402
+
+
+BENCHMARK_INDEXES = {
+    ClothingItem: [
+        'clothingitem_user_category_idx',
+        'clothingitem_user_created_idx',
+        'clothingitem_user_price_idx',
+        'clothingitem_user_rating_idx',
+    ],
+    Outfit: [
+        'outfit_user_created_idx',
+        'outfit_user_rating_idx',
+    ],
+}
+
+QUERIES = {
+    'generation (user, category)': lambda user_id: ClothingItem.objects.filter(
+        user_id=user_id, category='top'
+    ),
+    'home (user, -created_at)': lambda user_id: ClothingItem.objects.filter(
+        user_id=user_id
+    ).order_by('-created_at')[:4],
+    'outfits (user, -created_at)': lambda user_id: Outfit.objects.filter(
+        user_id=user_id
+    ).order_by('-created_at')[:4],
+    'financial (user, price)': lambda user_id: ClothingItem.objects.filter(
+        user_id=user_id, price__isnull=False
+    ).order_by('-price')[:3],
+    'min_rating (user, rating)': lambda user_id: ClothingItem.objects.filter(
+        user_id=user_id, rating__gte=5
+    ),
+}
+
+
+def seed(users_count, items_per_user, outfits_per_user):
+    random.seed(42)
+    now = timezone.now()
+    categories = [code for code, name in ClothingItem.CATEGORY_CHOICES]
+    colors = [code for code, name in ClothingItem.COLOR_CHOICES]
+
+    User.objects.bulk_create(
+        [User(username=f'bench{i}', password='!') for i in range(users_count)],
+        batch_size=1000,
+    )
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    items = []
+    for user_id in user_ids:
+        for i in range(items_per_user):
+            items.append(ClothingItem(
+                user_id=user_id,
+                name=f'Item {i}',
+                image='clothing/bench.jpg',
+                color=random.choice(colors),
+                category=random.choice(categories),
+                season=random.randint(1, 15),
+                occasion=random.randint(1, 31),
+                rating=random.randint(1, 5),
+                price=Decimal(random.randint(100, 20000)) if random.random() < 0.7 else None,
+            ))
+        if len(items) >= 10000:
+            ClothingItem.objects.bulk_create(items, batch_size=2000)
+            items = []
+    ClothingItem.objects.bulk_create(items, batch_size=2000)
+
+    # auto_now_add выставляет одно время на всю пачку - разносим даты
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE wardrobe_clothingitem SET created_at = datetime(%s, '-' || (id % 1000) || ' hours')",
+            [now.strftime('%Y-%m-%d %H:%M:%S')],
+        )
+
+    Outfit.objects.bulk_create(
+        [
+            Outfit(
+                user_id=user_id,
+                name=f'Outfit {i}',
+                occasion=random.randint(1, 31),
+                rating=random.randint(1, 5),
+                created_at=now - timedelta(hours=i),
+            )
+            for user_id in user_ids
+            for i in range(outfits_per_user)
+        ],
+        batch_size=2000,
+    )
+
+    return user_ids
+
+
+def set_indexes(enabled):
+    with connection.schema_editor() as schema_editor:
+        for model, names in BENCHMARK_INDEXES.items():
+            for index in model._meta.indexes:
+                if index.name in names:
+                    if enabled:
+                        schema_editor.add_index(model, index)
+                    else:
+                        schema_editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def query_plan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return '; '.join(row[-1] for row in cursor.fetchall())
+
+
+def measure(user_ids, runs):
+    results = {}
+    sample = random.sample(user_ids, min(runs, len(user_ids)))
+    for name, build in QUERIES.items():
+        timings = []
+        for user_id in sample:
+            start = time.perf_counter()
+            list(build(user_id))
+            timings.append(time.perf_counter() - start)
+        results[name] = (statistics.median(timings) * 1000, query_plan(build(sample[0])))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--items-per-user', type=int, default=100)
+    parser.add_argument('--outfits-per-user', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    start = time.perf_counter()
+    user_ids = seed(args.users, args.items_per_user, args.outfits_per_user)
+    print(f'Seeded {args.users * args.items_per_user} items in {time.perf_counter() - start:.1f} s ({DB_PATH})')
+
+    set_indexes(False)
+    before = measure(user_ids, args.runs)
+    set_indexes(True)
+    after = measure(user_ids, args.runs)
+
+    for name in QUERIES:
+        before_ms, before_plan = before[name]
+        after_ms, after_plan = after[name]
+        print(f'\n{name}')
+        print(f'  before {before_ms:8.3f} ms  {before_plan}')
+        print(f'  after  {after_ms:8.3f} ms  {after_plan}')
+
+
+if __name__ == '__main__':
+    main()
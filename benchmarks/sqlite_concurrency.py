@@ -0,0 +1,168 @@
+"""Конкурентная запись в SQLite: ошибки "database is locked" и задержка
+
+Запускает несколько процессов (как воркеры gunicorn), которые повторяют
+работу rate_outfit: читают гардероб, генерируют образ и в одной
+транзакции обновляют Compatibility и счетчики показов. Сравнивает
+стандартный бэкенд sqlite3 без настроек (before) и профиль приложения:
+WAL, busy_timeout и другие SQLITE_PRAGMAS плюс BEGIN IMMEDIATE (after).
+
+    python benchmarks/sqlite_concurrency.py --workers 8 --requests 200
+"""
+import argparse
+import json
+import os
+import queue
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ('before', 'after')
+
+
+def setup_django(scenario, db_path):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = db_path
+    if scenario == 'before':
+        settings.DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
+        settings.SQLITE_PRAGMAS = {}
+
+    import django
+
+    django.setup()
+
+
+def seed(users_count, items_per_category):
+    from django.contrib.auth.models import User
+    from wardrobe.models import ClothingItem
+
+    User.objects.bulk_create([User(username=f'load{i}', password='!') for i in range(users_count)])
+    ClothingItem.objects.bulk_create([
+        ClothingItem(user=user, name=f'{category} {i}', color='black', category=category, season=1, rating=3)
+        for user in User.objects.all()
+        for category in ('top', 'bottom', 'shoes')
+        for i in range(items_per_category)
+    ])
+
+
+def worker(worker_id, requests, results):
+    """Один воркер: requests оценок образов случайных пользователей"""
+    import random
+
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, connection, transaction
+    from django.db.models import F
+
+    from wardrobe.generation_utils import generate_outfit_algorithm, update_compatibility_scores
+    from wardrobe.models import ClothingItem
+
+    connection.close()
+    rng = random.Random(worker_id)
+    users = list(User.objects.all())
+    latencies = []
+    errors = 0
+    for _ in range(requests):
+        user = rng.choice(users)
+        start = time.perf_counter()
+        try:
+            items = generate_outfit_algorithm(user, ['top', 'bottom', 'shoes'])
+            with transaction.atomic():
+                update_compatibility_scores(user, items, rng.randint(1, 5))
+                ClothingItem.objects.filter(id__in=[item.id for item in items]).update(
+                    times_shown=F('times_shown') + 1
+                )
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    results.put({'latencies': latencies, 'errors': errors})
+
+
+def run_scenario(scenario, args):
+    """Выполняется в отдельном процессе: свои настройки и своя база"""
+    import multiprocessing
+
+    db_path = Path(tempfile.mkdtemp()) / f'{scenario}.sqlite3'
+    setup_django(scenario, db_path)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('migrate', verbosity=0)
+    seed(args.users, args.items)
+    connection.close()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(i, args.requests, results))
+        for i in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = []
+    while len(outcomes) < len(processes):
+        try:
+            outcomes.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(process.exitcode for process in processes):
+                sys.exit('Воркер завершился с ошибкой')
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for outcome in outcomes for latency in outcome['latencies'])
+    errors = sum(outcome['errors'] for outcome in outcomes)
+    print(json.dumps({
+        'requests': len(latencies),
+        'errors': errors,
+        # Оценки, которые записались; быстрые ошибки блокировки не в счет
+        'throughput': (len(latencies) - errors) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Оценок на воркер')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--items', type=int, default=10, help='Вещей на категорию у пользователя')
+    parser.add_argument('--scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario, args)
+        return
+
+    print(f'{args.workers} workers x {args.requests} ratings, {args.users} users')
+    for scenario in SCENARIOS:
+        output = subprocess.run(
+            [sys.executable, __file__, '--scenario', scenario, *sys.argv[1:]],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(
+            f'{scenario:7} errors {result["errors"]:5} / {result["requests"]}'
+            f'  {result["throughput"]:7.1f} ok/s'
+            f'  p50 {result["p50_ms"]:7.1f} ms  p95 {result["p95_ms"]:7.1f} ms  max {result["max_ms"]:7.1f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ Django settings for config project.
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import sys
 
 load_dotenv()
 
@@ -21,6 +22,9 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'запасной-ключ')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
+# `manage.py test` runs in a single process
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'goodchoice.onrender.com']
 
 
@@ -44,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'wardrobe.routers.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -72,11 +77,73 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 with BEGIN IMMEDIATE for atomic() blocks, see SQLITE_PRAGMAS below
+        'ENGINE': 'wardrobe.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Optional read replica for uncached read-only views (wardrobe.routers.ReplicaRouter):
+# REPLICA_DB_HOST - Postgres replica (REPLICA_DB_NAME/USER/PASSWORD/PORT),
+# REPLICA_DB_PATH - SQLite snapshot of the primary made with manage.py snapshot_replica.
+# Reads stay on the primary for REPLICA_PIN_SECONDS after the browser writes;
+# with a snapshot, keep it at least as long as the snapshot interval.
+
+REPLICA_DB_PATH = os.getenv('REPLICA_DB_PATH')
+
+if os.getenv('REPLICA_DB_HOST'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'HOST': os.getenv('REPLICA_DB_HOST'),
+        'PORT': os.getenv('REPLICA_DB_PORT', '5432'),
+        'NAME': os.getenv('REPLICA_DB_NAME', 'goodchoice'),
+        'USER': os.getenv('REPLICA_DB_USER', ''),
+        'PASSWORD': os.getenv('REPLICA_DB_PASSWORD', ''),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif REPLICA_DB_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_DB_PATH}?mode=ro',
+        'OPTIONS': {'uri': True},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['wardrobe.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+
+# Cache
+# Backend is selected with CACHE_BACKEND: file (default), db, redis or locmem.
+# The wardrobe version counter, analytics, outfit pools and generator state live in this cache and
+# must be shared by every process: gunicorn workers, run_image_worker and management commands.
+# locmem is private to one process, so it is used only for tests (check wardrobe.W001 warns otherwise).
+# file is shared by processes on one host; use db or redis when the app runs on several hosts.
+# The db backend needs `python manage.py createcachetable`; redis needs the redis package.
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'goodchoice',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', BASE_DIR / 'cache'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'goodchoice_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem' if TESTING else 'file')],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -125,3 +192,76 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Outfit generation
+# Number of pre-generated outfits kept per user and category set
+
+OUTFIT_POOL_SIZE = 20
+
+# Refill pools inline after commit instead of in a background thread (used by tests)
+
+POOL_REFILL_SYNC = TESTING
+
+# Analytics page context is cached per wardrobe version (seconds)
+
+ANALYTICS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Wardrobe and outfit lists are paginated by keyset cursor (items per page)
+
+WARDROBE_PAGE_SIZE = 24
+
+# Background photo processing (manage.py run_image_worker)
+# Failed jobs are retried with exponential backoff starting at IMAGE_JOB_RETRY_DELAY seconds
+
+IMAGE_JOB_MAX_ATTEMPTS = 5
+IMAGE_JOB_RETRY_DELAY = 30
+
+# Previous generated outfits kept per user for undo and comparison
+
+GENERATION_HISTORY_SIZE = 10
+
+# Generation log (manage.py rebuild_compatibility replays it into Compatibility)
+# Events are buffered per process and written in bulk every N events or N seconds
+
+GENERATION_EVENT_BUFFER_SIZE = 50
+GENERATION_EVENT_FLUSH_INTERVAL = 5
+# A timer thread writes the buffer after the interval even if no new events arrive (off in tests)
+GENERATION_EVENT_FLUSH_TIMER = not TESTING
+
+# Compatibility learning rule: 'linear' (score += step * rating) or 'ema' (moving average)
+
+COMPATIBILITY_LEARNING_RULE = 'linear'
+COMPATIBILITY_LEARNING_STEP = 0.1
+
+# Outfit scoring model: 'heuristic', 'thompson', 'ucb', 'embedding' or a dotted path to an OutfitScorer subclass
+# Compare models on the generation log with manage.py evaluate_scorers
+
+OUTFIT_SCORER = 'heuristic'
+
+# Item embeddings for OUTFIT_SCORER = 'embedding' (matrix factorisation of pair ratings)
+# Updated after every rating while this scorer is selected; retrain from the generation log
+# with manage.py train_embeddings (e.g. after switching to it)
+
+ITEM_EMBEDDING_DIM = 16
+ITEM_EMBEDDING_LEARNING_RATE = 0.05
+ITEM_EMBEDDING_REGULARIZATION = 0.01
+
+# Applied to every new SQLite connection (wardrobe.signals.configure_sqlite_connection).
+# WAL lets readers run during a write; synchronous=NORMAL is durable in WAL mode except on power loss;
+# busy_timeout (ms) waits for the write lock instead of failing with "database is locked".
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # KiB
+    'temp_store': 'MEMORY',
+}
+
+# Per-process bitmap indexes of each user's items (wardrobe.bitmap_utils), checked against the item count,
+# last id and last updated_at in the same database on every use and rebuilt when they change.
+# Filters matching more than ITEM_INDEX_MAX_IDS items fall back to SQL instead of an id__in list.
+
+ITEM_INDEX_MAX_USERS = 1000
+ITEM_INDEX_MAX_IDS = 5000
@@ -3,14 +3,21 @@ from django.urls import path, include
 from django.conf import settings
 from django.views.static import serve 
 from django.urls import re_path 
+from wardrobe.storage import content_hash
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('wardrobe.urls')),
 ]
 
+
+def serve_media(request, path):
+    """Отдает медиафайлы; файлы в хранилище по содержимому не меняются и кэшируются на год"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if content_hash(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 urlpatterns += [
-    re_path(r'^media/(?P<path>.*)$', serve, {
-        'document_root': settings.MEDIA_ROOT,
-    }),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
 ]
\ No newline at end of file
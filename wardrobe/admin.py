@@ -1,24 +1,76 @@
 from django.contrib import admin
-from .models import ClothingItem, Outfit, Compatibility
+from .models import ClothingItem, Outfit, Compatibility, GenerationEvent, ImageBlob, ImageJob
+from .search_utils import full_text_available, match_expression, search
+
+
+class OccasionListFilter(admin.SimpleListFilter):
+    """Фильтр по типу мероприятия, хранимому битовой маской"""
+    title = 'Тип мероприятия'
+    parameter_name = 'occasion'
+
+    def lookups(self, request, model_admin):
+        return ClothingItem.OCCASION_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(occasion__has=self.value())
+        return queryset
+
+
+class FullTextSearchMixin:
+    """Поиск в админке по индексу FTS5 вместо LIKE '%...%' по всей таблице"""
+
+    def get_search_results(self, request, queryset, search_term):
+        if full_text_available(queryset.db) and match_expression(search_term):
+            return search(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
 
 @admin.register(ClothingItem)
-class ClothingItemAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'color', 'occasion', 'rating', 'user')
-    list_filter = ('category', 'color', 'occasion', 'rating')
+class ClothingItemAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ('name', 'category', 'color', 'occasion_display', 'rating', 'image_status', 'user')
+    list_filter = ('category', 'color', OccasionListFilter, 'rating', 'image_status')
     search_fields = ('name', 'description')
     readonly_fields = ('created_at',)
 
+    @admin.display(description='Тип мероприятия')
+    def occasion_display(self, obj):
+        return obj.get_occasion_display()
+
 @admin.register(Outfit)
-class OutfitAdmin(admin.ModelAdmin):
-    list_display = ('name', 'occasion', 'rating', 'user', 'created_at')
-    list_filter = ('occasion', 'rating')
+class OutfitAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ('name', 'occasion_display', 'rating', 'user', 'created_at')
+    list_filter = (OccasionListFilter, 'rating')
     search_fields = ('name', 'description')
     filter_horizontal = ('items',)
     readonly_fields = ('created_at',)
 
+    @admin.display(description='Тип мероприятия')
+    def occasion_display(self, obj):
+        return obj.get_occasion_display()
+
 @admin.register(Compatibility)
 class CompatibilityAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'item1', 'item2', 'score', 'times_evaluated')
     list_filter = ('user',)
     search_fields = ('item1__name', 'item2__name')
-    ordering = ('-score',)
\ No newline at end of file
+    ordering = ('-score',)
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'item', 'status', 'attempts', 'available_at', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('item__name', 'last_error')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    raw_id_fields = ('item',)
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ('path', 'size', 'ref_count', 'phash', 'created_at')
+    search_fields = ('sha256', 'phash')
+    readonly_fields = ('sha256', 'path', 'size', 'phash', 'ref_count', 'renditions', 'created_at')
+
+@admin.register(GenerationEvent)
+class GenerationEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'item_ids', 'rating', 'created_at')
+    list_filter = ('rating', 'user')
+    readonly_fields = ('user', 'item_ids', 'categories', 'weights', 'rating', 'created_at')
@@ -1,229 +1,340 @@
-import pandas as pd
-import plotly.express as px
-from plotly.offline import plot
+from functools import cached_property
 
-from django.db.models import Count, Avg, Sum, Max, Min
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
 
+from .cache_utils import versioned_cache_key
 
-def get_basic_statistics(user, ClothingItem, Outfit):
-    """Базовая статистика гардероба"""
-    items = ClothingItem.objects.filter(user=user)
-    
-    total_items = items.count()
-    total_outfits = Outfit.objects.filter(user=user).count()
-    avg_rating = items.aggregate(avg=Avg('rating'))['avg'] or 0
-    
+
+ANALYTICS_CACHE_TIMEOUT = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+# Палитра Pastel из plotly.express.colors.qualitative
+PASTEL_COLORS = [
+    'rgb(102, 197, 204)', 'rgb(246, 207, 113)', 'rgb(248, 156, 116)',
+    'rgb(220, 176, 242)', 'rgb(135, 197, 95)', 'rgb(158, 185, 243)',
+    'rgb(254, 136, 177)', 'rgb(201, 219, 116)', 'rgb(139, 224, 164)',
+    'rgb(180, 151, 231)', 'rgb(179, 179, 179)',
+]
+
+
+def pie_chart_spec(rows, title):
+    """Круговая диаграмма по строкам (подпись, значение)"""
     return {
-        'total_items': total_items,
-        'total_outfits': total_outfits,
-        'avg_rating': round(avg_rating, 1),
+        'data': [{
+            'type': 'pie',
+            'labels': [label for label, value in rows],
+            'values': [value for label, value in rows],
+            'textposition': 'inside',
+            'textinfo': 'percent+label',
+            'marker': {'line': {'color': 'white', 'width': 1}},
+        }],
+        'layout': {
+            'title': {'text': title},
+            'piecolorway': PASTEL_COLORS,
+        },
     }
 
-def get_financial_statistics(user, ClothingItem):
-    """Финансовая аналитика"""
-    items = ClothingItem.objects.filter(user=user)
-    
-    # Стоимость всего гардероба
-    price_stats = items.filter(price__isnull=False).aggregate(
-        total=Sum('price'),
-        avg=Avg('price'),
-        max=Max('price'),
-        min=Min('price')
-    )
-    
-    total_price = price_stats['total'] or 0
-    avg_price = price_stats['avg'] or 0
-    
-    # Самая дорогая вещь (топ 3)
-    most_expensive_items = items.filter(price__isnull=False).order_by('-price')[:3]
-    
-    # Самая дешевая вещь (топ 3)
-    cheapest_items = items.filter(price__isnull=False).order_by('price')[:3]
-    
-    # Распределение бюджета по категориям
-    category_budget = {}
-    for category_code, category_name in ClothingItem.CATEGORY_CHOICES:
-        category_items = items.filter(category=category_code, price__isnull=False)
-        category_total = category_items.aggregate(total=Sum('price'))['total'] or 0
-        if category_total > 0:
-            category_budget[category_name] = {
-                'total': category_total,
-                'percent': round((category_total / total_price) * 100, 1) if total_price > 0 else 0,
-                'count': category_items.count()
-            }
-    
+
+def bar_chart_spec(rows, title, x_title, y_title):
+    """Столбчатая диаграмма по строкам (подпись, значение), столбец на строку"""
     return {
-        'total_price': total_price,
-        'avg_price': round(avg_price, 2) if avg_price else 0,
-        'most_expensive_items': most_expensive_items,
-        'cheapest_items': cheapest_items,
-        'category_budget': category_budget,
+        'data': [
+            {
+                'type': 'bar',
+                'name': label,
+                'x': [label],
+                'y': [value],
+                'marker': {'color': PASTEL_COLORS[i % len(PASTEL_COLORS)]},
+            }
+            for i, (label, value) in enumerate(rows)
+        ],
+        'layout': {
+            'title': {'text': title},
+            'xaxis': {'title': {'text': x_title}},
+            'yaxis': {'title': {'text': y_title}},
+            'barmode': 'relative',
+        },
     }
 
+
+class AnalyticsSnapshot:
+    """Снимок гардероба пользователя для аналитики
+
+    Вещи (вместе с количеством образов) загружаются одним запросом,
+    вся статистика считается в памяти.
+    """
+
+    def __init__(self, user, ClothingItem, Outfit):
+        self.user = user
+        self.ClothingItem = ClothingItem
+        self.Outfit = Outfit
+        self.items = list(
+            ClothingItem.objects.filter(user=user).annotate(
+                outfit_count=Count('outfit', filter=Q(outfit__user=user))
+            )
+        )
+
+        # Группировки по категории, цвету, сезону и цене
+        self.by_category = {code: [] for code, name in ClothingItem.CATEGORY_CHOICES}
+        self.by_color = {}
+        self.by_season = {code: [] for code, name in ClothingItem.SEASON_CHOICES}
+        self.priced_items = []
+
+        season_field = ClothingItem._meta.get_field('season')
+        for item in self.items:
+            self.by_category.setdefault(item.category, []).append(item)
+            self.by_color.setdefault(item.color, []).append(item)
+            for season in season_field.value_from_object(item):
+                self.by_season[season].append(item)
+            if item.price is not None:
+                self.priced_items.append(item)
+
+    @property
+    def total_items(self):
+        return len(self.items)
+
+    @cached_property
+    def total_outfits(self):
+        return self.Outfit.objects.filter(user=self.user).count()
+
+    def basic_statistics(self):
+        """Базовая статистика гардероба"""
+        avg_rating = sum(item.rating for item in self.items) / self.total_items if self.items else 0
+
+        return {
+            'total_items': self.total_items,
+            'total_outfits': self.total_outfits,
+            'avg_rating': round(avg_rating, 1),
+        }
+
+    def financial_statistics(self):
+        """Финансовая аналитика"""
+        prices = [item.price for item in self.priced_items]
+
+        # Стоимость всего гардероба
+        total_price = sum(prices) if prices else 0
+        avg_price = total_price / len(prices) if prices else 0
+
+        by_price = sorted(self.priced_items, key=lambda item: item.price)
+
+        # Распределение бюджета по категориям
+        category_budget = {}
+        for category_code, category_name in self.ClothingItem.CATEGORY_CHOICES:
+            category_items = [item for item in self.by_category[category_code] if item.price is not None]
+            category_total = sum(item.price for item in category_items)
+            if category_total > 0:
+                category_budget[category_name] = {
+                    'total': category_total,
+                    'percent': round((category_total / total_price) * 100, 1) if total_price > 0 else 0,
+                    'count': len(category_items)
+                }
+
+        return {
+            'total_price': total_price,
+            'avg_price': round(avg_price, 2) if avg_price else 0,
+            # Самые дорогие и самые дешевые вещи (топ 3)
+            'most_expensive_items': by_price[::-1][:3],
+            'cheapest_items': by_price[:3],
+            'category_budget': category_budget,
+        }
+
+    def usage_statistics(self):
+        """Статистика использования вещей"""
+        popular_items_data = [
+            {'item': item, 'outfit_count': item.outfit_count}
+            for item in self.items
+            if item.outfit_count > 0
+        ]
+        unused_items = [item for item in self.items if item.outfit_count == 0]
+
+        # Самые популярные вещи (входят в больше всего образов)
+        popular_items = sorted(popular_items_data, key=lambda x: x['outfit_count'], reverse=True)[:3]
+
+        # Коэффициент использования
+        used_items_count = len(popular_items_data)
+        usage_percentage = round((used_items_count / self.total_items) * 100, 1) if self.total_items > 0 else 0
+
+        return {
+            'popular_items': popular_items,
+            # Неиспользуемые вещи (ни в одном образе)
+            'unused_items': unused_items[:3],
+            'unused_items_count': len(unused_items),
+            'usage_percentage': usage_percentage,
+        }
+
+    @cached_property
+    def season_statistics(self):
+        """Сезонная статистика"""
+        season_stats = {}
+        for season_code, season_name in self.ClothingItem.SEASON_CHOICES:
+            season_count = len(self.by_season[season_code])
+            season_stats[season_name] = {
+                'count': season_count,
+                'percent': round((season_count / self.total_items) * 100, 1) if self.total_items > 0 else 0
+            }
+
+        return season_stats
+
+    def recommendations(self):
+        """Генерация рекомендаций для пользователя"""
+        total_items = self.total_items
+        recommendations = []
+
+        # Проверяем пробелы по категориям
+        category_counts = {}
+        for category_code, category_name in self.ClothingItem.CATEGORY_CHOICES:
+            count = len(self.by_category[category_code])
+            category_counts[category_name] = count
+
+            # Рекомендации по категориям
+            if count < 3 and total_items >= 10:
+                recommendations.append(f"Мало вещей категории '{category_name}' ({count} шт.)")
+
+        # Проверяем вещи без цены
+        items_without_price = total_items - len(self.priced_items)
+        if items_without_price > 0:
+            recommendations.append(f"У {items_without_price} вещей не указана цена")
+
+        # Проверяем неиспользуемые вещи
+        unused_items_count = self.usage_statistics()['unused_items_count']
+        if unused_items_count >= 3:
+            recommendations.append(f"У вас {unused_items_count}+ вещей не используются в образах")
+
+        # Проверяем сезонные пробелы
+        for season_name, stats in self.season_statistics.items():
+            if stats['percent'] < 15 and total_items >= 10:
+                recommendations.append(f"Мало вещей для сезона '{season_name}' ({stats['count']} шт.)")
+
+        return recommendations, category_counts
+
+    def charts_data(self):
+        """Генерация данных для графиков (спецификации фигур для plotly.js)"""
+
+        # 1. График распределения по цветам
+        color_mapping = dict(self.ClothingItem.COLOR_CHOICES)
+        color_rows = sorted(
+            ((color_mapping.get(color, color), len(items)) for color, items in self.by_color.items()),
+            key=lambda row: row[1],
+            reverse=True
+        )
+        color_chart = pie_chart_spec(color_rows, 'Распределение вещей по цветам') if color_rows else None
+
+        # 2. График распределения по категориям
+        category_mapping = dict(self.ClothingItem.CATEGORY_CHOICES)
+        category_rows = sorted(
+            ((category_mapping[category], len(items)) for category, items in self.by_category.items() if items),
+            key=lambda row: row[1],
+            reverse=True
+        )
+        category_chart = bar_chart_spec(
+            category_rows,
+            'Количество вещей по категориям',
+            x_title='Категория',
+            y_title='Количество вещей'
+        ) if category_rows else None
+
+        # 3. График бюджета по категориям
+        budget_rows = [
+            (category_mapping[category], float(sum(item.price for item in items if item.price is not None)))
+            for category, items in self.by_category.items()
+            if any(item.price is not None for item in items)
+        ]
+        budget_chart = None
+        if sum(total for name, total in budget_rows) > 0:
+            budget_chart = pie_chart_spec(budget_rows, 'Распределение бюджета по категориям')
+
+        return {
+            'color_chart': color_chart,
+            'category_chart': category_chart,
+            'budget_chart': budget_chart,
+        }
+
+    def as_context(self):
+        """Контекст страницы аналитики"""
+        basic_stats = self.basic_statistics()
+        financial_stats = self.financial_statistics()
+        usage_stats = self.usage_statistics()
+        recommendations, category_counts = self.recommendations()
+
+        return {
+            'has_items': True,
+
+            # Базовая статистика
+            'total_items': basic_stats['total_items'],
+            'total_outfits': basic_stats['total_outfits'],
+            'avg_rating': basic_stats['avg_rating'],
+
+            # Финансовая аналитика
+            'total_price': financial_stats['total_price'],
+            'avg_price': financial_stats['avg_price'],
+            'most_expensive_items': financial_stats['most_expensive_items'],
+            'cheapest_items': financial_stats['cheapest_items'],
+            'category_budget': financial_stats['category_budget'],
+
+            # Статистика использования
+            'popular_items': usage_stats['popular_items'],
+            'unused_items': usage_stats['unused_items'],
+            'usage_percentage': usage_stats['usage_percentage'],
+
+            # Сезонная аналитика
+            'season_stats': self.season_statistics,
+
+            # Рекомендации
+            'recommendations': recommendations,
+            'category_counts': category_counts,
+        }
+
+
+def get_basic_statistics(user, ClothingItem, Outfit):
+    """Базовая статистика гардероба"""
+    return AnalyticsSnapshot(user, ClothingItem, Outfit).basic_statistics()
+
+def get_financial_statistics(user, ClothingItem):
+    """Финансовая аналитика"""
+    return AnalyticsSnapshot(user, ClothingItem, None).financial_statistics()
+
 def get_usage_statistics(user, ClothingItem, Outfit):
     """Статистика использования вещей"""
-    items = ClothingItem.objects.filter(user=user)
-    
-    # Самые популярные вещи (входят в больше всего образов)
-    popular_items_data = []
-    for item in items:
-        outfit_count = Outfit.objects.filter(items=item, user=user).count()
-        if outfit_count > 0:
-            popular_items_data.append({
-                'item': item,
-                'outfit_count': outfit_count
-            })
-    popular_items = sorted(popular_items_data, key=lambda x: x['outfit_count'], reverse=True)[:3]
-    
-    # Неиспользуемые вещи (ни в одном образе)
-    unused_items = []
-    for item in items:
-        outfit_count = Outfit.objects.filter(items=item, user=user).count()
-        if outfit_count == 0:
-            unused_items.append(item)
-    unused_items = unused_items[:3]
-    
-    # Коэффициент использования
-    total_items = items.count()
-    used_items_count = sum(1 for item in items if Outfit.objects.filter(items=item, user=user).exists())
-    usage_percentage = round((used_items_count / total_items) * 100, 1) if total_items > 0 else 0
-    
-    return {
-        'popular_items': popular_items,
-        'unused_items': unused_items,
-        'usage_percentage': usage_percentage,
-    }
+    return AnalyticsSnapshot(user, ClothingItem, Outfit).usage_statistics()
 
 def get_season_statistics(user, ClothingItem):
     """Сезонная статистика"""
-    items = ClothingItem.objects.filter(user=user)
-    total_items = items.count()
-    
-    season_stats = {}
-    for season_code, season_name in ClothingItem.SEASON_CHOICES:
-        season_count = items.filter(season__contains=season_code).count()
-        season_stats[season_name] = {
-            'count': season_count,
-            'percent': round((season_count / total_items) * 100, 1) if total_items > 0 else 0
-        }
-    
-    return season_stats
+    return AnalyticsSnapshot(user, ClothingItem, None).season_statistics
 
 def get_recommendations_for_user(user, ClothingItem, Outfit):
     """Генерация рекомендаций для пользователя"""
-    items = ClothingItem.objects.filter(user=user)
-    total_items = items.count()
-    
-    recommendations = []
-    
-    # Проверяем пробелы по категориям
-    category_counts = {}
-    for category_code, category_name in ClothingItem.CATEGORY_CHOICES:
-        count = items.filter(category=category_code).count()
-        category_counts[category_name] = count
-        
-        # Рекомендации по категориям
-        if count < 3 and total_items >= 10:
-            recommendations.append(f"Мало вещей категории '{category_name}' ({count} шт.)")
-    
-    # Проверяем вещи без цены
-    items_without_price = items.filter(price__isnull=True).count()
-    if items_without_price > 0:
-        recommendations.append(f"У {items_without_price} вещей не указана цена")
-    
-    # Проверяем неиспользуемые вещи
-    unused_items_count = sum(1 for item in items if not Outfit.objects.filter(items=item, user=user).exists())
-    if unused_items_count >= 3:
-        recommendations.append(f"У вас {unused_items_count}+ вещей не используются в образах")
-    
-    # Проверяем сезонные пробелы
-    season_stats = get_season_statistics(user, ClothingItem)
-    for season_name, stats in season_stats.items():
-        if stats['percent'] < 15 and total_items >= 10:
-            recommendations.append(f"Мало вещей для сезона '{season_name}' ({stats['count']} шт.)")
-    
-    return recommendations, category_counts
+    return AnalyticsSnapshot(user, ClothingItem, Outfit).recommendations()
 
 def get_charts_data(user, ClothingItem):
     """Генерация данных для графиков"""
-    items = ClothingItem.objects.filter(user=user)
-    
-    # 1. График распределения по цветам
-    color_data = items.values('color').annotate(count=Count('id')).order_by('-count')
-    color_df = pd.DataFrame(list(color_data))
-    
-    if not color_df.empty:
-        color_mapping = dict(ClothingItem.COLOR_CHOICES)
-        color_df['color_rus'] = color_df['color'].map(color_mapping)
-        
-        color_fig = px.pie(
-            color_df, 
-            values='count', 
-            names='color_rus',
-            title='Распределение вещей по цветам',
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        color_fig.update_traces(
-            textposition='inside', 
-            textinfo='percent+label',
-            marker=dict(line=dict(color='white', width=1))
-        )
-        color_chart = plot(color_fig, output_type='div')
-    else:
-        color_chart = None
-    
-    # 2. График распределения по категориям
-    category_data = items.values('category').annotate(count=Count('id')).order_by('-count')
-    category_df = pd.DataFrame(list(category_data))
-    
-    if not category_df.empty:
-        category_mapping = dict(ClothingItem.CATEGORY_CHOICES)
-        category_df['category_rus'] = category_df['category'].map(category_mapping)
-        
-        category_fig = px.bar(
-            category_df,
-            x='category_rus',
-            y='count',
-            title='Количество вещей по категориям',
-            color='category_rus',
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        category_fig.update_layout(
-            xaxis_title='Категория',
-            yaxis_title='Количество вещей'
-        )
-        category_chart = plot(category_fig, output_type='div')
-    else:
-        category_chart = None
-    
-    # 3. График бюджета по категориям
-    budget_chart = None
-    category_price_data = list(items.filter(price__isnull=False)
-        .values('category')
-        .annotate(total_price=Sum('price'), count=Count('id')))
-    
-    if category_price_data:
-        budget_df = pd.DataFrame(category_price_data)
-        if not budget_df.empty and budget_df['total_price'].sum() > 0:
-            category_mapping = dict(ClothingItem.CATEGORY_CHOICES)
-            budget_df['category_name'] = budget_df['category'].map(category_mapping)
-            
-            budget_fig = px.pie(
-                budget_df,
-                values='total_price',
-                names='category_name',
-                title='Распределение бюджета по категориям',
-                color_discrete_sequence=px.colors.qualitative.Pastel
-            )
-            budget_fig.update_traces(
-                textposition='inside',
-                textinfo='percent+label',
-                marker=dict(line=dict(color='white', width=1))
-            )
-            budget_chart = plot(budget_fig, output_type='div')
-    
-    return {
-        'color_chart': color_chart,
-        'category_chart': category_chart,
-        'budget_chart': budget_chart,
-    }
\ No newline at end of file
+    return AnalyticsSnapshot(user, ClothingItem, None).charts_data()
+
+def get_analytics_context(user, ClothingItem, Outfit):
+    """Контекст страницы аналитики из кэша версии гардероба
+
+    Кэш сбрасывается сигналами при изменении вещей и образов пользователя.
+    Снимок для кэша читается из основной базы, а не из реплики.
+    """
+    key = versioned_cache_key('analytics', user.id)
+    context = cache.get(key)
+
+    if context is None:
+        snapshot = AnalyticsSnapshot(user, ClothingItem, Outfit)
+        context = snapshot.as_context() if snapshot.items else {'has_items': False}
+        cache.set(key, context, ANALYTICS_CACHE_TIMEOUT)
+
+    return context
+
+
+def get_charts_context(user, ClothingItem):
+    """Данные графиков из кэша версии гардероба"""
+    key = versioned_cache_key('analytics_charts', user.id)
+    charts = cache.get(key)
+
+    if charts is None:
+        charts = get_charts_data(user, ClothingItem)
+        cache.set(key, charts, ANALYTICS_CACHE_TIMEOUT)
+
+    return charts
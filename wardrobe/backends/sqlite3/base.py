@@ -0,0 +1,15 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в котором транзакции atomic() начинаются с BEGIN IMMEDIATE
+
+    Обычный BEGIN берет блокировку записи только на первой записи. Если в
+    это время пишет другой процесс, SQLite сразу возвращает "database is
+    locked", не дожидаясь busy_timeout: иначе две транзакции ждали бы
+    друг друга. BEGIN IMMEDIATE берет блокировку записи в начале
+    транзакции, и конкурирующие записи просто ждут своей очереди.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .fields import codes_to_mask, mask_to_codes
+from .models import ClothingItem
+
+
+# Индексов в памяти процесса не больше этого числа (вытесняются давно не нужные)
+ITEM_INDEX_MAX_USERS = getattr(settings, 'ITEM_INDEX_MAX_USERS', 1000)
+# Больше подходящих вещей фильтры выполняются в SQL, а не списком id__in
+ITEM_INDEX_MAX_IDS = getattr(settings, 'ITEM_INDEX_MAX_IDS', 5000)
+
+# Фильтры страницы гардероба, которые вычисляются по индексу
+INDEX_FILTER_FIELDS = (
+    'category', 'color', 'season', 'occasion', 'min_rating',
+    'date_from', 'date_to', 'price_min', 'price_max',
+)
+
+CATEGORY_CODES = [code for code, label in ClothingItem.CATEGORY_CHOICES]
+COLOR_CODES = [code for code, label in ClothingItem.COLOR_CHOICES]
+SEASON_CODES = [code for code, label in ClothingItem.SEASON_CHOICES]
+OCCASION_CODES = [code for code, label in ClothingItem.OCCASION_CHOICES]
+BITMASK_CODES = {'season': SEASON_CODES, 'occasion': OCCASION_CODES}
+RATINGS = range(1, 6)
+
+# Число единичных битов в каждом байте
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class ItemBitmapIndex:
+    """Битовые множества вещей одного пользователя
+
+    Вещи пронумерованы по порядку id; для каждого значения категории,
+    цвета, сезона, типа мероприятия и оценки хранится упакованный набор
+    битов (np.packbits) - бит i отмечает i-ю вещь. Сочетания фильтров
+    вычисляются побитовыми И/ИЛИ, дата и цена - сравнением столбцов.
+    """
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.size = len(rows)
+        ids, categories, colors, seasons, occasions, ratings, created, prices, updated = (
+            zip(*rows) if rows else ([],) * 9
+        )
+        # Отпечаток вещей, по которым построен индекс (см. wardrobe_fingerprint)
+        self.fingerprint = (self.size, max(ids, default=None), max(updated, default=None))
+        self.ids = np.array(ids, dtype=np.int64)
+        categories = np.array(categories, dtype=object)
+        colors = np.array(colors, dtype=object)
+        seasons = np.array(seasons, dtype=np.int64)
+        occasions = np.array(occasions, dtype=np.int64)
+        ratings = np.array(ratings, dtype=np.int64)
+
+        self.bitsets = {}
+        for code in CATEGORY_CODES:
+            self.bitsets['category', code] = np.packbits(categories == code)
+        for code in COLOR_CODES:
+            self.bitsets['color', code] = np.packbits(colors == code)
+        for bit, code in enumerate(SEASON_CODES):
+            self.bitsets['season', code] = np.packbits(seasons & (1 << bit) != 0)
+        for bit, code in enumerate(OCCASION_CODES):
+            self.bitsets['occasion', code] = np.packbits(occasions & (1 << bit) != 0)
+        for rating in RATINGS:
+            self.bitsets['rating', rating] = np.packbits(ratings == rating)
+        # Наборы общие для всех запросов: изменять их на месте нельзя
+        for bits in self.bitsets.values():
+            bits.flags.writeable = False
+
+        self.created_at = np.array([value.timestamp() for value in created], dtype=np.float64)
+        # Вещи без цены (nan) не проходят ни одно сравнение, как NULL в SQL
+        self.prices = np.array([np.nan if value is None else float(value) for value in prices], dtype=np.float64)
+
+    @classmethod
+    def build(cls, user_id, using='default'):
+        """Индекс по вещам пользователя из базы using, одним запросом"""
+        rows = (
+            ClothingItem.objects.using(using)
+            .filter(user_id=user_id)
+            .order_by('id')
+            .values_list(
+                'id', 'category', 'color', 'season', 'occasion', 'rating', 'created_at', 'price', 'updated_at',
+            )
+        )
+        return cls(rows)
+
+    def all(self):
+        return np.packbits(np.ones(self.size, dtype=bool))
+
+    def none(self):
+        return np.packbits(np.zeros(self.size, dtype=bool))
+
+    def bitset(self, field, value):
+        """Вещи с этим значением признака; неизвестное значение - пустое множество"""
+        bits = self.bitsets.get((field, value))
+        return self.none() if bits is None else bits
+
+    def any_of(self, field, values):
+        """Вещи хотя бы с одним из значений признака"""
+        bits = self.none()
+        for value in values:
+            bits |= self.bitset(field, value)
+        return bits
+
+    def has_all(self, field, codes):
+        """Вещи, у которых отмечены все коды (как lookup has); без известных кодов - никто"""
+        field_codes = BITMASK_CODES[field]
+        selected = mask_to_codes(codes_to_mask(codes, field_codes), field_codes)
+        if not selected:
+            return self.none()
+        bits = self.all()
+        for code in selected:
+            bits &= self.bitset(field, code)
+        return bits
+
+    def from_ids(self, ids):
+        """Битовое множество вещей с указанными id"""
+        return np.packbits(np.isin(self.ids, np.fromiter(ids, dtype=np.int64)))
+
+    def field_bits(self, field, value):
+        """Вещи, проходящие один фильтр страницы гардероба со значением value"""
+        if field in ('category', 'color'):
+            if isinstance(value, (list, tuple, set)):
+                return self.any_of(field, value)
+            return self.bitset(field, value)
+        if field in ('season', 'occasion'):
+            return self.has_all(field, value)
+        if field == 'min_rating':
+            return self.any_of('rating', range(int(value), 6))
+        if field in ('date_from', 'date_to'):
+            moment = to_datetime(value).timestamp()
+            selected = self.created_at >= moment if field == 'date_from' else self.created_at <= moment
+            return np.packbits(selected)
+        if field in ('price_min', 'price_max'):
+            price = float(ClothingItem._meta.get_field('price').to_python(value))
+            selected = self.prices >= price if field == 'price_min' else self.prices <= price
+            return np.packbits(selected)
+        raise KeyError(field)
+
+    def match(self, filters, exclude=None):
+        """Вещи, проходящие все заданные фильтры индекса, кроме поля exclude"""
+        bits = self.all()
+        for field in INDEX_FILTER_FIELDS:
+            if field != exclude and filters.get(field):
+                bits &= self.field_bits(field, filters[field])
+        return bits
+
+    def count(self, bits):
+        return int(POPCOUNT[bits].sum())
+
+    def to_ids(self, bits):
+        """id вещей множества по возрастанию"""
+        return self.ids[np.unpackbits(bits, count=self.size).astype(bool)].tolist()
+
+
+def to_datetime(value):
+    """Значение фильтра даты как его понимает created_at__gte: полночь по TIME_ZONE"""
+    moment = ClothingItem._meta.get_field('created_at').to_python(value)
+    if settings.USE_TZ and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.get_default_timezone())
+    return moment
+
+
+def has_index_filters(filters):
+    return any(filters.get(field) for field in INDEX_FILTER_FIELDS)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def wardrobe_fingerprint(user_id, using='default'):
+    """(число вещей, последний id, последнее изменение) пользователя в базе using
+
+    Добавление вещи меняет последний id, удаление - число вещей, изменение -
+    updated_at. Массовый .update() полей индекса должен обновлять и updated_at.
+    """
+    fingerprint = (
+        ClothingItem.objects.using(using)
+        .filter(user_id=user_id)
+        .aggregate(count=Count('id'), last_id=Max('id'), updated_at=Max('updated_at'))
+    )
+    return fingerprint['count'], fingerprint['last_id'], fingerprint['updated_at']
+
+
+def get_item_index(user_id, using=None):
+    """Индекс вещей пользователя из памяти процесса или заново построенный
+
+    Перед использованием индекс сверяется с отпечатком вещей в той же базе
+    (один запрос по индексу user_id, updated_at), поэтому изменения из
+    других процессов и новый снимок реплики замечаются сразу. База по
+    умолчанию выбирается роутером для чтения; для реплики индекс свой.
+    """
+    using = using or ClothingItem.objects.db
+    key = (using, user_id)
+    fingerprint = wardrobe_fingerprint(user_id, using)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached.fingerprint == fingerprint:
+            _indexes.move_to_end(key)
+            return cached
+
+    index = ItemBitmapIndex.build(user_id, using)
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > ITEM_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
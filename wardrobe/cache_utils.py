@@ -0,0 +1,52 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Кэши, которые видит только процесс, где они созданы
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def cache_is_process_local(alias='default'):
+    """Кэш не общий для процессов: версии и пулы из других процессов в нем не видны"""
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+def _wardrobe_version_key(user_id):
+    return f'wardrobe_version:{user_id}'
+
+
+def _new_wardrobe_version():
+    return uuid.uuid4().hex
+
+
+def get_wardrobe_version(user_id):
+    """Текущая версия гардероба пользователя
+
+    Версия - случайная строка, а не счетчик: она не совпадет ни с одной из
+    прежних и после вытеснения ключа из кэша.
+    """
+    return cache.get_or_set(_wardrobe_version_key(user_id), _new_wardrobe_version, None)
+
+
+def bump_wardrobe_version(user_id):
+    """Меняет версию гардероба после фиксации транзакции, делая устаревшими все кэши пользователя
+
+    До фиксации другой запрос еще читает прежние данные и сохранил бы их
+    под новой версией. Новая версия записывается одним cache.set, а не
+    incr: incr в FileBasedCache и DatabaseCache - это get и set, и два
+    одновременных увеличения дали бы одно значение. Из двух одновременных
+    set остается любое, но оба значения новые.
+    """
+    key = _wardrobe_version_key(user_id)
+    transaction.on_commit(lambda: cache.set(key, _new_wardrobe_version(), None))
+
+
+def versioned_cache_key(prefix, user_id):
+    """Ключ кэша, привязанный к версии гардероба пользователя"""
+    return f'{prefix}:{user_id}:{get_wardrobe_version(user_id)}'
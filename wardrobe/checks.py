@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from .cache_utils import cache_is_process_local
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Версии гардероба и пулы образов должны быть видны всем процессам"""
+    if getattr(settings, 'TESTING', False) or not cache_is_process_local():
+        return []
+    return [Warning(
+        'Кэш по умолчанию виден только одному процессу',
+        hint=(
+            'Изменения из других воркеров и run_image_worker не сбросят кэши аналитики '
+            'и версии гардероба, а пулы warm_outfit_pools не попадут в веб-процессы. '
+            'Укажите CACHE_BACKEND=file, db или redis.'
+        ),
+        id='wardrobe.W001',
+    )]
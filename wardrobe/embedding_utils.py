@@ -0,0 +1,135 @@
+import random
+from itertools import groupby
+
+import numpy as np
+from django.conf import settings
+
+from .models import ClothingItem, GenerationEvent, ItemEmbedding
+
+
+EMBEDDING_DIM = getattr(settings, 'ITEM_EMBEDDING_DIM', 16)
+EMBEDDING_LEARNING_RATE = getattr(settings, 'ITEM_EMBEDDING_LEARNING_RATE', 0.05)
+EMBEDDING_REGULARIZATION = getattr(settings, 'ITEM_EMBEDDING_REGULARIZATION', 0.01)
+# Шагов SGD по образу сразу после оценки
+EMBEDDING_ONLINE_STEPS = getattr(settings, 'ITEM_EMBEDDING_ONLINE_STEPS', 3)
+
+
+def rating_target(rating):
+    """Целевая совместимость пар образа: 1 звезда - -1, 3 - 0, 5 - 1"""
+    return (rating - 3) / 2
+
+
+def initial_vector(item_id, dim=EMBEDDING_DIM):
+    """Начальный вектор вещи: небольшой случайный, одинаковый при каждом запуске"""
+    return np.random.default_rng(item_id).normal(0, 0.1, dim).astype(np.float32)
+
+
+def initial_embeddings(item_ids, dim=EMBEDDING_DIM):
+    """Начальные векторы и нулевые смещения для списка вещей"""
+    vectors = np.array([initial_vector(item_id, dim) for item_id in item_ids], dtype=np.float32)
+    return vectors.reshape(len(item_ids), dim), np.zeros(len(item_ids), dtype=np.float32)
+
+
+def load_embeddings(item_ids, dim=EMBEDDING_DIM):
+    """Векторы и смещения вещей в порядке item_ids одним запросом
+
+    Вещи без сохраненного вектора (или с вектором другой размерности)
+    получают начальный вектор.
+    """
+    vectors, biases = initial_embeddings(item_ids, dim)
+    positions = {item_id: position for position, item_id in enumerate(item_ids)}
+    stored = ItemEmbedding.objects.filter(item_id__in=item_ids).values_list('item_id', 'vector', 'bias')
+    for item_id, vector, bias in stored:
+        vector = np.frombuffer(vector, dtype=np.float32)
+        if len(vector) == dim:
+            vectors[positions[item_id]] = vector
+            biases[positions[item_id]] = bias
+    return vectors, biases
+
+
+def save_embeddings(item_ids, vectors, biases):
+    """Сохраняет векторы вещей одним запросом (вставка или обновление)"""
+    ItemEmbedding.objects.bulk_create(
+        [
+            ItemEmbedding(item_id=item_id, vector=vector.astype(np.float32).tobytes(), bias=float(bias))
+            for item_id, vector, bias in zip(item_ids, vectors, biases)
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['item'],
+        update_fields=['vector', 'bias', 'updated_at'],
+    )
+
+
+def sgd_step(vectors, biases, target,
+             learning_rate=EMBEDDING_LEARNING_RATE, regularization=EMBEDDING_REGULARIZATION):
+    """Шаг SGD по всем парам одного образа; vectors и biases меняются на месте
+
+    Прогноз пары (i, j): vectors[i] @ vectors[j] + biases[i] + biases[j],
+    ошибка считается относительно target для всех пар образа сразу.
+    """
+    errors = target - (vectors @ vectors.T + biases[:, None] + biases[None, :])
+    np.fill_diagonal(errors, 0)
+
+    vectors += learning_rate * (errors @ vectors - regularization * vectors)
+    biases += learning_rate * (errors.sum(axis=1) - regularization * biases)
+    return vectors, biases
+
+
+def learn_outfit(vectors, biases, rating, steps=EMBEDDING_ONLINE_STEPS):
+    """steps шагов SGD по оценке одного образа; vectors и biases меняются на месте"""
+    target = rating_target(rating)
+    for _ in range(steps):
+        sgd_step(vectors, biases, target)
+    return vectors, biases
+
+
+def update_item_embeddings(items, rating, steps=EMBEDDING_ONLINE_STEPS):
+    """Дообучает векторы вещей образа на его оценке (после rate_outfit)"""
+    item_ids = sorted({item.id for item in items})
+    if len(item_ids) < 2:
+        return
+
+    vectors, biases = load_embeddings(item_ids)
+    learn_outfit(vectors, biases, rating, steps)
+    save_embeddings(item_ids, vectors, biases)
+
+
+def train_embeddings(user_id=None, epochs=20, dim=EMBEDDING_DIM, seed=None):
+    """Обучает векторы вещей с нуля по журналу оценок
+
+    Для каждого пользователя проходит все оцененные образы epochs раз в
+    случайном порядке. Возвращает (число пользователей, число вещей).
+    """
+    shuffle = random.Random(seed).shuffle
+    events = GenerationEvent.objects.filter(rating__isnull=False)
+    if user_id:
+        events = events.filter(user_id=user_id)
+    events = events.order_by('user_id', 'id').values_list('user_id', 'item_ids', 'rating')
+
+    users_count = 0
+    items_count = 0
+    for event_user_id, user_events in groupby(events.iterator(chunk_size=5000), key=lambda event: event[0]):
+        item_ids = list(ClothingItem.objects.filter(user_id=event_user_id).values_list('id', flat=True))
+        index = {item_id: position for position, item_id in enumerate(item_ids)}
+        outfits = []
+        for _, outfit_item_ids, rating in user_events:
+            positions = sorted({index[item_id] for item_id in outfit_item_ids if item_id in index})
+            if len(positions) >= 2:
+                outfits.append((np.array(positions), rating_target(rating)))
+        if not outfits:
+            continue
+
+        vectors, biases = initial_embeddings(item_ids, dim)
+        for _ in range(epochs):
+            shuffle(outfits)
+            for positions, target in outfits:
+                outfit_vectors, outfit_biases = sgd_step(vectors[positions], biases[positions], target)
+                vectors[positions] = outfit_vectors
+                biases[positions] = outfit_biases
+
+        save_embeddings(item_ids, vectors, biases)
+        users_count += 1
+        items_count += len(item_ids)
+
+    return users_count, items_count
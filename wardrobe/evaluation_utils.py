@@ -0,0 +1,79 @@
+import math
+from itertools import groupby
+
+from .models import ClothingItem, GenerationEvent
+from .generation_utils import OutfitEngine, get_learning_rule
+
+
+def rated_events(user_id=None, batch_size=5000):
+    """Оцененные события журнала по пользователям, в порядке появления"""
+    events = GenerationEvent.objects.filter(rating__isnull=False)
+    if user_id:
+        events = events.filter(user_id=user_id)
+    events = events.order_by('user_id', 'id').values_list('user_id', 'item_ids', 'weights', 'rating')
+    return events.iterator(chunk_size=batch_size)
+
+
+def evaluate_scorer(scorer, events, rule=None):
+    """Прогрессивная офлайн-оценка модели по журналу оценок
+
+    События каждого пользователя проигрываются по порядку: модель сначала
+    прогнозирует оценку образа и вероятность его выбора, потом учится на
+    настоящей оценке. Модель начинает с пустой совместимости (trained=False).
+
+    Возвращает метрики:
+      rmse - ошибка прогноза оценки;
+      ips, snips - оценка средней оценки образов, которые выбирала бы модель,
+        по обратным вероятностям (веса выбора из журнала);
+      logged_rating - средняя оценка в журнале для сравнения.
+
+    Кандидаты берутся из текущего гардероба, поэтому вещи, добавленные
+    после события, немного занижают вероятности модели.
+    """
+    rule = rule or get_learning_rule()
+    totals = {
+        'events': 0,
+        'skipped': 0,
+        'squared_error': 0.0,
+        'rating': 0.0,
+        'ips_events': 0,
+        'ips': 0.0,
+        'ips_weight': 0.0,
+    }
+
+    categories = [code for code, name in ClothingItem.CATEGORY_CHOICES]
+    for user_id, user_events in groupby(events, key=lambda event: event[0]):
+        items = ClothingItem.objects.filter(user_id=user_id, category__in=categories)
+        engine = OutfitEngine(items, [], categories, scorer, trained=False)
+
+        for _, item_ids, weights, rating in user_events:
+            positions = [engine.index.get(item_id) for item_id in item_ids]
+            if not positions or None in positions:
+                totals['skipped'] += 1
+                continue
+            positions.sort(key=lambda position: engine.category_index[position])
+
+            prediction = scorer.predict(engine, positions)
+            totals['events'] += 1
+            totals['squared_error'] += (prediction - rating) ** 2
+            totals['rating'] += rating
+
+            logged_probability = math.prod(weights) if weights and None not in weights else 0
+            if logged_probability > 0:
+                ratio = engine.outfit_probability(positions) / logged_probability
+                totals['ips_events'] += 1
+                totals['ips'] += ratio * rating
+                totals['ips_weight'] += ratio
+
+            engine.learn(positions, rating, rule)
+
+    events_count = totals['events']
+    return {
+        'events': events_count,
+        'skipped': totals['skipped'],
+        'rmse': math.sqrt(totals['squared_error'] / events_count) if events_count else None,
+        'logged_rating': totals['rating'] / events_count if events_count else None,
+        'ips_events': totals['ips_events'],
+        'ips': totals['ips'] / totals['ips_events'] if totals['ips_events'] else None,
+        'snips': totals['ips'] / totals['ips_weight'] if totals['ips_weight'] else None,
+    }
@@ -0,0 +1,86 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import GenerationEvent
+
+
+EVENT_BUFFER_SIZE = getattr(settings, 'GENERATION_EVENT_BUFFER_SIZE', 50)
+EVENT_FLUSH_INTERVAL = getattr(settings, 'GENERATION_EVENT_FLUSH_INTERVAL', 5)
+EVENT_FLUSH_TIMER = getattr(settings, 'GENERATION_EVENT_FLUSH_TIMER', True)
+
+
+class EventBuffer:
+    """Буфер событий генерации процесса, записываемый в базу пачками
+
+    События записываются одним bulk_create, когда их набирается size или
+    с прошлой записи прошло interval секунд, а также при завершении процесса.
+    С timer=True первое событие в пустом буфере запускает таймер на interval
+    секунд, и буфер записывается, даже если новых событий больше нет.
+    При аварийном завершении (SIGKILL) теряются события не старше interval.
+    """
+
+    def __init__(self, size=EVENT_BUFFER_SIZE, interval=EVENT_FLUSH_INTERVAL, timer=EVENT_FLUSH_TIMER):
+        self.size = size
+        self.interval = interval
+        self.events = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.use_timer = timer
+        self.timer = None
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+            due = len(self.events) >= self.size or time.monotonic() - self.last_flush >= self.interval
+            if not due and self.use_timer and self.timer is None:
+                self.timer = threading.Timer(self.interval, self._flush_on_timer)
+                self.timer.daemon = True
+                self.timer.start()
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events, self.events = self.events, []
+            self.last_flush = time.monotonic()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if events:
+            GenerationEvent.objects.bulk_create(events, batch_size=500)
+        return len(events)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
+
+
+def log_generation_event(user, outfit, rating=None):
+    """Добавляет образ ({'item_ids', 'categories', 'weights'}) в журнал генерации
+
+    Событие попадает в буфер только после фиксации транзакции, чтобы
+    отмененные оценки не оставались в журнале.
+    """
+    event = GenerationEvent(
+        user_id=user.id,
+        item_ids=outfit['item_ids'],
+        categories=outfit.get('categories', []),
+        weights=outfit.get('weights', []),
+        rating=rating,
+    )
+    transaction.on_commit(lambda: event_buffer.add(event))
+
+
+def flush_generation_events():
+    """Записывает накопленные события; возвращает их число"""
+    return event_buffer.flush()
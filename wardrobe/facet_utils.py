@@ -0,0 +1,131 @@
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .bitmap_utils import OCCASION_CODES, SEASON_CODES, get_item_index
+from .fields import codes_to_mask, mask_to_codes
+from .filter_utils import filter_clothing_items
+from .models import ClothingItem
+from .search_utils import search
+
+
+# Фильтры боковой панели, для вариантов которых показываются счетчики
+FACET_FIELDS = ('category', 'color', 'season', 'occasion', 'min_rating')
+
+RATING_FILTER_CHOICES = [
+    ('3', '3 ★ и выше'),
+    ('4', '4 ★ и выше'),
+    ('5', 'Только 5 ★'),
+]
+
+FACET_CHOICES = {
+    'category': ClothingItem.CATEGORY_CHOICES,
+    'color': ClothingItem.COLOR_CHOICES,
+    'season': ClothingItem.SEASON_CHOICES,
+    'occasion': ClothingItem.OCCASION_CHOICES,
+    'min_rating': RATING_FILTER_CHOICES,
+}
+
+RATING_THRESHOLDS = [int(code) for code, label in RATING_FILTER_CHOICES]
+
+
+def facet_values(category, color, season, occasion, rating):
+    """Варианты каждого фильтра, под которые подходит вещь с такими полями"""
+    return {
+        'category': [category],
+        'color': [color],
+        'season': mask_to_codes(season, SEASON_CODES),
+        'occasion': mask_to_codes(occasion, OCCASION_CODES),
+        'min_rating': [str(threshold) for threshold in RATING_THRESHOLDS if rating >= threshold],
+    }
+
+
+def facet_matchers(filters):
+    """Проверки выбранных фильтров панели - так же, как в filter_clothing_items"""
+    matchers = {}
+    if filters.get('category'):
+        matchers['category'] = lambda row, value=filters['category']: row[0] == value
+    if filters.get('color'):
+        matchers['color'] = lambda row, value=filters['color']: row[1] == value
+    if filters.get('season'):
+        mask = codes_to_mask(filters['season'], SEASON_CODES)
+        matchers['season'] = lambda row: bool(mask) and row[2] & mask == mask
+    if filters.get('occasion'):
+        mask = codes_to_mask(filters['occasion'], OCCASION_CODES)
+        matchers['occasion'] = lambda row: bool(mask) and row[3] & mask == mask
+    if filters.get('min_rating'):
+        matchers['min_rating'] = lambda row, value=int(filters['min_rating']): row[4] >= value
+    return matchers
+
+
+def facet_counts(items, filters, user_id=None):
+    """Счетчики вариантов фильтров панели: {поле: {вариант: число вещей}}
+
+    Счетчик варианта - сколько вещей останется, если выбрать его вместо
+    текущего значения этого же фильтра при остальных фильтрах без изменений.
+    С user_id счетчики считаются по битовому индексу вещей пользователя
+    (запрос к базе нужен только для поиска). Без него - по одному запросу:
+    вещи под фильтрами вне панели (поиск, дата, цена) группируются по
+    сочетаниям полей панели, а сочетаний немного, и дальше они разбираются
+    в Python.
+    """
+    if user_id is not None:
+        return index_facet_counts(items, filters, user_id)
+
+    other_filters = {field: value for field, value in filters.items() if field not in FACET_FIELDS}
+    rows = (
+        filter_clothing_items(items, other_filters)
+        .order_by()
+        .values_list('category', 'color', 'season', 'occasion', 'rating')
+        .annotate(count=Count('pk'))
+    )
+    matchers = facet_matchers(filters)
+
+    counts = {field: defaultdict(int) for field in FACET_FIELDS}
+    for row in rows:
+        failed = [field for field, matches in matchers.items() if not matches(row)]
+        # Вещь, не прошедшая два фильтра, не попадает ни в один счетчик
+        if len(failed) > 1:
+            continue
+        for field, values in facet_values(*row[:5]).items():
+            if failed and failed[0] != field:
+                continue
+            for value in values:
+                counts[field][value] += row[5]
+    return {field: dict(values) for field, values in counts.items()}
+
+
+def index_facet_counts(items, filters, user_id):
+    """Счетчики вариантов фильтров панели по битовому индексу"""
+    index = get_item_index(user_id, items.db)
+    found = index.all()
+    if filters.get('q'):
+        found = index.from_ids(search(items, filters['q'], user_id).values_list('id', flat=True))
+
+    counts = {}
+    for field, choices in FACET_CHOICES.items():
+        # Выбранное значение самого фильтра не учитывается
+        bits = index.match(filters, exclude=field) & found
+        counts[field] = {}
+        for value, label in choices:
+            count = index.count(bits & index.field_bits(field, value))
+            if count:
+                counts[field][value] = count
+    return counts
+
+
+def facet_options(counts, filters):
+    """Варианты фильтров панели для шаблона; пустые скрыты, кроме выбранного"""
+    options = {}
+    for field, choices in FACET_CHOICES.items():
+        options[field] = [
+            {
+                'value': value,
+                'label': label,
+                'count': counts[field].get(value, 0),
+                'selected': filters.get(field) == value,
+            }
+            for value, label in choices
+            if counts[field].get(value) or filters.get(field) == value
+        ]
+    return options
@@ -0,0 +1,127 @@
+from django import forms
+from django.db import models
+from django.db.models import Lookup
+from django.db.models.query_utils import DeferredAttribute
+
+
+def codes_to_mask(value, codes):
+    """Битовая маска из списка кодов или строки кодов через запятую"""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = value.split(',')
+
+    mask = 0
+    for code in value:
+        code = str(code).strip()
+        if code in codes:
+            mask |= 1 << codes.index(code)
+    return mask
+
+
+def mask_to_codes(mask, codes):
+    """Список кодов, отмеченных в битовой маске"""
+    return [code for bit, code in enumerate(codes) if mask & (1 << bit)]
+
+
+class BitmaskDescriptor(DeferredAttribute):
+    """Приводит присваиваемые коды (список или строку) к битовой маске"""
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = self.field.to_python(value)
+
+
+class MultipleChoiceBitmaskField(models.PositiveSmallIntegerField):
+    """Множественный выбор из фиксированного списка, хранимый битовой маской
+
+    Бит i соответствует i-му варианту из bit_choices, поэтому порядок
+    вариантов менять нельзя - только добавлять новые в конец.
+    """
+
+    descriptor_class = BitmaskDescriptor
+
+    def __init__(self, *args, bit_choices=(), **kwargs):
+        self.bit_choices = list(bit_choices)
+        self.codes = [code for code, label in self.bit_choices]
+        kwargs.setdefault('default', 0)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['bit_choices'] = self.bit_choices
+        if kwargs.get('default') == 0:
+            del kwargs['default']
+        return name, path, args, kwargs
+
+    def to_python(self, value):
+        if isinstance(value, (str, list, tuple, set)):
+            return codes_to_mask(value, self.codes)
+        return super().to_python(value)
+
+    def get_prep_value(self, value):
+        return super().get_prep_value(self.to_python(value))
+
+    def value_from_object(self, obj):
+        return mask_to_codes(getattr(obj, self.attname) or 0, self.codes)
+
+    def value_to_string(self, obj):
+        return str(getattr(obj, self.attname) or 0)
+
+    def formfield(self, **kwargs):
+        defaults = {
+            'form_class': forms.MultipleChoiceField,
+            'choices': self.bit_choices,
+            'widget': forms.CheckboxSelectMultiple,
+            'initial': [],
+        }
+        defaults.update(kwargs)
+        return models.Field.formfield(self, **defaults)
+
+    def masks_with(self, mask):
+        """Все значения маски, содержащие указанные биты"""
+        if not mask:
+            return []
+        return [value for value in range(1 << len(self.codes)) if value & mask == mask]
+
+
+@MultipleChoiceBitmaskField.register_lookup
+class HasChoicesLookup(Lookup):
+    """field__has='summer' - вещи, у которых отмечены все указанные коды
+
+    Разворачивается в равенство по списку подходящих масок (IN), чтобы
+    использовать индекс по полю вместо побитовой операции над каждой строкой.
+    Без известных кодов ничего не находит.
+    """
+
+    lookup_name = 'has'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        masks = self.lhs.output_field.masks_with(self.rhs)
+        if not masks:
+            return '1 = 0', []
+
+        placeholders = ', '.join(['%s'] * len(masks))
+        return f'{lhs} IN ({placeholders})', [*lhs_params, *masks]
+
+
+class FullTextField(models.TextField):
+    """Скрытый столбец виртуальной таблицы FTS5, названный как сама таблица
+
+    Условие MATCH по нему ищет по всем столбцам таблицы. Поле только для
+    запросов (lookup match), в базу через ORM не пишется.
+    """
+
+
+@FullTextField.register_lookup
+class FullTextMatch(Lookup):
+    """field__match='запрос' - полнотекстовый поиск FTS5 (только SQLite)"""
+
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
@@ -0,0 +1,135 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from .bitmap_utils import ITEM_INDEX_MAX_IDS, get_item_index, has_index_filters
+from .search_utils import search
+
+
+PAGE_SIZE = getattr(settings, 'WARDROBE_PAGE_SIZE', 24)
+
+ITEM_FILTER_FIELDS = (
+    'q', 'category', 'color', 'season', 'occasion', 'min_rating',
+    'date_from', 'date_to', 'price_min', 'price_max',
+)
+OUTFIT_FILTER_FIELDS = ('q', 'occasion', 'min_rating', 'date_from', 'date_to')
+
+
+def get_current_filters(params, fields):
+    """Значения фильтров из строки запроса"""
+    return {field: params.get(field, '') for field in fields}
+
+
+def filter_clothing_items(items, filters, user_id=None):
+    """Применяет фильтры страницы гардероба к набору вещей
+
+    С поиском (q) в SQLite вещи получают аннотацию search_rank, и
+    paginate_by_cursor упорядочивает их по релевантности. С user_id
+    остальные фильтры вычисляются по битовому индексу вещей пользователя
+    и сводятся к одному условию id__in, если подходящих вещей немного.
+    """
+    if filters.get('q'):
+        items = search(items, filters['q'], user_id)
+    if user_id is not None and has_index_filters(filters):
+        index = get_item_index(user_id, items.db)
+        bits = index.match(filters)
+        if index.count(bits) <= ITEM_INDEX_MAX_IDS:
+            return items.filter(id__in=index.to_ids(bits))
+    if filters.get('category'):
+        items = items.filter(category=filters['category'])
+    if filters.get('color'):
+        items = items.filter(color=filters['color'])
+    if filters.get('season'):
+        items = items.filter(season__has=filters['season'])
+    if filters.get('occasion'):
+        items = items.filter(occasion__has=filters['occasion'])
+    if filters.get('min_rating'):
+        items = items.filter(rating__gte=int(filters['min_rating']))
+    if filters.get('date_from'):
+        items = items.filter(created_at__gte=filters['date_from'])
+    if filters.get('date_to'):
+        items = items.filter(created_at__lte=filters['date_to'])
+    if filters.get('price_min'):
+        items = items.filter(price__gte=filters['price_min'])
+    if filters.get('price_max'):
+        items = items.filter(price__lte=filters['price_max'])
+    return items
+
+
+def filter_outfits(outfits, filters, user_id=None):
+    """Применяет фильтры страницы образов к набору образов"""
+    if filters.get('q'):
+        outfits = search(outfits, filters['q'], user_id)
+    if filters.get('occasion'):
+        outfits = outfits.filter(occasion__has=filters['occasion'])
+    if filters.get('min_rating'):
+        outfits = outfits.filter(rating__gte=int(filters['min_rating']))
+    if filters.get('date_from'):
+        outfits = outfits.filter(created_at__gte=filters['date_from'])
+    if filters.get('date_to'):
+        outfits = outfits.filter(created_at__lte=filters['date_to'])
+    return outfits
+
+
+def encode_cursor(obj):
+    """Курсор страницы: позиция последней показанной записи"""
+    if hasattr(obj, 'search_rank'):
+        raw = f'{obj.search_rank!r}|{obj.pk}'
+    else:
+        raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ranked=False):
+    """(created_at или search_rank, pk) из курсора или None, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        key, pk = raw.split('|')
+        return float(key) if ranked else datetime.fromisoformat(key), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def paginate_by_cursor(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Страница записей по ключу (created_at, id), от новых к старым
+
+    Вместо OFFSET следующая страница начинается сразу после последней
+    записи предыдущей, поэтому ее выборка идет по индексу
+    (user, -created_at) и не сдвигается при добавлении новых записей.
+    Результаты поиска (с аннотацией search_rank) идут по ключу
+    (search_rank, id) - от самых релевантных.
+    Возвращает (записи, курсор следующей страницы или None).
+    """
+    ranked = 'search_rank' in queryset.query.annotations
+    position = decode_cursor(cursor, ranked) if cursor else None
+
+    if ranked:
+        queryset = queryset.order_by('search_rank', 'pk')
+        if position:
+            rank, pk = position
+            queryset = queryset.filter(Q(search_rank__gt=rank) | Q(search_rank=rank, pk__gt=pk))
+    else:
+        queryset = queryset.order_by('-created_at', '-pk')
+        if position:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+
+    page = list(queryset[:page_size + 1])
+    if len(page) > page_size:
+        page = page[:page_size]
+        return page, encode_cursor(page[-1])
+    return page, None
+
+
+def next_page_query(params, next_cursor):
+    """Строка запроса следующей страницы с сохранением фильтров"""
+    if not next_cursor:
+        return ''
+    query = params.copy()
+    query['cursor'] = next_cursor
+    return query.urlencode()
@@ -1,124 +1,476 @@
 import random
+from itertools import combinations
+
+import numpy as np
 from django import forms
-from .models import ClothingItem, Compatibility
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.utils.module_loading import import_string
+from .models import ClothingItem, Compatibility, GenerationSession
 from .forms import GenerateOutfitForm, RateOutfitForm
+from .event_utils import log_generation_event
+from .bitmap_utils import ITEM_INDEX_MAX_IDS, get_item_index
+from .embedding_utils import initial_embeddings, learn_outfit, load_embeddings
+
+
+# Порядок категорий в образе
+CATEGORY_ORDER = {
+    'outer': 1,     # Верхняя одежда
+    'dress': 2,     # Костюм/Платье
+    'top': 3,       # Верх
+    'bottom': 4,    # Низ
+    'shoes': 5,     # Обувь
+    'accessory': 6  # Аксессуары
+}
+
+# Доля случайного выбора вещи (исследование) в эвристической модели
+EXPLORATION_RATE = 0.15
+
+
+def sort_categories(categories):
+    """Сортирует категории в порядке сборки образа"""
+    return sorted(categories, key=lambda x: CATEGORY_ORDER.get(x, 7))
+
+
+def rating_success(rating):
+    """Доля успеха пары по оценке образа: 1 звезда - 0, 5 звезд - 1"""
+    return (rating - 1) / 4
+
+
+class OutfitScorer:
+    """Модель оценки образов для OutfitEngine
+
+    Совместимость пары - число в [-1, 1]. pair_values возвращает значения,
+    по которым выбирается вещь при генерации (может быть случайной выборкой),
+    expected_pair_values - ожидаемые значения для лучевого поиска и прогноза.
+    rows и cols - массивы позиций вещей в движке, согласованные по форме.
+    prepare и learn позволяют модели держать свое состояние в движке.
+    """
+    
+    name = None
+    exploration_rate = 0.0
+    
+    def prepare(self, engine, trained=True):
+        """Загружает состояние модели для вещей движка (trained=False - с нуля)"""
+    
+    def learn(self, engine, positions, rating):
+        """Учитывает оценку образа в состоянии модели в движке"""
+    
+    def pair_values(self, engine, rows, cols):
+        return self.expected_pair_values(engine, rows, cols)
+    
+    def expected_pair_values(self, engine, rows, cols):
+        return engine.compatibility[rows, cols]
+    
+    def weights(self, engine, candidates, compatibility):
+        """Веса кандидатов по их средней совместимости с выбранными вещами"""
+        shape = (-1,) + (1,) * (compatibility.ndim - 1)
+        ratings = engine.ratings[candidates].reshape(shape)
+        times_shown = engine.times_shown[candidates].reshape(shape)
+        return (ratings + 1) * (compatibility + 2) / (times_shown + 1)
+    
+    def predict(self, engine, positions):
+        """Ожидаемая оценка образа от 1 до 5"""
+        positions = np.asarray(positions)
+        upper = np.triu_indices(len(positions), 1)
+        values = self.expected_pair_values(engine, positions[:, None], positions[None, :])[upper]
+        return float(np.clip(3 + 2 * values.mean(), 1, 5)) if values.size else 3.0
+
+
+class HeuristicScorer(OutfitScorer):
+    """Оценки совместимости из Compatibility.score и 15% случайного выбора"""
+    
+    name = 'heuristic'
+    exploration_rate = EXPLORATION_RATE
 
 
-def get_or_create_compatibility(user, item1, item2):
-    """Получает или создает запись о совместимости"""
+class BetaScorer(OutfitScorer):
+    """Модель с Beta(alpha + 1, beta + 1) на вероятность удачной пары"""
     
-    if item1.id > item2.id:
-        item1, item2 = item2, item1
+    def posterior_mean(self, engine, rows, cols):
+        alpha = engine.alpha[rows, cols]
+        return (alpha + 1) / (alpha + engine.beta[rows, cols] + 2)
     
-    compatibility, created = Compatibility.objects.get_or_create(
-        user=user,
-        item1=item1,
-        item2=item2,
-        defaults={'score': 0}
-    )
+    def expected_pair_values(self, engine, rows, cols):
+        return 2 * self.posterior_mean(engine, rows, cols) - 1
+
+
+class ThompsonScorer(BetaScorer):
+    """Сэмплирование Томпсона: совместимость каждой пары берется из апостериорного распределения
+
+    Мало оцененные пары получают разброс значений и сами обеспечивают
+    исследование, поэтому случайный выбор не нужен.
+    """
+    
+    name = 'thompson'
     
-    return compatibility.score
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+    
+    def pair_values(self, engine, rows, cols):
+        samples = self.rng.beta(engine.alpha[rows, cols] + 1, engine.beta[rows, cols] + 1)
+        return (2 * samples - 1).astype(np.float32)
+
+
+class UCBScorer(BetaScorer):
+    """Верхняя доверительная граница: к среднему добавляется бонус за малое число оценок"""
+    
+    name = 'ucb'
+    confidence = 1.0
+    
+    def pair_values(self, engine, rows, cols):
+        evaluations = engine.alpha[rows, cols] + engine.beta[rows, cols]
+        total = max(engine.evaluations, 1.0)
+        bonus = self.confidence * np.sqrt(2 * np.log(total + 1) / (evaluations + 1))
+        upper = np.minimum(self.posterior_mean(engine, rows, cols) + bonus, 1.0)
+        return 2 * upper - 1
+
+
+class EmbeddingScorer(OutfitScorer):
+    """Совместимость по векторам вещей (ItemEmbedding): оцениваются и неоцененные пары"""
+    
+    name = 'embedding'
+    exploration_rate = EXPLORATION_RATE
+    
+    def prepare(self, engine, trained=True):
+        item_ids = [item.id for item in engine.items]
+        load = load_embeddings if trained else initial_embeddings
+        engine.vectors, engine.biases = load(item_ids)
+        engine.embedding_scores = np.clip(
+            engine.vectors @ engine.vectors.T + engine.biases[:, None] + engine.biases[None, :], -1, 1
+        )
+    
+    def expected_pair_values(self, engine, rows, cols):
+        return engine.embedding_scores[rows, cols]
+    
+    def learn(self, engine, positions, rating):
+        # Столько же шагов, сколько делает update_item_embeddings после оценки
+        positions = np.array(sorted(set(positions)))
+        vectors, biases = learn_outfit(engine.vectors[positions], engine.biases[positions], rating)
+        engine.vectors[positions] = vectors
+        engine.biases[positions] = biases
+        
+        # Пересчитываются только строки и столбцы вещей образа
+        scores = np.clip(engine.vectors[positions] @ engine.vectors.T + biases[:, None] + engine.biases[None, :], -1, 1)
+        engine.embedding_scores[positions] = scores
+        engine.embedding_scores[:, positions] = scores.T
+
+
+SCORERS = {
+    scorer.name: scorer
+    for scorer in (HeuristicScorer, ThompsonScorer, UCBScorer, EmbeddingScorer)
+}
+
+
+def get_scorer(name=None):
+    """Модель оценки образов по имени или пути к классу; по умолчанию из OUTFIT_SCORER"""
+    name = name or getattr(settings, 'OUTFIT_SCORER', 'heuristic')
+    scorer_class = SCORERS[name] if name in SCORERS else import_string(name)
+    return scorer_class()
+
+
+def uses_embeddings():
+    """Нужны ли векторы вещей выбранной модели оценки (иначе их не дообучают)"""
+    return isinstance(get_scorer(), EmbeddingScorer)
+
+
+class OutfitEngine:
+    """Векторизованный движок генерации образов
+
+    Загружает вещи пользователя и оценки их совместимости один раз и
+    оценивает кандидатов по отношению ко всем уже выбранным вещам.
+    Веса кандидатов считает модель оценки (OutfitScorer).
+    """
+
+    def __init__(self, items, pairs, categories, scorer=None, trained=True):
+        self.categories = sort_categories(categories)
+        self.items = list(items)
+        self.index = {item.id: position for position, item in enumerate(self.items)}
+        self.scorer = scorer or get_scorer()
+        
+        category_positions = {category: k for k, category in enumerate(self.categories)}
+        self.ratings = np.array([item.rating for item in self.items], dtype=np.float32)
+        self.times_shown = np.array([item.times_shown for item in self.items], dtype=np.float32)
+        self.category_index = np.array(
+            [category_positions.get(item.category, -1) for item in self.items],
+            dtype=np.int16,
+        )
+        self.candidates = [
+            np.flatnonzero(self.category_index == k) for k in range(len(self.categories))
+        ]
+        
+        shape = (len(self.items), len(self.items))
+        self.compatibility = np.zeros(shape, dtype=np.float32)
+        self.alpha = np.zeros(shape, dtype=np.float32)
+        self.beta = np.zeros(shape, dtype=np.float32)
+        # Сумма оценок всех пар (alpha + beta) для бонуса UCB, ведется в learn
+        self.evaluations = 0.0
+        for item1_id, item2_id, score, alpha, beta in pairs:
+            i = self.index.get(item1_id)
+            j = self.index.get(item2_id)
+            if i is None or j is None:
+                continue
+            self.compatibility[i, j] = self.compatibility[j, i] = score
+            self.alpha[i, j] = self.alpha[j, i] = alpha
+            self.beta[i, j] = self.beta[j, i] = beta
+            self.evaluations += alpha + beta
+        
+        self.scorer.prepare(self, trained)
+
+    @classmethod
+    def for_user(cls, user, categories, scorer=None, index=None):
+        """Загружает вещи и оценки совместимости пользователя двумя запросами
+
+        Кандидаты выбираются по битовому индексу вещей пользователя; index,
+        уже полученный в этом запросе, не сверяется с базой повторно.
+        """
+        # Пулы образов передают вместо пользователя его id
+        index = index or get_item_index(getattr(user, 'pk', user))
+        bits = index.any_of('category', categories)
+        items = ClothingItem.objects.filter(user=user)
+        if index.count(bits) <= ITEM_INDEX_MAX_IDS:
+            items = items.filter(id__in=index.to_ids(bits))
+        else:
+            items = items.filter(category__in=categories)
+        pairs = Compatibility.objects.filter(
+            user=user,
+            item1__category__in=categories,
+            item2__category__in=categories,
+        ).values_list('item1_id', 'item2_id', 'score', 'alpha', 'beta')
+        
+        return cls(items, pairs, categories, scorer)
+
+    def score(self, item1, item2):
+        """Оценка совместимости пары, отсутствующая пара считается равной 0"""
+        return float(self.compatibility[self.index[item1.id], self.index[item2.id]])
+
+    def candidate_weights(self, candidates, selected, sample=False):
+        """Веса кандидатов с учетом совместимости со всеми выбранными вещами
+
+        При sample=True совместимость берется из pair_values модели
+        (для сэмплирования Томпсона - случайная выборка).
+        """
+        if len(selected):
+            rows, cols = candidates[:, None], np.asarray(selected)[None, :]
+            if sample:
+                values = self.scorer.pair_values(self, rows, cols)
+            else:
+                values = self.scorer.expected_pair_values(self, rows, cols)
+            compatibility = values.mean(axis=1)
+        else:
+            compatibility = np.zeros(len(candidates), dtype=np.float32)
+        
+        return self.scorer.weights(self, candidates, compatibility)
+
+    def choice_probabilities(self, candidates, selected, sample=True):
+        """Вероятности выбора каждого кандидата при уже выбранных вещах
+
+        Первая вещь выбирается пропорционально рейтингу, следующие - по
+        весам модели с долей равномерного выбора exploration_rate.
+        """
+        uniform = np.full(len(candidates), 1 / len(candidates))
+        if not len(selected):
+            weights = self.ratings[candidates]
+            exploration_rate = 0.0
+        else:
+            weights = self.candidate_weights(candidates, selected, sample)
+            exploration_rate = self.scorer.exploration_rate
+        
+        total = weights.sum()
+        if total <= 0:
+            return uniform
+        return exploration_rate * uniform + (1 - exploration_rate) * weights / total
+
+    def outfit_probability(self, positions, sample=True):
+        """Вероятность, с которой generate собрал бы образ из этих позиций
+
+        Позиции должны идти в порядке категорий движка.
+        """
+        probability = 1.0
+        for k, position in enumerate(positions):
+            candidates = self.candidates[self.category_index[position]]
+            probabilities = self.choice_probabilities(candidates, positions[:k], sample)
+            probability *= float(probabilities[np.searchsorted(candidates, position)])
+        return probability
+
+    def generate(self):
+        """Случайный образ: вещи выбираются пропорционально весам
+
+        У каждой выбранной вещи выставляется selection_weight - вероятность,
+        с которой генератор ее выбрал (для журнала генерации).
+        """
+        if not len(self.candidates) or not len(self.candidates[0]):
+            return None
+        
+        selected = []
+        probabilities = {}
+        for candidates in self.candidates:
+            if not len(candidates):
+                continue
+            
+            weights = self.choice_probabilities(candidates, selected)
+            k = random.choices(range(len(candidates)), weights=weights.tolist())[0]
+            probabilities[candidates[k]] = float(weights[k])
+            selected.append(candidates[k])
+        
+        outfit = [self.items[position] for position in selected]
+        for position, item in zip(selected, outfit):
+            item.selection_weight = round(probabilities[position], 6)
+        return outfit
+
+    def learn(self, positions, rating, rule):
+        """Учитывает оценку образа в матрицах движка, как Compatibility в базе"""
+        success = rating_success(rating)
+        for i, j in combinations(sorted(set(positions)), 2):
+            score = rule.apply(float(self.compatibility[i, j]), rating)
+            self.compatibility[i, j] = self.compatibility[j, i] = score
+            self.alpha[i, j] = self.alpha[j, i] = self.alpha[i, j] + success
+            self.beta[i, j] = self.beta[j, i] = self.beta[i, j] + 1 - success
+            self.evaluations += 1
+        self.scorer.learn(self, positions, rating)
+
+    def top_outfits(self, count=5, beam_width=None):
+        """Лучшие образы по суммарному логарифму весов (лучевой поиск)
+
+        Возвращает до count пар (список вещей, оценка) по убыванию оценки.
+        Используются ожидаемые оценки совместимости модели.
+        """
+        beam_width = max(beam_width or count * 4, count)
+        beams = np.zeros((1, 0), dtype=np.intp)
+        beam_scores = np.zeros(1, dtype=np.float64)
+        
+        for candidates in self.candidates:
+            if not len(candidates):
+                continue
+            
+            if beams.shape[1]:
+                # (кандидаты, лучи, выбранные вещи) -> средняя совместимость
+                compatibility = self.scorer.expected_pair_values(
+                    self, candidates[:, None, None], beams[None, :, :]
+                ).mean(axis=2)
+            else:
+                compatibility = np.zeros((len(candidates), len(beams)), dtype=np.float32)
+            
+            weights = self.scorer.weights(self, candidates, compatibility)
+            totals = beam_scores[None, :] + np.log(np.maximum(weights, 1e-9))
+            
+            flat = totals.ravel()
+            keep = min(beam_width, flat.size)
+            best = np.argpartition(-flat, keep - 1)[:keep]
+            candidate_positions, beam_positions = np.unravel_index(best, totals.shape)
+            
+            beams = np.column_stack([beams[beam_positions], candidates[candidate_positions]])
+            beam_scores = flat[best]
+        
+        if not beams.shape[1]:
+            return []
+        
+        order = np.argsort(-beam_scores)[:count]
+        return [
+            ([self.items[position] for position in beams[k]], float(beam_scores[k]))
+            for k in order
+        ]
 
 
-def generate_outfit_algorithm(user, categories):
+def generate_outfit_algorithm(user, categories, index=None):
     """Алгоритм генерации образов"""
     
     if len(categories) < 2:
         return None
     
-    # Сортируем категории в правильном порядке
-    category_order = {
-        'outer': 1,     # Верхняя одежда
-        'dress': 2,     # Костюм/Платье
-        'top': 3,       # Верх
-        'bottom': 4,    # Низ
-        'shoes': 5,     # Обувь
-        'accessory': 6  # Аксессуары
-    }
-    
-    sorted_categories = sorted(categories, key=lambda x: category_order.get(x, 7))
-    selected_items = []
+    return OutfitEngine.for_user(user, categories, index=index).generate()
+
+
+def generate_top_outfits(user, categories, count=5, beam_width=None, index=None):
+    """Лучшие образы для выбранных категорий за один вызов"""
     
-    first_category = sorted_categories[0]
-    first_items = ClothingItem.objects.filter(user=user, category=first_category)
+    if len(categories) < 2:
+        return []
     
-    if not first_items.exists():
-        return None
+    outfits = OutfitEngine.for_user(user, categories, index=index).top_outfits(count, beam_width)
+    return [items for items, score in outfits]
+
+class LinearRule:
+    """Сдвиг оценки на step за каждую звезду выше или ниже 3, в пределах [-1, 1]"""
     
-    total_rating = sum(item.rating for item in first_items)
-    if total_rating == 0:
-        total_rating = len(first_items) * 3
+    def __init__(self, step=0.1):
+        self.step = step
     
-    probabilities = [item.rating / total_rating for item in first_items]
+    def apply(self, score, rating):
+        return max(-1.0, min(1.0, score + (rating - 3) * self.step))
     
-    try:
-        first_item = random.choices(first_items, weights=probabilities)[0]
-    except:
-        first_item = random.choice(first_items)
+    def expression(self, rating):
+        return Greatest(Value(-1.0), Least(Value(1.0), F('score') + (rating - 3) * self.step))
+
+
+class MovingAverageRule:
+    """Экспоненциальное среднее: оценка стремится к (rating - 3) / 2 с долей step"""
     
-    selected_items.append(first_item)
+    def __init__(self, step=0.1):
+        self.step = step
     
-    for category in sorted_categories[1:]:
-        current_items = ClothingItem.objects.filter(user=user, category=category)
-        
-        if not current_items.exists():
-            continue
-        
-        last_item = selected_items[-1]
-        weights = []
-        
-        for candidate in current_items:
-            compatibility = get_or_create_compatibility(user, last_item, candidate)
-            weight = (candidate.rating + 1) * (compatibility + 2) / (candidate.times_shown + 1)
-            weights.append(weight)
-        
-        if random.random() < 0.15 or sum(weights) == 0:
-            selected_item = random.choice(current_items)
-        else:
-            total_weight = sum(weights)
-            normalized_weights = [w / total_weight for w in weights]
-            selected_item = random.choices(current_items, weights=normalized_weights)[0]
-        
-        selected_items.append(selected_item)
+    def apply(self, score, rating):
+        return score + self.step * ((rating - 3) / 2 - score)
     
-    return selected_items
+    def expression(self, rating):
+        return F('score') * (1 - self.step) + Value(self.step * (rating - 3) / 2)
+
+
+LEARNING_RULES = {
+    'linear': LinearRule,
+    'ema': MovingAverageRule,
+}
+
+
+def get_learning_rule(name=None, step=None):
+    """Правило обучения совместимости; по умолчанию из настроек"""
+    name = name or getattr(settings, 'COMPATIBILITY_LEARNING_RULE', 'linear')
+    step = step if step is not None else getattr(settings, 'COMPATIBILITY_LEARNING_STEP', 0.1)
+    return LEARNING_RULES[name](step)
+
 
 def update_compatibility_scores(user, items, rating):
     """Обновляет оценки совместимости на основе рейтинга образа"""
     
-    items_list = list(items)
+    item_ids = sorted({item.id for item in items})
+    if len(item_ids) < 2:
+        return
     
-    for i in range(len(items_list) - 1):
-        for j in range(i + 1, len(items_list)):
-            item1 = items_list[i]
-            item2 = items_list[j]
-            
-            if item1.id > item2.id:
-                item1, item2 = item2, item1
-            
-            compat_tuple = Compatibility.objects.get_or_create(
-                user=user,
-                item1=item1,
-                item2=item2,
-                defaults={'score': 0.0, 'times_evaluated': 0}
-            )
-            
-            compat = compat_tuple[0]
-            
-            rating_delta = (rating - 3) * 0.1
-
-            new_score = compat.score + rating_delta
-            new_score = max(-1.0, min(1.0, new_score))
-            
-            compat.score = new_score
-            compat.times_evaluated += 1
-            compat.save()
+    rule = get_learning_rule()
+    success = rating_success(rating)
+    
+    with transaction.atomic():
+        # Все пары образа: item1_id < item2_id, обе вещи из образа
+        pairs = Compatibility.objects.filter(
+            user=user,
+            item1_id__in=item_ids,
+            item2_id__in=item_ids,
+        )
+        
+        existing_pairs = set(pairs.values_list('item1_id', 'item2_id'))
+        missing = [
+            Compatibility(user=user, item1_id=item1_id, item2_id=item2_id, score=0.0, times_evaluated=0)
+            for item1_id, item2_id in combinations(item_ids, 2)
+            if (item1_id, item2_id) not in existing_pairs
+        ]
+        if missing:
+            Compatibility.objects.bulk_create(missing)
+        
+        pairs.update(
+            score=rule.expression(rating),
+            times_evaluated=F('times_evaluated') + 1,
+            alpha=F('alpha') + success,
+            beta=F('beta') + (1 - success),
+        )
 
-def get_recommendations(user):
+def get_recommendations(user, index=None):
     """Генерирует рекомендации для пользователя"""
     
     recommendations = []
-    total_items = ClothingItem.objects.filter(user=user).count()
+    index = index or get_item_index(user.id)
+    total_items = index.size
     
     if total_items < 5:
         recommendations.append(f"Добавьте больше вещей в гардероб (сейчас {total_items})")
@@ -127,7 +479,7 @@ def get_recommendations(user):
     
     categories = ClothingItem.CATEGORY_CHOICES
     for category_code, category_name in categories:
-        count = ClothingItem.objects.filter(user=user, category=category_code).count()
+        count = index.count(index.bitset('category', category_code))
         if count == 0:
             recommendations.append(f"Добавьте вещи категории '{category_name}'")
         elif count < 2 and total_items >= 10:
@@ -139,23 +491,14 @@ def get_recommendations(user):
     
     return recommendations
 
-def get_categories_with_items(user, categories):
+def get_categories_with_items(user, categories, index=None):
     """Проверяет, есть ли вещи в выбранных категориях и возвращает только категории с вещами"""
-    categories_with_items = []
-    
-    for category in categories:
-        count = ClothingItem.objects.filter(
-            user=user, 
-            category=category
-        ).count()
-        if count > 0:
-            categories_with_items.append(category)
-    
-    return categories_with_items
+    index = index or get_item_index(user.id)
+    return [category for category in categories if index.count(index.bitset('category', category))]
 
-def validate_categories_for_generation(user, categories, min_categories=2):
+def validate_categories_for_generation(user, categories, min_categories=2, index=None):
     """Проверяет, достаточно ли категорий с вещами для генерации"""
-    categories_with_items = get_categories_with_items(user, categories)
+    categories_with_items = get_categories_with_items(user, categories, index)
     
     if len(categories_with_items) < min_categories:
         return None, categories_with_items
@@ -163,37 +506,66 @@ def validate_categories_for_generation(user, categories, min_categories=2):
     return categories_with_items, categories_with_items
 
 def generate_and_save_outfit(request, categories):
-    """Основная логика генерации и сохранения образа в сессии"""
+    """Основная логика генерации и сохранения образа в состоянии генератора"""
     user = request.user
-    valid_categories, _ = validate_categories_for_generation(user, categories)
+    index = get_request_item_index(request)
+    valid_categories, _ = validate_categories_for_generation(user, categories, index=index)
     
     if not valid_categories:
         return None, "В выбранных категориях недостаточно вещей"
     
-    generated_items = generate_outfit_algorithm(user, valid_categories)
+    generated_items = generate_outfit_algorithm(user, valid_categories, index)
     
     if not generated_items:
         return None, "Не удалось создать образ"
     
-    request.session['generated_outfit'] = {
-        'item_ids': [item.id for item in generated_items],
-        'categories': valid_categories
-    }
-    
-    request.session.pop('outfit_rated', None)
-    request.session.pop('last_rating', None)
+    save_generated_outfit(request, generated_items, valid_categories)
     
     return generated_items, None
 
 
+def get_generation_session(request):
+    """Состояние генератора пользователя, загружается один раз за запрос"""
+    if not hasattr(request, '_generation_session'):
+        request._generation_session = (
+            GenerationSession.objects.filter(user=request.user).first()
+            or GenerationSession(user=request.user)
+        )
+    return request._generation_session
+
+
+def get_request_item_index(request):
+    """Индекс вещей пользователя, сверяется с базой один раз за запрос"""
+    if not hasattr(request, '_item_index'):
+        request._item_index = get_item_index(request.user.id)
+    return request._item_index
+
+
+def save_generated_outfit(request, generated_items, categories):
+    """Делает сгенерированный образ текущим, прежний уходит в историю"""
+    generation_session = get_generation_session(request)
+    generation_session.set_outfit(generated_items, categories)
+    generation_session.save()
+    log_generation_event(request.user, generation_session.current)
+
+
+def load_outfits(user, outfits):
+    """Вещи для списка образов ({'item_ids': [...]}) одним запросом, в порядке образов"""
+    item_ids = {item_id for outfit in outfits for item_id in outfit['item_ids']}
+    items_by_id = ClothingItem.objects.filter(user=user).in_bulk(item_ids)
+    return [
+        [items_by_id[item_id] for item_id in outfit['item_ids'] if item_id in items_by_id]
+        for outfit in outfits
+    ]
+
+
 def prepare_generation_context(request, form=None, generated_items=None, error_message=None):
     """Подготавливает контекст для рендеринга страницы генерации"""
     user = request.user
-    recommendations = get_recommendations(user)
-    has_generated_outfit = 'generated_outfit' in request.session
-    outfit_rated = request.session.get('outfit_rated', False)
-    last_rating = request.session.get('last_rating', None)
-    saved_categories = request.session.get('selected_categories', [])
+    recommendations = get_recommendations(user, get_request_item_index(request))
+    generation_session = get_generation_session(request)
+    has_generated_outfit = generation_session.current is not None
+    saved_categories = generation_session.categories
     
     if form is None:
         if saved_categories:
@@ -202,13 +574,22 @@ def prepare_generation_context(request, form=None, generated_items=None, error_m
             form = GenerateOutfitForm()
     
     rating_form = None
-    if has_generated_outfit and not outfit_rated:
+    if has_generated_outfit and not generation_session.rated:
         rating_form = RateOutfitForm()
     
+    # Текущий образ и история загружаются вместе
+    outfits = list(generation_session.history)
+    if generated_items is None and has_generated_outfit:
+        outfits.insert(0, generation_session.current)
+    outfits_items = load_outfits(user, outfits)
     if generated_items is None and has_generated_outfit:
-        outfit_data = request.session['generated_outfit']
-        item_ids = outfit_data['item_ids']
-        generated_items = ClothingItem.objects.filter(id__in=item_ids, user=user)
+        generated_items = outfits_items.pop(0)
+    
+    history = [
+        {'items': items, 'rating': outfit.get('rating')}
+        for outfit, items in zip(generation_session.history, outfits_items)
+        if items
+    ]
     
     context = {
         'form': form,
@@ -216,9 +597,10 @@ def prepare_generation_context(request, form=None, generated_items=None, error_m
         'generated': generated_items is not None,
         'generated_items': generated_items,
         'recommendations': recommendations,
-        'outfit_rated': outfit_rated,
-        'last_rating': last_rating,
-        'actual_categories': request.session.get('selected_categories', []),
+        'outfit_rated': generation_session.rated,
+        'last_rating': generation_session.last_rating,
+        'actual_categories': saved_categories,
+        'history': history,
     }
     
     return context
\ No newline at end of file
@@ -0,0 +1,267 @@
+import hashlib
+import io
+import os
+import uuid
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+
+from .models import ImageBlob, RenditionFile
+from .cache_utils import bump_wardrobe_version
+from .storage import INCOMING_DIR, content_hash, get_image_storage, is_incoming
+
+
+# Уменьшенные копии фото: название -> наибольшая сторона в пикселях
+RENDITION_SIZES = {
+    'grid': 220,    # плитка в сетке образа
+    'card': 440,    # карточка вещи
+    'modal': 900,   # модальное окно
+}
+
+RENDITION_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+RENDITIONS_DIR = 'clothing/renditions'
+
+
+def open_upright(file):
+    """Открывает фото, поворачивает по EXIF и приводит к RGB"""
+    image = Image.open(file)
+    # Для JPEG декодируем сразу в уменьшенном масштабе - телефонные фото
+    # в 4000px не нужно разворачивать целиком ради копии в 900px
+    image.draft('RGB', (max(RENDITION_SIZES.values()),) * 2)
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_renditions(image):
+    """Копии фото всех размеров и форматов: (название, формат, ширина, байты)
+
+    Метаданные (EXIF, GPS) в копии не попадают - ориентация уже применена.
+    """
+    for name, size in sorted(RENDITION_SIZES.items(), key=lambda entry: -entry[1]):
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        image = resized
+        for fmt, options in RENDITION_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, **options)
+            yield name, fmt, resized.width, buffer.getvalue()
+
+
+def perceptual_hash(image):
+    """dHash: 64-битный отпечаток, у похожих фото отличается в немногих битах"""
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+
+def stage_upload(item):
+    """Сохраняет новое фото вещи под временным именем, не читая его целиком
+
+    Вызывается в запросе; хэш считает и переносит фото в хранилище по
+    содержимому фоновая задача (process_item_image).
+    """
+    extension = os.path.splitext(item.image.name)[1].lower()
+    item.image.save(f'{INCOMING_DIR}/{uuid.uuid4().hex}{extension}', item.image.file, save=False)
+
+
+def store_upload(item):
+    """Переносит фото из временного имени в хранилище по содержимому
+
+    Хранилище считает SHA-256 при сохранении; вещь привязывается к файлу
+    фото (ImageBlob). Временный файл удаляется после фиксации транзакции.
+    Возвращает False, если вещь удалили до обработки.
+    """
+    storage = item.image.storage
+    incoming = item.image.name
+    directory = os.path.dirname(os.path.dirname(incoming))
+    with storage.open(incoming) as file:
+        name = storage.save(f'{directory}/{os.path.basename(incoming)}', file)
+
+    with transaction.atomic():
+        if not type(item).objects.filter(pk=item.pk, image=incoming).update(image=name):
+            return False
+        item.image.name = name
+        acquire_image_blob(item)
+        discard_upload(incoming)
+    return True
+
+
+def discard_upload(name):
+    """Удаляет временный файл загрузки после фиксации транзакции"""
+    transaction.on_commit(lambda: get_image_storage().delete(name))
+
+
+def process_item_image(item):
+    """Обрабатывает фото вещи: хэши содержимого и уменьшенные копии
+
+    Сохраняет пути копий в item.renditions, хэш в item.image_hash и
+    переводит вещь в статус ready. Если то же фото уже обработано для
+    другой вещи, копии файла фото (ImageBlob) используются повторно.
+    Загрузка под временным именем сначала переносится в хранилище по
+    содержимому.
+    """
+    if not item.image:
+        return {}
+    if is_incoming(item.image.name) and not store_upload(item):
+        return {}
+
+    blob = item.image_blob
+    if blob and blob.renditions:
+        set_rendition_files({}, item=item)
+        _save_item_image(item, blob.renditions, blob.sha256)
+        return blob.renditions
+
+    with item.image.open('rb') as file:
+        data = file.read()
+    # Хэш файла фото уже посчитан хранилищем
+    image_hash = blob.sha256 if blob else hashlib.sha256(data).hexdigest()
+    image = open_upright(io.BytesIO(data))
+
+    storage = item.image.storage
+    stem = os.path.splitext(os.path.basename(item.image.name))[0]
+
+    renditions = {}
+    for name, fmt, width, content in render_renditions(image):
+        path = storage.save(f'{RENDITIONS_DIR}/{stem}_{name}.{fmt}', ContentFile(content))
+        renditions.setdefault(name, {'width': width})[fmt] = path
+
+    if blob:
+        ImageBlob.objects.filter(pk=blob.pk).update(renditions=renditions, phash=perceptual_hash(image))
+        set_rendition_files(renditions, blob=blob)
+        # Копии вещи теперь - копии ее файла фото, своих у нее нет
+        set_rendition_files({}, item=item)
+    else:
+        set_rendition_files(renditions, item=item)
+    _save_item_image(item, renditions, image_hash)
+
+    return renditions
+
+
+def _save_item_image(item, renditions, image_hash):
+    # Сохраняем без сигналов post_save - содержимое гардероба не меняется
+    type(item).objects.filter(pk=item.pk).update(
+        renditions=renditions,
+        image_hash=image_hash,
+        image_status=type(item).IMAGE_READY,
+    )
+    item.renditions = renditions
+    item.image_hash = image_hash
+    item.image_status = type(item).IMAGE_READY
+    bump_wardrobe_version(item.user_id)
+
+
+def rendition_paths(obj):
+    """Пути всех файлов копий вещи или файла фото"""
+    return _rendition_paths(obj.renditions)
+
+
+def _rendition_paths(renditions):
+    return [
+        path
+        for rendition in (renditions or {}).values()
+        for fmt, path in rendition.items()
+        if fmt in RENDITION_FORMATS
+    ]
+
+
+def set_rendition_files(renditions, blob=None, item=None):
+    """Записывает копии файла фото blob или вещи item без него; прежние копии освобождаются"""
+    owner = {'blob': blob} if blob is not None else {'item': item}
+    paths = set(_rendition_paths(renditions))
+    owned = RenditionFile.objects.filter(**owner)
+    old_paths = set(owned.values_list('path', flat=True))
+    owned.exclude(path__in=paths).delete()
+    RenditionFile.objects.bulk_create([RenditionFile(path=path, **owner) for path in paths - old_paths])
+    release_files(old_paths - paths)
+
+
+def delete_renditions(item):
+    """Освобождает файлы копий удаленной вещи без файла фото (загруженной до хранилища по содержимому)"""
+    release_files(rendition_paths(item))
+
+
+def acquire_image_blob(item):
+    """Привязывает вещь к файлу ее фото и увеличивает счетчик ссылок
+
+    Фото вне хранилища по содержимому (загруженные до его появления)
+    не учитываются. Прежний файл вещи, если фото заменили, освобождается.
+    """
+    sha256 = content_hash(item.image.name)
+    previous_blob_id = item.image_blob_id
+    if not sha256 and not previous_blob_id:
+        return None
+    if previous_blob_id and item.image_blob.sha256 == sha256:
+        return item.image_blob
+
+    blob = None
+    with transaction.atomic():
+        if sha256:
+            blob, created = ImageBlob.objects.get_or_create(
+                sha256=sha256,
+                defaults={'path': item.image.name, 'size': item.image.size},
+            )
+            ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        type(item).objects.filter(pk=item.pk).update(image_blob=blob)
+        item.image_blob = blob
+
+        if previous_blob_id:
+            release_image_blob(previous_blob_id)
+
+    return blob
+
+
+def release_image_blob(blob_id):
+    """Уменьшает счетчик ссылок; на последней ссылке удаляет фото и его копии
+
+    Файлы удаляются после фиксации транзакции. Возвращает True, если
+    файл был удален.
+    """
+    with transaction.atomic():
+        ImageBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        blob = ImageBlob.objects.filter(pk=blob_id, ref_count=0).first()
+        if blob is None or blob.items.exists():
+            return False
+
+        # Записи RenditionFile файла удаляются вместе с ним
+        blob.delete()
+        path = blob.path
+        transaction.on_commit(lambda: get_image_storage().delete(path))
+        release_files(rendition_paths(blob))
+
+    return True
+
+
+def release_files(paths):
+    """Удаляет файлы копий после фиксации транзакции, если у них не осталось владельцев
+
+    В хранилище по содержимому одинаковые байты - один файл: копии двух
+    разных фото (например, отличающихся только EXIF) совпадают, поэтому
+    решает только наличие записей RenditionFile с этим путем.
+    """
+    paths = set(paths)
+    if paths:
+        transaction.on_commit(lambda: _delete_unreferenced(paths))
+
+
+def referenced_paths(paths):
+    """Пути из paths, у которых есть владелец (запись RenditionFile)"""
+    return set(RenditionFile.objects.filter(path__in=paths).values_list('path', flat=True))
+
+
+def _delete_unreferenced(paths):
+    storage = get_image_storage()
+    for path in set(paths) - referenced_paths(paths):
+        storage.delete(path)
@@ -0,0 +1,185 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .models import ClothingItem, ImageJob
+from .cache_utils import bump_wardrobe_version
+from .image_utils import process_item_image
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_JOB_MAX_ATTEMPTS = getattr(settings, 'IMAGE_JOB_MAX_ATTEMPTS', 5)
+IMAGE_JOB_RETRY_DELAY = getattr(settings, 'IMAGE_JOB_RETRY_DELAY', 30)
+
+# Задача в статусе running дольше этого времени считается брошенной
+# (процесс обработчика упал) и возвращается в очередь
+IMAGE_JOB_STALE_TIMEOUT = getattr(settings, 'IMAGE_JOB_STALE_TIMEOUT', 60 * 10)
+
+
+def enqueue_image_job(item):
+    """Ставит обработку фото вещи в очередь
+
+    Вызывается внутри транзакции сохранения вещи, поэтому вещь и задача
+    появляются в базе вместе.
+    """
+    return ImageJob.objects.create(item=item)
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: 30 с, 1 мин, 2 мин, ..."""
+    return timedelta(seconds=IMAGE_JOB_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_job():
+    """Забирает следующую готовую к выполнению задачу или возвращает None
+
+    Задачу забирает тот обработчик, чей UPDATE со статусом pending
+    сработал первым, поэтому несколько потоков и процессов не выполнят
+    одну задачу дважды.
+    """
+    while True:
+        now = timezone.now()
+        job_id = ImageJob.objects.filter(
+            status=ImageJob.PENDING, available_at__lte=now
+        ).order_by('available_at', 'pk').values_list('pk', flat=True).first()
+
+        if job_id is None:
+            return None
+
+        claimed = ImageJob.objects.filter(pk=job_id, status=ImageJob.PENDING).update(
+            status=ImageJob.RUNNING,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ImageJob.objects.select_related('item').get(pk=job_id)
+
+
+def run_job(job):
+    """Выполняет задачу, при ошибке откладывает ее с растущей задержкой"""
+    try:
+        process_item_image(job.item)
+    except Exception as error:
+        logger.warning('Image job %s failed (attempt %s): %s', job.pk, job.attempts, error)
+        _fail_job(job, error)
+        return False
+
+    job.status = ImageJob.DONE
+    job.finished_at = timezone.now()
+    job.last_error = ''
+    job.save(update_fields=['status', 'finished_at', 'last_error'])
+    return True
+
+
+def _fail_job(job, error):
+    now = timezone.now()
+    job.last_error = f'{type(error).__name__}: {error}'
+    job.finished_at = now
+
+    if job.attempts < IMAGE_JOB_MAX_ATTEMPTS:
+        job.status = ImageJob.PENDING
+        job.available_at = now + retry_delay(job.attempts)
+    else:
+        job.status = ImageJob.FAILED
+        ClothingItem.objects.filter(pk=job.item_id).update(image_status=ClothingItem.IMAGE_FAILED)
+        bump_wardrobe_version(job.item.user_id)
+
+    job.save(update_fields=['status', 'available_at', 'last_error', 'finished_at'])
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи, брошенные упавшими обработчиками"""
+    stale_before = timezone.now() - timedelta(seconds=IMAGE_JOB_STALE_TIMEOUT)
+    return ImageJob.objects.filter(
+        status=ImageJob.RUNNING, started_at__lt=stale_before
+    ).update(status=ImageJob.PENDING, available_at=timezone.now())
+
+
+def run_pending_jobs(limit=None):
+    """Выполняет задачи из очереди, пока они есть; возвращает число выполненных"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def queue_metrics():
+    """Состояние очереди: число задач по статусам, возраст и длительность"""
+    now = timezone.now()
+    counts = dict(
+        ImageJob.objects.values_list('status').annotate(count=Count('pk')).order_by()
+    )
+    pending = ImageJob.objects.filter(status=ImageJob.PENDING).aggregate(
+        oldest=Min('created_at'),
+        retrying=Count('pk', filter=Q(attempts__gt=0)),
+    )
+    done_last_hour = ImageJob.objects.filter(
+        status=ImageJob.DONE, finished_at__gte=now - timedelta(hours=1)
+    ).aggregate(
+        count=Count('pk'),
+        avg_duration=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+    )
+
+    return {
+        'pending': counts.get(ImageJob.PENDING, 0),
+        'retrying': pending['retrying'],
+        'running': counts.get(ImageJob.RUNNING, 0),
+        'done': counts.get(ImageJob.DONE, 0),
+        'failed': counts.get(ImageJob.FAILED, 0),
+        'oldest_pending_seconds': (now - pending['oldest']).total_seconds() if pending['oldest'] else 0,
+        'done_last_hour': done_last_hour['count'],
+        'avg_duration_seconds': (
+            done_last_hour['avg_duration'].total_seconds() if done_last_hour['avg_duration'] else 0
+        ),
+    }
+
+
+class ImageWorker:
+    """Пул потоков, выполняющих задачи обработки фото"""
+
+    def __init__(self, threads=2, poll_interval=2.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def work(self):
+        try:
+            while not self.stop_event.is_set():
+                job = claim_job()
+                if job is None:
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+
+                succeeded = run_job(job)
+                with self.lock:
+                    self.processed += 1
+                    self.failed += not succeeded
+        finally:
+            connection.close()
+
+    def start(self):
+        requeue_stale_jobs()
+        self.workers = [
+            threading.Thread(target=self.work, name=f'image-worker-{i}', daemon=True)
+            for i in range(self.threads)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join()
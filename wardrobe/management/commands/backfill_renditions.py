@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from wardrobe.image_utils import process_item_image
+from wardrobe.models import ClothingItem
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии фото для уже загруженных вещей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии и для вещей, у которых они уже есть',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Сколько вещей загружать из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        items = ClothingItem.objects.exclude(image='').order_by('pk')
+        if not options['force']:
+            items = items.filter(renditions={})
+
+        created_count = 0
+        failed_count = 0
+        for item in items.iterator(chunk_size=options['batch_size']):
+            try:
+                process_item_image(item)
+            except (OSError, ValueError) as error:
+                failed_count += 1
+                self.stderr.write(f'Вещь {item.pk} ({item.image.name}): {error}')
+                continue
+            created_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии созданы: вещей {created_count}, ошибок {failed_count}'
+        ))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from wardrobe.image_utils import set_rendition_files
+from wardrobe.models import ClothingItem, ImageBlob
+from wardrobe.storage import INCOMING_DIR, get_image_storage
+
+
+class Command(BaseCommand):
+    help = 'Переносит ранее загруженные фото в хранилище по содержимому и удаляет дубликаты'
+
+    def handle(self, *args, **options):
+        storage = get_image_storage()
+        # Загрузки под временным именем переносит фоновая задача
+        items = (
+            ClothingItem.objects.filter(image_blob__isnull=True)
+            .exclude(image='')
+            .exclude(image__contains=f'/{INCOMING_DIR}/')
+            .order_by('pk')
+        )
+
+        moved_count = 0
+        freed_bytes = 0
+        for item in items.iterator():
+            old_name = item.image.name
+            if not storage.exists(old_name):
+                self.stderr.write(f'Вещь {item.pk}: файл {old_name} не найден')
+                continue
+
+            with storage.open(old_name) as file:
+                item.image.name = storage.save(old_name, file)
+            # post_save привязывает вещь к файлу фото (ImageBlob)
+            item.save(update_fields=['image'])
+            moved_count += 1
+
+            self.adopt_renditions(item, storage)
+
+            if not ClothingItem.objects.filter(image=old_name).exists():
+                freed_bytes += storage.size(old_name)
+                storage.delete(old_name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено фото: {moved_count}, освобождено {freed_bytes / 1024 / 1024:.1f} МБ'
+        ))
+
+    def adopt_renditions(self, item, storage):
+        """Копии вещи становятся копиями файла фото или заменяются уже готовыми"""
+        blob = item.image_blob
+        if not item.renditions:
+            return
+
+        if not blob.renditions:
+            ImageBlob.objects.filter(pk=blob.pk).update(renditions=item.renditions)
+            set_rendition_files(item.renditions, blob=blob)
+        else:
+            ClothingItem.objects.filter(pk=item.pk).update(renditions=blob.renditions)
+        # Копии вещи теперь принадлежат файлу фото
+        set_rendition_files({}, item=item)
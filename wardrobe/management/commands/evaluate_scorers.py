@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wardrobe.evaluation_utils import evaluate_scorer, rated_events
+from wardrobe.event_utils import flush_generation_events
+from wardrobe.generation_utils import LEARNING_RULES, SCORERS, get_learning_rule, get_scorer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает модели оценки образов на журнале оценок (офлайн)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scorer',
+            action='append',
+            help='Модель по имени или пути к классу; можно указать несколько (по умолчанию все)',
+        )
+        parser.add_argument(
+            '--rule',
+            choices=sorted(LEARNING_RULES),
+            help='Правило обучения Compatibility.score (по умолчанию COMPATIBILITY_LEARNING_RULE)',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Оценивать только по событиям пользователя с этим id',
+        )
+
+    def handle(self, *args, **options):
+        flush_generation_events()
+        rule = get_learning_rule(options['rule'])
+
+        for name in options['scorer'] or list(SCORERS):
+            try:
+                scorer = get_scorer(name)
+            except ImportError as error:
+                raise CommandError(f'Модель {name} не найдена: {error}')
+
+            metrics = evaluate_scorer(scorer, rated_events(options['user']), rule)
+            if not metrics['events']:
+                self.stdout.write('В журнале нет оцененных образов')
+                return
+
+            self.stdout.write(
+                f'{name}: событий {metrics["events"]} (пропущено {metrics["skipped"]}), '
+                f'RMSE {metrics["rmse"]:.3f}, '
+                f'IPS {self.format_value(metrics["ips"])}, '
+                f'SNIPS {self.format_value(metrics["snips"])} '
+                f'по {metrics["ips_events"]} событиям, '
+                f'средняя оценка в журнале {metrics["logged_rating"]:.2f}'
+            )
+
+    def format_value(self, value):
+        return '-' if value is None else f'{value:.2f}'
@@ -0,0 +1,138 @@
+import time
+from itertools import combinations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from wardrobe.generation_utils import LEARNING_RULES, get_learning_rule, rating_success
+from wardrobe.models import ClothingItem, Compatibility, GenerationEvent
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает Compatibility с нуля по журналу оценок образов, по одному пользователю. '
+        'События, которые веб-процессы еще держат в буфере (до GENERATION_EVENT_FLUSH_INTERVAL секунд), '
+        'в пересчет не попадают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rule',
+            choices=sorted(LEARNING_RULES),
+            help='Правило обучения (по умолчанию COMPATIBILITY_LEARNING_RULE)',
+        )
+        parser.add_argument(
+            '--step',
+            type=float,
+            help='Шаг правила обучения (по умолчанию COMPATIBILITY_LEARNING_STEP)',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Пересчитать только для пользователя с этим id',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20000,
+            help='Сколько событий читать из базы за раз',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, не записывая в базу',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+
+        rule = get_learning_rule(options['rule'], options['step'])
+        events = GenerationEvent.objects.filter(rating__isnull=False)
+        compatibilities = Compatibility.objects.all()
+        if options['user']:
+            events = events.filter(user_id=options['user'])
+            compatibilities = compatibilities.filter(user_id=options['user'])
+
+        start = time.perf_counter()
+        user_ids = list(events.order_by('user_id').values_list('user_id', flat=True).distinct())
+        events_count = 0
+        pairs_count = 0
+        # В памяти и в транзакции записи - пары одного пользователя
+        for user_id in user_ids:
+            scores, user_events_count = self.replay(rule, events.filter(user_id=user_id), options['batch_size'])
+            events_count += user_events_count
+            pairs_count += len(scores) if options['dry_run'] else self.write(user_id, scores)
+
+        stale_user_ids = set(compatibilities.values_list('user_id', flat=True).distinct()) - set(user_ids)
+        if not options['dry_run']:
+            # Пары пользователей без оценок в журнале не восстанавливаются
+            for user_id in stale_user_ids:
+                Compatibility.objects.filter(user_id=user_id).delete()
+
+        self.stdout.write(
+            f'Пользователей: {len(user_ids)}, событий: {events_count}, пар: {pairs_count}, '
+            f'{time.perf_counter() - start:.1f} с'
+        )
+        if options['dry_run']:
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Compatibility пересчитана по правилу {type(rule).__name__}(step={rule.step}): пар {pairs_count}'
+        ))
+
+    def replay(self, rule, events, batch_size):
+        """Применяет оценки пользователя из журнала по порядку: {(item1, item2): [score, times, alpha, beta]}"""
+        scores = {}
+        get_pair = scores.get
+        apply = rule.apply
+        events_count = 0
+        last_id = 0
+        while True:
+            # Постраничный проход по id вместо OFFSET - каждая пачка читается по индексу
+            batch = list(
+                events.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'item_ids', 'rating')[:batch_size]
+            )
+            if not batch:
+                break
+
+            for event_id, item_ids, rating in batch:
+                success = rating_success(rating)
+                for key in combinations(sorted(set(item_ids)), 2):
+                    pair = get_pair(key)
+                    if pair is None:
+                        pair = scores[key] = [0.0, 0, 0.0, 0.0]
+                    pair[0] = apply(pair[0], rating)
+                    pair[1] += 1
+                    pair[2] += success
+                    pair[3] += 1 - success
+
+            events_count += len(batch)
+            last_id = batch[-1][0]
+
+        return scores, events_count
+
+    def write(self, user_id, scores):
+        """Заменяет Compatibility пользователя пересчитанными парами из существующих вещей"""
+        existing_items = set(ClothingItem.objects.filter(user_id=user_id).values_list('id', flat=True))
+        pairs = [
+            Compatibility(
+                user_id=user_id,
+                item1_id=item1_id,
+                item2_id=item2_id,
+                score=score,
+                times_evaluated=times,
+                alpha=alpha,
+                beta=beta,
+            )
+            for (item1_id, item2_id), (score, times, alpha, beta) in scores.items()
+            if item1_id in existing_items and item2_id in existing_items
+        ]
+
+        with transaction.atomic():
+            Compatibility.objects.filter(user_id=user_id).delete()
+            Compatibility.objects.bulk_create(pairs, batch_size=5000)
+
+        return len(pairs)
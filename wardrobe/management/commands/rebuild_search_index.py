@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from wardrobe.search_utils import SEARCH_MODELS, full_text_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс вещей и образов (FTS5)'
+
+    def handle(self, *args, **options):
+        if not full_text_available(connection.alias):
+            raise CommandError('Полнотекстовый индекс есть только в SQLite')
+
+        for model in SEARCH_MODELS:
+            start = time.perf_counter()
+            with transaction.atomic():
+                count = rebuild_search_index(model)
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: {count} записей, {time.perf_counter() - start:.1f} с'
+            ))
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wardrobe.job_utils import ImageWorker, queue_metrics, requeue_stale_jobs, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь фото вещей: уменьшенные копии и хэши'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=2,
+            help='Число потоков-обработчиков',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--metrics-interval',
+            type=float,
+            default=60.0,
+            help='Как часто выводить метрики очереди, в секундах',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и завершиться',
+        )
+        parser.add_argument(
+            '--metrics',
+            action='store_true',
+            help='Только вывести метрики очереди',
+        )
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.write_metrics()
+            return
+
+        if options['once']:
+            requeue_stale_jobs()
+            processed = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f'Задач выполнено: {processed}'))
+            self.write_metrics()
+            return
+
+        worker = ImageWorker(threads=options['threads'], poll_interval=options['poll_interval'])
+        worker.start()
+        self.stdout.write(f'Обработчик фото запущен, потоков: {options["threads"]}')
+
+        try:
+            while True:
+                time.sleep(options['metrics_interval'])
+                self.write_metrics()
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка обработчика...')
+        finally:
+            worker.stop()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Задач выполнено: {worker.processed}, с ошибкой: {worker.failed}'
+        ))
+
+    def write_metrics(self):
+        metrics = queue_metrics()
+        self.stdout.write(
+            'Очередь: в ожидании {pending} (повторных {retrying}), выполняется {running}, '
+            'готово {done}, ошибок {failed}; старейшая задача ждет {oldest_pending_seconds:.0f} с; '
+            'за час обработано {done_last_hour}, в среднем {avg_duration_seconds:.2f} с'.format(**metrics)
+        )
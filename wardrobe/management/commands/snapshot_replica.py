@@ -0,0 +1,40 @@
+import os
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Делает снимок основной базы SQLite для чтения из реплики (REPLICA_DB_PATH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Путь снимка (по умолчанию REPLICA_DB_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        output = options['output'] or getattr(settings, 'REPLICA_DB_PATH', None)
+        if not output:
+            raise CommandError('Укажите --output или REPLICA_DB_PATH')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Снимок делается только для SQLite, реплику Postgres ведет сама база')
+
+        # Снимок собирается во временном файле и подменяет прежний целиком:
+        # открытые соединения дочитывают старый файл, новые открывают новый
+        temporary = f'{output}.tmp'
+        connection.ensure_connection()
+        snapshot = sqlite3.connect(temporary)
+        try:
+            connection.connection.backup(snapshot)
+            # Реплика открывается только на чтение, а для WAL нужны файлы -wal и -shm
+            snapshot.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            snapshot.close()
+        os.replace(temporary, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимок сохранен: {output} ({os.path.getsize(output) / 1024 / 1024:.1f} МБ)'
+        ))
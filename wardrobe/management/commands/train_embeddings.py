@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wardrobe.embedding_utils import EMBEDDING_DIM, train_embeddings
+from wardrobe.event_utils import flush_generation_events
+
+
+class Command(BaseCommand):
+    help = 'Обучает векторы вещей (ItemEmbedding) с нуля по журналу оценок образов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--epochs',
+            type=int,
+            default=20,
+            help='Сколько раз пройти по оценкам каждого пользователя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Обучить только для пользователя с этим id',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Зерно перемешивания оценок (для воспроизводимости)',
+        )
+
+    def handle(self, *args, **options):
+        if options['epochs'] < 1:
+            raise CommandError('--epochs должен быть больше 0')
+
+        flush_generation_events()
+        start = time.perf_counter()
+        users_count, items_count = train_embeddings(
+            user_id=options['user'],
+            epochs=options['epochs'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Векторы обучены: пользователей {users_count}, вещей {items_count}, '
+            f'размерность {EMBEDDING_DIM}, {time.perf_counter() - start:.1f} с'
+        ))
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from wardrobe.cache_utils import cache_is_process_local
+from wardrobe.pool_utils import get_pool_category_sets, refill_pool
+
+
+class Command(BaseCommand):
+    help = 'Заполняет пулы готовых образов для активных пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Пользователи, заходившие за последние N дней',
+        )
+        parser.add_argument(
+            '--categories',
+            default='',
+            help='Набор категорий через запятую, например top,bottom,shoes',
+        )
+
+    def handle(self, *args, **options):
+        if cache_is_process_local():
+            # Пулы попали бы в кэш этой команды, а веб-процессы их не увидят
+            raise CommandError('Кэш виден только этому процессу: укажите общий CACHE_BACKEND (file, db или redis)')
+
+        since = timezone.now() - timedelta(days=options['days'])
+        users = User.objects.filter(is_active=True, last_login__gte=since)
+        categories = [c for c in options['categories'].split(',') if c]
+
+        users_count = 0
+        outfits_count = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            category_sets = [categories] if categories else get_pool_category_sets(user_id)
+            for category_set in category_sets:
+                outfits_count += refill_pool(user_id, category_set)
+            users_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Пулы заполнены: пользователей {users_count}, образов {outfits_count}'
+        ))
@@ -0,0 +1,149 @@
+from django.db import migrations, models
+
+import wardrobe.fields
+from wardrobe.fields import codes_to_mask, mask_to_codes
+
+
+SEASON_CHOICES = [
+    ('winter', 'Зима'),
+    ('spring', 'Весна'),
+    ('summer', 'Лето'),
+    ('autumn', 'Осень'),
+]
+
+OCCASION_CHOICES = [
+    ('office', 'В офис'),
+    ('home', 'Для дома'),
+    ('walk', 'На прогулку'),
+    ('party', 'На праздник'),
+    ('any', 'Любой'),
+]
+
+SEASON_CODES = [code for code, name in SEASON_CHOICES]
+OCCASION_CODES = [code for code, name in OCCASION_CHOICES]
+
+BATCH_SIZE = 500
+
+
+def _convert(queryset, conversions):
+    batch = []
+    fields = [target for source, target, convert in conversions]
+
+    for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+        for source, target, convert in conversions:
+            setattr(obj, target, convert(getattr(obj, source)))
+        batch.append(obj)
+
+        if len(batch) >= BATCH_SIZE:
+            queryset.model.objects.bulk_update(batch, fields)
+            batch = []
+
+    if batch:
+        queryset.model.objects.bulk_update(batch, fields)
+
+
+def strings_to_masks(apps, schema_editor):
+    ClothingItem = apps.get_model('wardrobe', 'ClothingItem')
+    Outfit = apps.get_model('wardrobe', 'Outfit')
+
+    _convert(ClothingItem.objects.all(), [
+        ('season', 'season_mask', lambda value: codes_to_mask(value, SEASON_CODES)),
+        ('occasion', 'occasion_mask', lambda value: codes_to_mask(value, OCCASION_CODES)),
+    ])
+    _convert(Outfit.objects.all(), [
+        ('occasion', 'occasion_mask', lambda value: codes_to_mask(value, OCCASION_CODES)),
+    ])
+
+
+def masks_to_strings(apps, schema_editor):
+    ClothingItem = apps.get_model('wardrobe', 'ClothingItem')
+    Outfit = apps.get_model('wardrobe', 'Outfit')
+
+    _convert(ClothingItem.objects.all(), [
+        ('season_mask', 'season', lambda mask: ','.join(mask_to_codes(mask, SEASON_CODES))),
+        ('occasion_mask', 'occasion', lambda mask: ','.join(mask_to_codes(mask, OCCASION_CODES))),
+    ])
+    _convert(Outfit.objects.all(), [
+        ('occasion_mask', 'occasion', lambda mask: ','.join(mask_to_codes(mask, OCCASION_CODES))),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0002_clothingitem_price_clothingitem_times_shown_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothingitem',
+            name='season_mask',
+            field=wardrobe.fields.MultipleChoiceBitmaskField(bit_choices=SEASON_CHOICES, verbose_name='Сезон'),
+        ),
+        migrations.AddField(
+            model_name='clothingitem',
+            name='occasion_mask',
+            field=wardrobe.fields.MultipleChoiceBitmaskField(bit_choices=OCCASION_CHOICES, verbose_name='Тип мероприятия'),
+        ),
+        migrations.AddField(
+            model_name='outfit',
+            name='occasion_mask',
+            field=wardrobe.fields.MultipleChoiceBitmaskField(bit_choices=OCCASION_CHOICES, verbose_name='Тип мероприятия'),
+        ),
+        migrations.RunPython(strings_to_masks, masks_to_strings),
+        # Значения по умолчанию нужны только для отката миграции
+        migrations.AlterField(
+            model_name='clothingitem',
+            name='season',
+            field=models.CharField(default='', max_length=50, verbose_name='Сезон'),
+        ),
+        migrations.AlterField(
+            model_name='clothingitem',
+            name='occasion',
+            field=models.CharField(default='', max_length=100, verbose_name='Тип мероприятия'),
+        ),
+        migrations.AlterField(
+            model_name='outfit',
+            name='occasion',
+            field=models.CharField(default='', max_length=100, verbose_name='Тип мероприятия'),
+        ),
+        migrations.RemoveField(
+            model_name='clothingitem',
+            name='season',
+        ),
+        migrations.RemoveField(
+            model_name='clothingitem',
+            name='occasion',
+        ),
+        migrations.RemoveField(
+            model_name='outfit',
+            name='occasion',
+        ),
+        migrations.RenameField(
+            model_name='clothingitem',
+            old_name='season_mask',
+            new_name='season',
+        ),
+        migrations.RenameField(
+            model_name='clothingitem',
+            old_name='occasion_mask',
+            new_name='occasion',
+        ),
+        migrations.RenameField(
+            model_name='outfit',
+            old_name='occasion_mask',
+            new_name='occasion',
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'season'], name='clothingitem_user_season_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'occasion'], name='clothingitem_user_occasion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outfit',
+            index=models.Index(fields=['user', 'occasion'], name='outfit_user_occasion_idx'),
+        ),
+    ]
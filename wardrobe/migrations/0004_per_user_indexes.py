@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0003_bitmask_season_occasion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'category'], name='clothingitem_user_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', '-created_at'], name='clothingitem_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'price'], name='clothingitem_user_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'rating'], name='clothingitem_user_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outfit',
+            index=models.Index(fields=['user', '-created_at'], name='outfit_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outfit',
+            index=models.Index(fields=['user', 'rating'], name='outfit_user_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.11 on 2026-10-17 00:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0005_clothingitem_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothingitem',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256 фото'),
+        ),
+        migrations.AddField(
+            model_name='clothingitem',
+            name='image_status',
+            field=models.CharField(choices=[('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], default='ready', editable=False, max_length=20, verbose_name='Обработка фото'),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступна с')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начата')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='wardrobe.clothingitem', verbose_name='Вещь')),
+            ],
+            options={
+                'verbose_name': 'Задача обработки фото',
+                'verbose_name_plural': 'Задачи обработки фото',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='imagejob_status_available_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-17 00:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import wardrobe.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0006_image_processing_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('path', models.CharField(max_length=255, verbose_name='Путь в хранилище')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('phash', models.CharField(blank=True, db_index=True, max_length=16, verbose_name='Перцептивный хэш')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('renditions', models.JSONField(blank=True, default=dict, verbose_name='Уменьшенные копии фото')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+            ],
+            options={
+                'verbose_name': 'Файл фото',
+                'verbose_name_plural': 'Файлы фото',
+            },
+        ),
+        migrations.AlterField(
+            model_name='clothingitem',
+            name='image',
+            field=models.ImageField(storage=wardrobe.storage.get_image_storage, upload_to='clothing/', verbose_name='Фото'),
+        ),
+        migrations.AddField(
+            model_name='clothingitem',
+            name='image_blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='items', to='wardrobe.imageblob', verbose_name='Файл фото'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.11 on 2026-10-17 00:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('wardrobe', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationSession',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='generation_session', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('categories', models.JSONField(blank=True, default=list, verbose_name='Выбранные категории')),
+                ('current', models.JSONField(blank=True, null=True, verbose_name='Текущий образ')),
+                ('rated', models.BooleanField(default=False, verbose_name='Образ оценен')),
+                ('last_rating', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Последняя оценка')),
+                ('history', models.JSONField(blank=True, default=list, verbose_name='История')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Сессия генерации',
+                'verbose_name_plural': 'Сессии генерации',
+            },
+        ),
+    ]
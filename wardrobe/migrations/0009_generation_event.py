@@ -0,0 +1,33 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wardrobe', '0008_generation_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_ids', models.JSONField(verbose_name='Вещи образа')),
+                ('categories', models.JSONField(default=list, verbose_name='Категории')),
+                ('weights', models.JSONField(default=list, verbose_name='Веса выбора')),
+                ('rating', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Оценка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Событие генерации',
+                'verbose_name_plural': 'События генерации',
+                'indexes': [models.Index(condition=models.Q(('rating__isnull', False)), fields=['id'], name='generationevent_rated_idx')],
+            },
+        ),
+    ]
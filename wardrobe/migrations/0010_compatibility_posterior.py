@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_posterior(apps, schema_editor):
+    # Оценка в [-1, 1] переводится в долю успехов (score + 1) / 2
+    # на каждую из times_evaluated оценок пары
+    Compatibility = apps.get_model('wardrobe', 'Compatibility')
+    Compatibility.objects.update(
+        alpha=F('times_evaluated') * (F('score') + 1.0) / 2.0,
+        beta=F('times_evaluated') * (1.0 - F('score')) / 2.0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0009_generation_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compatibility',
+            name='alpha',
+            field=models.FloatField(default=0, verbose_name='Успехи'),
+        ),
+        migrations.AddField(
+            model_name='compatibility',
+            name='beta',
+            field=models.FloatField(default=0, verbose_name='Неудачи'),
+        ),
+        migrations.RunPython(backfill_posterior, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0010_compatibility_posterior'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemEmbedding',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='wardrobe.clothingitem', verbose_name='Вещь')),
+                ('vector', models.BinaryField(verbose_name='Вектор (float32)')),
+                ('bias', models.FloatField(default=0, verbose_name='Смещение')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлен')),
+            ],
+            options={
+                'verbose_name': 'Вектор вещи',
+                'verbose_name_plural': 'Векторы вещей',
+            },
+        ),
+    ]
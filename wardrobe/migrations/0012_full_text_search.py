@@ -0,0 +1,83 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import wardrobe.fields
+
+
+SEARCH_TABLES = {
+    'wardrobe_clothingitem_search': 'wardrobe_clothingitem',
+    'wardrobe_outfit_search': 'wardrobe_outfit',
+}
+
+
+def _normalized(column):
+    # Как search_utils.normalize: ё и е не различаются
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_tables(apps, schema_editor):
+    # FTS5 есть только в SQLite; в других базах поиск идет через icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, source in SEARCH_TABLES.items():
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {table} USING fts5("
+            f"owner, name, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # Совпадение в названии весит в 10 раз больше, чем в описании
+        schema_editor.execute(f"INSERT INTO {table}({table}, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')")
+        schema_editor.execute(
+            f"INSERT INTO {table}(rowid, owner, name, description) "
+            f"SELECT id, 'u' || user_id, {_normalized('name')}, {_normalized('description')} FROM {source}"
+        )
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0011_item_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClothingItemSearch',
+            fields=[
+                ('owner', models.TextField()),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('rank', models.FloatField()),
+                ('item', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='wardrobe.clothingitem')),
+                ('document', wardrobe.fields.FullTextField(db_column='wardrobe_clothingitem_search')),
+            ],
+            options={
+                'db_table': 'wardrobe_clothingitem_search',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='OutfitSearch',
+            fields=[
+                ('owner', models.TextField()),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('rank', models.FloatField()),
+                ('outfit', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='wardrobe.outfit')),
+                ('document', wardrobe.fields.FullTextField(db_column='wardrobe_outfit_search')),
+            ],
+            options={
+                'db_table': 'wardrobe_outfit_search',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wardrobe', '0013_clothingitem_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutfitPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categories', models.CharField(max_length=100, verbose_name='Категории')),
+                ('generation', models.BigIntegerField(verbose_name='Поколение')),
+                ('size', models.PositiveIntegerField(verbose_name='Образов')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Следующий образ')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outfit_pools', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Пул образов',
+                'verbose_name_plural': 'Пулы образов',
+                'unique_together': {('user', 'categories')},
+            },
+        ),
+    ]
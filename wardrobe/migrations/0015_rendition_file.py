@@ -0,0 +1,58 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+RENDITION_FORMATS = ('webp', 'jpeg')
+
+
+def rendition_paths(renditions):
+    return {
+        path
+        for rendition in (renditions or {}).values()
+        for fmt, path in rendition.items()
+        if fmt in RENDITION_FORMATS
+    }
+
+
+def record_owners(apps, schema_editor):
+    # Копии файлов фото принадлежат файлу, копии вещей без файла фото - вещи
+    ImageBlob = apps.get_model('wardrobe', 'ImageBlob')
+    ClothingItem = apps.get_model('wardrobe', 'ClothingItem')
+    RenditionFile = apps.get_model('wardrobe', 'RenditionFile')
+    files = [
+        RenditionFile(path=path, blob_id=blob_id)
+        for blob_id, renditions in ImageBlob.objects.values_list('id', 'renditions').iterator()
+        for path in rendition_paths(renditions)
+    ]
+    files += [
+        RenditionFile(path=path, item_id=item_id)
+        for item_id, renditions in ClothingItem.objects.filter(image_blob__isnull=True).values_list('id', 'renditions').iterator()
+        for path in rendition_paths(renditions)
+    ]
+    RenditionFile.objects.bulk_create(files, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wardrobe', '0014_outfit_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenditionFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(db_index=True, max_length=255, verbose_name='Путь в хранилище')),
+                ('blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rendition_files', to='wardrobe.imageblob', verbose_name='Файл фото')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rendition_files', to='wardrobe.clothingitem', verbose_name='Вещь')),
+            ],
+            options={
+                'verbose_name': 'Файл копии фото',
+                'verbose_name_plural': 'Файлы копий фото',
+            },
+        ),
+        migrations.RunPython(record_owners, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,32 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.contrib.auth.models import User
+from .fields import FullTextField, MultipleChoiceBitmaskField
+from .storage import get_image_storage
 from .utils import get_display_from_comma_separated
 
 
+class ImageBlob(models.Model):
+    """Файл фото в хранилище по содержимому и число вещей, которые на него ссылаются"""
+    
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    path = models.CharField(max_length=255, verbose_name="Путь в хранилище")
+    size = models.PositiveBigIntegerField(default=0, verbose_name="Размер, байт")
+    phash = models.CharField(max_length=16, blank=True, db_index=True, verbose_name="Перцептивный хэш")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Ссылок")
+    renditions = models.JSONField(default=dict, blank=True, verbose_name="Уменьшенные копии фото")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
+    
+    def __str__(self):
+        return self.path
+    
+    class Meta:
+        verbose_name = "Файл фото"
+        verbose_name_plural = "Файлы фото"
+
+
 class ClothingItem(models.Model):
     """Модель вещи в гардеробе"""
     
@@ -49,18 +73,33 @@ class ClothingItem(models.Model):
         ('any', 'Любой'),
     ]
     
+    # Обработка фото
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_PROCESSING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     name = models.CharField(max_length=200, verbose_name="Название")
-    image = models.ImageField(upload_to='clothing/', verbose_name="Фото")
+    image = models.ImageField(upload_to='clothing/', storage=get_image_storage, verbose_name="Фото")
     description = models.TextField(verbose_name="Описание", blank=True)
     color = models.CharField(max_length=20, choices=COLOR_CHOICES, verbose_name="Цвет")
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, verbose_name="Категория")
-    season = models.CharField(max_length=50, verbose_name="Сезон")
-    occasion = models.CharField(max_length=100, verbose_name="Тип мероприятия")
+    season = MultipleChoiceBitmaskField(bit_choices=SEASON_CHOICES, verbose_name="Сезон")
+    occasion = MultipleChoiceBitmaskField(bit_choices=OCCASION_CHOICES, verbose_name="Тип мероприятия")
     rating = models.IntegerField(choices=[(i, f'{i} ★') for i in range(1, 6)], default=3, verbose_name="Личная оценка")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Цена")
     times_shown = models.IntegerField(default=0, verbose_name="Показов")
+    renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Уменьшенные копии фото")
+    image_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY, editable=False, verbose_name="Обработка фото")
+    image_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name="SHA-256 фото")
+    image_blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='items', verbose_name="Файл фото")
     
     def __str__(self):
         return self.name
@@ -69,6 +108,15 @@ class ClothingItem(models.Model):
         verbose_name = "Вещь"
         verbose_name_plural = "Вещи"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'season'], name='clothingitem_user_season_idx'),
+            models.Index(fields=['user', 'occasion'], name='clothingitem_user_occasion_idx'),
+            models.Index(fields=['user', 'category'], name='clothingitem_user_category_idx'),
+            models.Index(fields=['user', '-created_at'], name='clothingitem_user_created_idx'),
+            models.Index(fields=['user', 'price'], name='clothingitem_user_price_idx'),
+            models.Index(fields=['user', 'rating'], name='clothingitem_user_rating_idx'),
+            models.Index(fields=['user', 'updated_at'], name='clothingitem_user_updated_idx'),
+        ]
 
     def get_seasons_display(self):
         return get_display_from_comma_separated(self, 'season', self.SEASON_CHOICES)
@@ -76,6 +124,60 @@ class ClothingItem(models.Model):
     def get_occasion_display(self):
         return get_display_from_comma_separated(self, 'occasion', self.OCCASION_CHOICES)
 
+    @cached_property
+    def rendition_urls(self):
+        """URL уменьшенных копий фото: {'card': {'webp': ..., 'jpeg': ...}, ...}"""
+        storage = self.image.storage
+        return {
+            name: {fmt: storage.url(path) for fmt, path in rendition.items() if fmt != 'width'}
+            for name, rendition in (self.renditions or {}).items()
+        }
+
+    def get_srcset(self, fmt):
+        """Значение srcset из копий фото в указанном формате"""
+        renditions = sorted((self.renditions or {}).items(), key=lambda entry: entry[1]['width'])
+        return ', '.join(
+            f"{self.rendition_urls[name][fmt]} {rendition['width']}w"
+            for name, rendition in renditions
+            if fmt in rendition
+        )
+
+    @property
+    def webp_srcset(self):
+        return self.get_srcset('webp')
+
+    @property
+    def jpeg_srcset(self):
+        return self.get_srcset('jpeg')
+
+
+class RenditionFile(models.Model):
+    """Владелец файла уменьшенной копии: файл фото или вещь без него
+
+    Одинаковые копии разных фото - один файл в хранилище по содержимому,
+    поэтому у пути может быть несколько владельцев. Файл удаляется, когда
+    у него не остается ни одного.
+    """
+    
+    path = models.CharField(max_length=255, db_index=True, verbose_name="Путь в хранилище")
+    blob = models.ForeignKey(ImageBlob, on_delete=models.CASCADE, null=True, blank=True, related_name='rendition_files', verbose_name="Файл фото")
+    # Вещь, загруженная до хранилища по содержимому (без файла фото)
+    item = models.ForeignKey('ClothingItem', on_delete=models.CASCADE, null=True, blank=True, related_name='rendition_files', verbose_name="Вещь")
+    
+    def __str__(self):
+        return self.path
+    
+    class Meta:
+        verbose_name = "Файл копии фото"
+        verbose_name_plural = "Файлы копий фото"
+
+
+class OutfitQuerySet(models.QuerySet):
+    def with_items(self):
+        """Образы вместе с вещами и их количеством (items_count) без запросов на каждый образ"""
+        return self.prefetch_related('items').annotate(items_count=models.Count('items'))
+
+
 class Outfit(models.Model):
     """Модель образа (комбинации вещей)"""
     
@@ -85,10 +187,12 @@ class Outfit(models.Model):
     name = models.CharField(max_length=200, verbose_name="Название образа")
     description = models.TextField(verbose_name="Описание", blank=True)
     items = models.ManyToManyField(ClothingItem, verbose_name="Вещи в образе")
-    occasion = models.CharField(max_length=100, verbose_name="Тип мероприятия")
+    occasion = MultipleChoiceBitmaskField(bit_choices=OCCASION_CHOICES, verbose_name="Тип мероприятия")
     rating = models.IntegerField(choices=[(i, f'{i} ★') for i in range(1, 6)], default=3, verbose_name="Личная оценка")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
     
+    objects = OutfitQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
     
@@ -96,10 +200,51 @@ class Outfit(models.Model):
         verbose_name = "Образ"
         verbose_name_plural = "Образы"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'occasion'], name='outfit_user_occasion_idx'),
+            models.Index(fields=['user', '-created_at'], name='outfit_user_created_idx'),
+            models.Index(fields=['user', 'rating'], name='outfit_user_rating_idx'),
+        ]
 
     def get_occasion_display(self):
         return get_display_from_comma_separated(self, 'occasion', self.OCCASION_CHOICES)
+
+
+
+class SearchIndex(models.Model):
+    """Строка полнотекстового индекса: виртуальная таблица FTS5 (только SQLite)
+
+    Таблицы создает миграция, заполняют сигналы (search_utils); rowid
+    совпадает с id записи. owner - токен u<id пользователя>, чтобы поиск
+    сразу ограничивался записями пользователя. rank - оценка bm25 при
+    поиске (меньше - релевантнее).
+    """
     
+    owner = models.TextField()
+    name = models.TextField()
+    description = models.TextField()
+    rank = models.FloatField()
+    
+    class Meta:
+        abstract = True
+        managed = False
+
+
+class ClothingItemSearch(SearchIndex):
+    item = models.OneToOneField(ClothingItem, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_index')
+    document = FullTextField(db_column='wardrobe_clothingitem_search')
+    
+    class Meta(SearchIndex.Meta):
+        db_table = 'wardrobe_clothingitem_search'
+
+
+class OutfitSearch(SearchIndex):
+    outfit = models.OneToOneField(Outfit, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_index')
+    document = FullTextField(db_column='wardrobe_outfit_search')
+    
+    class Meta(SearchIndex.Meta):
+        db_table = 'wardrobe_outfit_search'
+
 class Compatibility(models.Model):
     """Cовместимость вещей"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
@@ -107,6 +252,10 @@ class Compatibility(models.Model):
     item2 = models.ForeignKey(ClothingItem, on_delete=models.CASCADE, related_name='compatibility_as_item2')
     score = models.FloatField(default=0, verbose_name="Оценка совместимости")
     times_evaluated = models.IntegerField(default=0, verbose_name="Количество оценок")
+    # Апостериорное Beta-распределение вероятности удачной пары:
+    # оценка образа 1..5 дает (rating - 1) / 4 успеха и остаток неудачи
+    alpha = models.FloatField(default=0, verbose_name="Успехи")
+    beta = models.FloatField(default=0, verbose_name="Неудачи")
     
     class Meta:
         unique_together = [['user', 'item1', 'item2']]
@@ -114,4 +263,165 @@ class Compatibility(models.Model):
         verbose_name_plural = "Совместимости"
     
     def __str__(self):
-        return f"{self.item1} + {self.item2}: {self.score:.2f}"
\ No newline at end of file
+        return f"{self.item1} + {self.item2}: {self.score:.2f}"
+
+class GenerationSession(models.Model):
+    """Состояние генератора образов пользователя и последние сгенерированные образы
+
+    Хранится отдельной строкой на пользователя вместо сессии, чтобы каждая
+    генерация и оценка не перезаписывали всю сессию.
+    """
+    
+    HISTORY_SIZE = getattr(settings, 'GENERATION_HISTORY_SIZE', 10)
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='generation_session', verbose_name="Пользователь")
+    categories = models.JSONField(default=list, blank=True, verbose_name="Выбранные категории")
+    # {'item_ids': [...], 'categories': [...]}
+    current = models.JSONField(null=True, blank=True, verbose_name="Текущий образ")
+    rated = models.BooleanField(default=False, verbose_name="Образ оценен")
+    last_rating = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Последняя оценка")
+    # Предыдущие образы, новые в начале: [{'item_ids', 'categories', 'rating'}, ...]
+    history = models.JSONField(default=list, blank=True, verbose_name="История")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    
+    def __str__(self):
+        return f"{self.user}: {len(self.history)} в истории"
+    
+    class Meta:
+        verbose_name = "Сессия генерации"
+        verbose_name_plural = "Сессии генерации"
+
+    def set_outfit(self, items, categories):
+        """Делает образ текущим, прежний уходит в историю"""
+        if self.current:
+            self.history.insert(0, {**self.current, 'rating': self.last_rating if self.rated else None})
+            del self.history[self.HISTORY_SIZE:]
+        
+        self.current = {
+            'item_ids': [item.id for item in items],
+            'categories': list(categories),
+            'weights': [getattr(item, 'selection_weight', None) for item in items],
+        }
+        self.rated = False
+        self.last_rating = None
+
+    def rate(self, rating):
+        self.rated = True
+        self.last_rating = rating
+
+    def undo(self):
+        """Возвращает предыдущий образ из истории; False, если истории нет"""
+        if not self.history:
+            return False
+        
+        previous = self.history.pop(0)
+        rating = previous.pop('rating', None)
+        self.current = previous
+        self.rated = rating is not None
+        self.last_rating = rating
+        return True
+
+
+class OutfitPool(models.Model):
+    """Выдача образов из пула пользователя; сами образы хранятся в кэше
+
+    Образ под номером position забирает запрос, чей условный UPDATE
+    position сработал первым, поэтому два одновременных запроса не получат
+    один образ на любом бэкенде кэша.
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outfit_pools', verbose_name="Пользователь")
+    # Коды категорий по алфавиту через запятую
+    categories = models.CharField(max_length=100, verbose_name="Категории")
+    generation = models.BigIntegerField(verbose_name="Поколение")
+    size = models.PositiveIntegerField(verbose_name="Образов")
+    position = models.PositiveIntegerField(default=0, verbose_name="Следующий образ")
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.categories} ({self.position}/{self.size})"
+    
+    class Meta:
+        unique_together = [['user', 'categories']]
+        verbose_name = "Пул образов"
+        verbose_name_plural = "Пулы образов"
+
+
+class GenerationEvent(models.Model):
+    """Запись журнала генерации: показанный образ и его оценка
+
+    Журнал только дополняется; по нему можно заново посчитать Compatibility
+    по другому правилу обучения (manage.py rebuild_compatibility).
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    item_ids = models.JSONField(verbose_name="Вещи образа")
+    categories = models.JSONField(default=list, verbose_name="Категории")
+    # Вероятность выбора каждой вещи генератором (None - образ собран не генератором)
+    weights = models.JSONField(default=list, verbose_name="Веса выбора")
+    rating = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Оценка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата")
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.item_ids} ({self.rating or '-'})"
+    
+    class Meta:
+        verbose_name = "Событие генерации"
+        verbose_name_plural = "События генерации"
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(rating__isnull=False), name='generationevent_rated_idx'),
+        ]
+
+
+class ItemEmbedding(models.Model):
+    """Вектор вещи в модели совместимости (матричное разложение)
+
+    Совместимость пары - скалярное произведение векторов плюс смещения
+    обеих вещей, поэтому оцениваются и пары, которые еще не оценивались.
+    Вектор хранится как float32 в байтах: d * 4 байта на вещь.
+    """
+    
+    item = models.OneToOneField(ClothingItem, on_delete=models.CASCADE, primary_key=True, related_name='embedding', verbose_name="Вещь")
+    vector = models.BinaryField(verbose_name="Вектор (float32)")
+    bias = models.FloatField(default=0, verbose_name="Смещение")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлен")
+    
+    def __str__(self):
+        return f"{self.item_id}: {len(self.vector) // 4}"
+    
+    class Meta:
+        verbose_name = "Вектор вещи"
+        verbose_name_plural = "Векторы вещей"
+
+
+class ImageJob(models.Model):
+    """Задача фоновой обработки фото вещи"""
+    
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+    
+    item = models.ForeignKey(ClothingItem, on_delete=models.CASCADE, related_name='image_jobs', verbose_name="Вещь")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Доступна с")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    
+    def __str__(self):
+        return f"{self.item_id}: {self.get_status_display()}"
+    
+    class Meta:
+        verbose_name = "Задача обработки фото"
+        verbose_name_plural = "Задачи обработки фото"
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='imagejob_status_available_idx'),
+        ]
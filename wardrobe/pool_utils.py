@@ -0,0 +1,172 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import ClothingItem, OutfitPool
+from .generation_utils import OutfitEngine
+
+
+POOL_SIZE = getattr(settings, 'OUTFIT_POOL_SIZE', 20)
+POOL_TIMEOUT = getattr(settings, 'OUTFIT_POOL_TIMEOUT', 60 * 60 * 24)
+
+# Пул пополняется в фоне, когда в нем остается меньше образов
+POOL_LOW_WATERMARK = POOL_SIZE // 4
+
+
+def _categories_key(categories):
+    return ','.join(sorted(categories))
+
+
+def _pool_key(user_id, categories):
+    return f'outfit_pool:{user_id}:{_categories_key(categories)}'
+
+
+def get_pool_category_sets(user_id):
+    """Наборы категорий, для которых у пользователя ведутся пулы"""
+    return [
+        categories.split(',')
+        for categories in OutfitPool.objects.filter(user_id=user_id).values_list('categories', flat=True)
+    ]
+
+
+def get_outfit_pool(user_id, categories):
+    return OutfitPool.objects.filter(user_id=user_id, categories=_categories_key(categories)).first()
+
+
+def build_pool(user_id, categories, size=POOL_SIZE):
+    """Генерирует набор образов, загружая гардероб один раз"""
+    engine = OutfitEngine.for_user(user_id, categories)
+    valid_categories = [
+        category
+        for category, candidates in zip(engine.categories, engine.candidates)
+        if len(candidates)
+    ]
+
+    if len(valid_categories) < 2:
+        return []
+
+    pool = []
+    for _ in range(size):
+        items = engine.generate()
+        if items:
+            pool.append({
+                'item_ids': [item.id for item in items],
+                'categories': valid_categories,
+                'weights': [item.selection_weight for item in items],
+            })
+
+    return pool
+
+
+def refill_pool(user_id, categories, size=POOL_SIZE):
+    """Заполняет пул образов пользователя для набора категорий
+
+    Каждый образ хранится в кэше под своим ключом, а поколение, размер и
+    номер следующего образа - в строке OutfitPool. Новое поколение
+    заменяет прежний пул целиком, когда его образы уже записаны в кэш.
+    """
+    pool = build_pool(user_id, categories, size)
+    key = _pool_key(user_id, categories)
+    generation = time.time_ns()
+    cache.set_many(
+        {f'{key}:{generation}:{position}': outfit for position, outfit in enumerate(pool)},
+        POOL_TIMEOUT,
+    )
+    OutfitPool.objects.update_or_create(
+        user_id=user_id,
+        categories=_categories_key(categories),
+        defaults={'generation': generation, 'size': len(pool), 'position': 0},
+    )
+    return len(pool)
+
+
+def refill_pools(user_id, category_sets):
+    for categories in category_sets:
+        refill_pool(user_id, categories)
+        cache.delete(f'{_pool_key(user_id, categories)}:refilling')
+
+
+def _refill_in_background(user_id, category_sets):
+    try:
+        refill_pools(user_id, category_sets)
+    finally:
+        connection.close()
+
+
+def schedule_pool_refill(user_id, categories=None):
+    """Пополняет пулы в фоновом потоке после фиксации транзакции
+
+    Без категорий пополняются все пулы пользователя. С POOL_REFILL_SYNC
+    пулы пополняются сразу в том же потоке (в тестах).
+    """
+    category_sets = [categories] if categories else get_pool_category_sets(user_id)
+    if not category_sets:
+        return
+
+    if getattr(settings, 'POOL_REFILL_SYNC', False):
+        transaction.on_commit(lambda: refill_pools(user_id, category_sets))
+        return
+
+    def start():
+        threading.Thread(
+            target=_refill_in_background,
+            args=(user_id, category_sets),
+            daemon=True,
+        ).start()
+
+    transaction.on_commit(start)
+
+
+def claim_outfit(pool, position):
+    """Забирает образ position пула; False, если его уже забрал другой запрос
+
+    Как claim_job: условный UPDATE срабатывает только у одного запроса,
+    прочитавшего этот номер, и только пока пул не пересобран.
+    """
+    return bool(OutfitPool.objects.filter(
+        pk=pool.pk, generation=pool.generation, position=position,
+    ).update(position=position + 1))
+
+
+def pop_outfit(user, categories):
+    """Достает следующий готовый образ из пула
+
+    Возвращает (вещи, категории) или (None, None), если пул пуст.
+    """
+    key = _pool_key(user.id, categories)
+    pool = get_outfit_pool(user.id, categories)
+
+    if pool is None:
+        schedule_pool_refill(user.id, categories)
+        return None, None
+
+    position = pool.position
+    outfit = None
+    while outfit is None and position < pool.size:
+        if not claim_outfit(pool, position):
+            # Образ забрал другой запрос или пул пересобран - читаем пул заново
+            pool.refresh_from_db(fields=['generation', 'size', 'position'])
+            position = pool.position
+            continue
+        candidate = cache.get(f'{key}:{pool.generation}:{position}')
+        position += 1
+        if candidate is None:
+            continue
+        items = list(ClothingItem.objects.filter(id__in=candidate['item_ids'], user=user))
+        if len(items) == len(candidate['item_ids']):
+            outfit = candidate
+
+    # Не запускаем повторное пополнение, пока предыдущее не завершилось
+    if pool.size - position <= POOL_LOW_WATERMARK and cache.add(f'{key}:refilling', True, 60):
+        schedule_pool_refill(user.id, categories)
+
+    if outfit is None:
+        return None, None
+
+    items_by_id = {item.id: item for item in items}
+    for item_id, weight in zip(outfit['item_ids'], outfit.get('weights', [])):
+        items_by_id[item_id].selection_weight = weight
+    return [items_by_id[item_id] for item_id in outfit['item_ids']], outfit['categories']
@@ -0,0 +1,93 @@
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_ALIAS = 'default'
+
+# После записи чтения браузера идут в основную базу столько секунд, пока
+# реплика не догонит ее; для снимка SQLite - не меньше интервала между снимками
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+REPLICA_PIN_COOKIE = 'db_pin'
+
+# Сессии и пользователи всегда читаются из основной базы: в снимке
+# может не оказаться только что созданной сессии
+PRIMARY_ONLY_APPS = {'auth', 'sessions', 'contenttypes'}
+
+_state = threading.local()
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def reads_from_replica(view):
+    """Декоратор представления, которое только читает: его запросы идут в реплику"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        previous = getattr(_state, 'replica', False)
+        _state.replica = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = previous
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтение из реплики в представлениях с reads_from_replica, запись - в основную базу
+
+    Реплика используется, только если в DATABASES есть алиас replica, и
+    не используется для браузера, который недавно писал (ReplicaPinMiddleware).
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.app_label not in PRIMARY_ONLY_APPS
+            and getattr(_state, 'replica', False)
+            and not getattr(_state, 'pinned', False)
+            and replica_configured()
+        ):
+            return REPLICA_ALIAS
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return {obj1._state.db, obj2._state.db} <= {PRIMARY_ALIAS, REPLICA_ALIAS}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет чтения за основной базой после записи, чтобы пользователь видел свои изменения
+
+    Запрос, в котором была запись, ставит cookie на REPLICA_PIN_SECONDS;
+    пока она есть, запросы этого браузера читают из основной базы. Cookie,
+    а не ключ в кэше: она приходит с самим запросом, и проверка не требует
+    обращения к кэшу на каждом чтении.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.pinned = REPLICA_PIN_COOKIE in request.COOKIES
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                response.set_cookie(
+                    REPLICA_PIN_COOKIE, '1',
+                    max_age=REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+                )
+            return response
+        finally:
+            _state.pinned = False
+            _state.wrote = False
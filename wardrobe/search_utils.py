@@ -0,0 +1,97 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import F, Q
+
+from .models import ClothingItem, ClothingItemSearch, Outfit, OutfitSearch
+
+
+SEARCH_MODELS = {
+    ClothingItem: ClothingItemSearch,
+    Outfit: OutfitSearch,
+}
+
+# Слов запроса учитывается не больше этого числа
+MAX_SEARCH_TERMS = 10
+
+
+def normalize(text):
+    """Текст для индекса и запроса: ё и е не различаются"""
+    return (text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def match_expression(query, user_id=None):
+    """Выражение FTS5 MATCH из строки пользователя или None, если в ней нет слов
+
+    Каждое слово ищется по началу ("руб" находит "рубашка") в названии
+    и описании; все слова должны встретиться. Синтаксис FTS5 из запроса
+    не используется, поэтому кавычки и операторы в нем безопасны.
+    """
+    terms = re.findall(r'\w+', normalize(query))[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+
+    expression = '{name description} : (' + ' AND '.join(f'"{term}"*' for term in terms) + ')'
+    if user_id is not None:
+        expression = f'owner : "u{user_id}" AND {expression}'
+    return expression
+
+
+def full_text_available(using):
+    return connections[using].vendor == 'sqlite'
+
+
+def search(queryset, query, user_id=None):
+    """Записи queryset, найденные по запросу
+
+    В SQLite поиск идет по индексу FTS5 и добавляет аннотацию search_rank
+    (bm25, меньше - релевантнее). В других базах - icontains по названию
+    и описанию без ранжирования.
+    """
+    if full_text_available(queryset.db):
+        expression = match_expression(query, user_id)
+        if expression is None:
+            return queryset.none()
+        queryset = queryset.filter(search_index__document__match=expression)
+        return queryset.annotate(search_rank=F('search_index__rank'))
+
+    return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+
+
+def index_object(obj):
+    """Добавляет или обновляет вещь или образ в полнотекстовом индексе"""
+    if not full_text_available('default'):
+        return
+    table = SEARCH_MODELS[type(obj)]._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {table}(rowid, owner, name, description) VALUES (%s, %s, %s, %s)',
+            [obj.pk, f'u{obj.user_id}', normalize(obj.name), normalize(obj.description)],
+        )
+
+
+def unindex_object(obj):
+    """Удаляет вещь или образ из полнотекстового индекса"""
+    if not full_text_available('default'):
+        return
+    table = SEARCH_MODELS[type(obj)]._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [obj.pk])
+
+
+def rebuild_search_index(model):
+    """Перестраивает индекс модели целиком одним INSERT ... SELECT; возвращает число записей"""
+    if not full_text_available('default'):
+        return 0
+    table = SEARCH_MODELS[model]._meta.db_table
+    source = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(
+            f"INSERT INTO {table}(rowid, owner, name, description) "
+            f"SELECT id, 'u' || user_id, "
+            f"replace(replace(name, 'ё', 'е'), 'Ё', 'Е'), "
+            f"replace(replace(description, 'ё', 'е'), 'Ё', 'Е') FROM {source}"
+        )
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    return model.objects.count()
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ClothingItem, Outfit
+from .cache_utils import bump_wardrobe_version
+from .pool_utils import schedule_pool_refill
+from .image_utils import acquire_image_blob, delete_renditions, discard_upload, release_image_blob
+from .storage import is_incoming
+from .search_utils import index_object, unindex_object
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к каждому новому соединению SQLite
+
+    WAL позволяет читать во время записи, busy_timeout - ждать блокировку
+    вместо ошибки "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if 'mode=ro' in str(connection.settings_dict['NAME']):
+        # Снимок-реплика открыт только на чтение, режим журнала в нем не меняется
+        pragmas.pop('journal_mode', None)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_save, sender=ClothingItem)
+@receiver(post_delete, sender=ClothingItem)
+def refill_outfit_pools(sender, instance, **kwargs):
+    """Пересобирает пулы образов при изменении гардероба"""
+    schedule_pool_refill(instance.user_id)
+
+
+@receiver(post_save, sender=ClothingItem)
+@receiver(post_delete, sender=ClothingItem)
+@receiver(post_save, sender=Outfit)
+@receiver(post_delete, sender=Outfit)
+def update_wardrobe_version(sender, instance, **kwargs):
+    """Сбрасывает кэши пользователя при изменении вещей и образов"""
+    bump_wardrobe_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Outfit.items.through)
+def update_wardrobe_version_on_outfit_items(sender, instance, action, **kwargs):
+    """Сбрасывает кэши пользователя при изменении состава образа"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_wardrobe_version(instance.user_id)
+
+
+@receiver(post_save, sender=ClothingItem)
+def acquire_item_image(sender, instance, **kwargs):
+    """Учитывает ссылку вещи на файл фото в хранилище по содержимому"""
+    acquire_image_blob(instance)
+
+
+@receiver(post_delete, sender=ClothingItem)
+def release_item_image(sender, instance, **kwargs):
+    """Освобождает файл фото удаленной вещи
+
+    Фото и копии удаляются, только когда на файл не ссылается ни одна вещь.
+    Копии фото, загруженных до хранилища по содержимому, удаляются сразу,
+    как и еще не обработанная загрузка под временным именем.
+    """
+    if instance.image_blob_id:
+        release_image_blob(instance.image_blob_id)
+    else:
+        delete_renditions(instance)
+        if is_incoming(instance.image.name):
+            discard_upload(instance.image.name)
+
+
+SEARCH_FIELDS = {'name', 'description', 'user', 'user_id'}
+
+
+@receiver(post_save, sender=ClothingItem)
+@receiver(post_save, sender=Outfit)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """Обновляет запись в полнотекстовом индексе при изменении названия или описания"""
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        index_object(instance)
+
+
+@receiver(post_delete, sender=ClothingItem)
+@receiver(post_delete, sender=Outfit)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Удаляет удаленную вещь или образ из полнотекстового индекса"""
+    unindex_object(instance)
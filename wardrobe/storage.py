@@ -0,0 +1,93 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+# Одинаковые форматы с разными расширениями хранятся под одним
+EXTENSION_ALIASES = {
+    '.jpeg': '.jpg',
+    '.jpe': '.jpg',
+    '.jfif': '.jpg',
+    '.tif': '.tiff',
+}
+
+# Каталог (внутри upload_to) загрузок, которые фоновая задача еще не
+# перенесла в хранилище по содержимому
+INCOMING_DIR = 'incoming'
+
+CONTENT_ADDRESSED_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})\.\w+$')
+
+
+def content_hash(name):
+    """SHA-256 из пути файла в хранилище по содержимому или None"""
+    match = CONTENT_ADDRESSED_NAME.search(name or '')
+    return match.group('sha256') if match else None
+
+
+def is_incoming(name):
+    """Загрузка под временным именем, еще не перенесенная в хранилище по содержимому"""
+    return os.path.basename(os.path.dirname(name or '')) == INCOMING_DIR
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где путь файла определяется его содержимым
+
+    Файл сохраняется как <каталог>/<первые 2 символа хэша>/<sha256>.<расширение>.
+    Одинаковое содержимое попадает в один и тот же файл, поэтому повторная
+    загрузка того же фото не занимает места - даже под другим расширением. Содержимое по пути никогда
+    не меняется, и такие файлы можно кэшировать без срока.
+
+    Удалять файлы напрямую нельзя - на них могут ссылаться несколько вещей,
+    учет ссылок ведет ImageBlob. Файлы в каталоге INCOMING_DIR сохраняются
+    как есть, без хэширования: их переносит фоновая задача (store_upload).
+    """
+
+    def save(self, name, content, max_length=None):
+        if is_incoming(name):
+            return super().save(name, content, max_length=max_length)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.content_addressed_name(name, content)
+        existing = self.existing_name(name)
+        if existing:
+            return existing
+        return super().save(name, content, max_length=max_length)
+
+    def existing_name(self, name):
+        """Уже сохраненный файл с тем же хэшем под любым расширением или None"""
+        if self.exists(name):
+            return name
+        directory, filename = os.path.split(name)
+        digest = os.path.splitext(filename)[0]
+        try:
+            files = self.listdir(directory)[1]
+        except FileNotFoundError:
+            return None
+        for file in files:
+            if os.path.splitext(file)[0] == digest:
+                return f'{directory}/{file}'
+        return None
+
+    def content_addressed_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+
+        digest = sha256.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        extension = EXTENSION_ALIASES.get(extension, extension)
+        return f'{directory}/{digest[:2]}/{digest}{extension}'.lstrip('/')
+
+
+def get_image_storage():
+    """Хранилище фото вещей; в миграции попадает ссылка на функцию, а не объект"""
+    return image_storage
+
+
+image_storage = ContentAddressedStorage()
@@ -1,11 +1,55 @@
-from django.test import TestCase, Client
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+
+from PIL import Image
+
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.conf import settings
+from django.http import HttpResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 
-from .models import ClothingItem, Outfit, Compatibility
+from .models import ClothingItem, Outfit, Compatibility, GenerationEvent, GenerationSession, ImageBlob, ImageJob, ItemEmbedding, RenditionFile
 from .forms import ClothingItemForm, OutfitForm, CustomUserCreationForm, GenerateOutfitForm
 from .utils import get_display_from_comma_separated
+from .generation_utils import (
+    EmbeddingScorer,
+    HeuristicScorer,
+    OutfitEngine,
+    ThompsonScorer,
+    UCBScorer,
+    generate_outfit_algorithm,
+    generate_top_outfits,
+    get_categories_with_items,
+    get_learning_rule,
+    update_compatibility_scores,
+)
+from .pool_utils import _pool_key, claim_outfit, get_outfit_pool, pop_outfit, refill_pool
+from .analytics_utils import AnalyticsSnapshot, get_usage_statistics
+from .filter_utils import PAGE_SIZE, filter_clothing_items, paginate_by_cursor
+from .image_utils import RENDITION_FORMATS, RENDITION_SIZES, perceptual_hash, process_item_image, stage_upload
+from .storage import content_hash, is_incoming
+from .checks import check_shared_cache
+from .cache_utils import get_wardrobe_version
+from .embedding_utils import EMBEDDING_DIM, load_embeddings, update_item_embeddings
+from .evaluation_utils import evaluate_scorer, rated_events
+from .event_utils import EventBuffer, event_buffer, flush_generation_events
+from .bitmap_utils import ItemBitmapIndex, get_item_index
+from .facet_utils import FACET_CHOICES, facet_counts
+from .search_utils import match_expression, rebuild_search_index, search
+from .routers import REPLICA_PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter, reads_from_replica
+from .job_utils import IMAGE_JOB_MAX_ATTEMPTS, claim_job, enqueue_image_job, queue_metrics, run_pending_jobs
 
 
 class ModelTests(TestCase):
@@ -59,6 +103,31 @@ class ModelTests(TestCase):
         self.assertIn('В офис', occasions)
         self.assertIn('Любой', occasions)
 
+    def test_clothing_item_season_bitmask(self):
+        """Сезоны и мероприятия хранятся битовой маской"""
+        self.clothing_item.refresh_from_db()
+        # winter=1, spring=2, summer=4, autumn=8
+        self.assertEqual(self.clothing_item.season, 6)
+        self.assertEqual(self.clothing_item.occasion, 17)
+        
+        self.clothing_item.season = ['autumn']
+        self.assertEqual(self.clothing_item.season, 8)
+        self.assertEqual(self.clothing_item.get_seasons_display(), 'Осень')
+
+    def test_clothing_item_has_lookup(self):
+        """Фильтр по сезону находит только вещи с отмеченным сезоном"""
+        summer = ClothingItem.objects.filter(user=self.user, season__has='summer')
+        winter = ClothingItem.objects.filter(user=self.user, season__has='winter')
+        
+        self.assertEqual(set(summer), {self.clothing_item, self.clothing_item2})
+        self.assertEqual(list(winter), [self.clothing_item2])
+        self.assertFalse(ClothingItem.objects.filter(season__has='autumn').exists())
+        self.assertFalse(ClothingItem.objects.filter(season__has='summ').exists())
+        self.assertEqual(
+            list(ClothingItem.objects.filter(occasion__has=['office', 'walk'])),
+            [self.clothing_item2]
+        )
+
     def test_outfit_creation(self):
         """Тестирование создания образа"""
         outfit = Outfit.objects.create(
@@ -205,6 +274,7 @@ class FormTests(TestCase):
 
 class ViewTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -267,6 +337,163 @@ class ViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Мои образы')
 
+    def test_add_clothing_item_view_post(self):
+        """Добавление вещи сохраняет выбранные сезоны и мероприятия"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, format='JPEG')
+        image_file = SimpleUploadedFile('shirt.jpg', buffer.getvalue(), content_type='image/jpeg')
+        
+        self.client.login(username='testuser', password='testpass123')
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse('wardrobe:add_item'), {
+                'name': 'New Shirt',
+                'image': image_file,
+                'color': 'red',
+                'category': 'top',
+                'season': ['summer', 'spring'],
+                'occasion': ['walk'],
+                'rating': 5,
+            })
+        
+        self.assertEqual(response.status_code, 302)
+        item = ClothingItem.objects.get(name='New Shirt')
+        self.assertEqual(item.get_seasons_display(), 'Весна, Лето')
+        self.assertEqual(item.get_occasion_display(), 'На прогулку')
+        
+        # Фото хэшируется и обрабатывается в фоне, а не в запросе
+        self.assertEqual(item.image_status, ClothingItem.IMAGE_PROCESSING)
+        self.assertEqual(item.renditions, {})
+        self.assertTrue(is_incoming(item.image.name))
+        self.assertIsNone(item.image_blob)
+        self.assertTrue(ImageJob.objects.filter(item=item, status=ImageJob.PENDING).exists())
+        
+        incoming = item.image.name
+        with override_settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            run_pending_jobs()
+            item.refresh_from_db()
+            self.assertEqual(content_hash(item.image.name), item.image_blob.sha256)
+            self.assertEqual(item.image_hash, item.image_blob.sha256)
+        self.assertFalse(os.path.exists(os.path.join(media_root, incoming)))
+
+    def test_wardrobe_list_season_filter(self):
+        """Фильтр гардероба по сезону и мероприятию"""
+        ClothingItem.objects.create(
+            user=self.user,
+            name='Winter Coat',
+            color='black',
+            category='outer',
+            season='winter,autumn',
+            occasion='walk'
+        )
+        
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('wardrobe:wardrobe_list'), {'season': 'winter'})
+        self.assertEqual([item.name for item in response.context['items']], ['Winter Coat'])
+        
+        response = self.client.get(reverse('wardrobe:wardrobe_list'), {'occasion': 'office'})
+        self.assertEqual(len(response.context['items']), 2)
+
+    def test_outfit_list_occasion_filter(self):
+        """Образ с несколькими мероприятиями находится по любому из них"""
+        outfit = Outfit.objects.create(
+            user=self.user,
+            name='Test Outfit',
+            occasion='office,party',
+            rating=4
+        )
+        
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('wardrobe:outfit_list'), {'occasion': 'party'})
+        self.assertEqual(list(response.context['outfits']), [outfit])
+        
+        response = self.client.get(reverse('wardrobe:outfit_list'), {'occasion': 'home'})
+        self.assertEqual(list(response.context['outfits']), [])
+
+    def create_outfits(self, count):
+        for i in range(count):
+            outfit = Outfit.objects.create(user=self.user, name=f'Outfit {i}', occasion='office')
+            outfit.items.add(self.clothing_item1, self.clothing_item2)
+
+    def test_outfit_cards_constant_queries(self):
+        """Число запросов списка образов и главной не зависит от числа образов"""
+        self.client.login(username='testuser', password='testpass123')
+        self.create_outfits(1)
+
+        query_counts = {}
+        for url_name in ('wardrobe:outfit_list', 'wardrobe:home'):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse(url_name))
+            query_counts[url_name] = len(queries)
+
+        self.create_outfits(5)
+        for url_name, query_count in query_counts.items():
+            with self.assertNumQueries(query_count):
+                response = self.client.get(reverse(url_name))
+            self.assertContains(response, '2 вещей')
+
+    def test_outfit_modal_view(self):
+        """Модальное окно образа показывает вещи и их количество"""
+        self.create_outfits(1)
+        outfit = Outfit.objects.get(user=self.user)
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('wardrobe:outfit_modal', args=[outfit.id]))
+        self.assertContains(response, 'Вещи в образе (2)')
+        self.assertContains(response, 'Test Item 1')
+
+    def test_paginate_by_cursor(self):
+        """Страницы по курсору не теряют и не повторяют вещи с одинаковой датой"""
+        ClothingItem.objects.bulk_create([
+            ClothingItem(user=self.user, name=f'Item {i}', color='red', category='top', season='summer')
+            for i in range(4)
+        ])
+        items = ClothingItem.objects.filter(user=self.user)
+
+        seen = []
+        page, cursor = paginate_by_cursor(items, page_size=2)
+        seen.extend(page)
+        while cursor:
+            page, cursor = paginate_by_cursor(items, cursor, page_size=2)
+            seen.extend(page)
+
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(
+            [item.id for item in seen],
+            list(items.order_by('-created_at', '-id').values_list('id', flat=True))
+        )
+
+    def test_wardrobe_list_page_keeps_filters(self):
+        """Ссылка на следующую страницу сохраняет фильтры"""
+        ClothingItem.objects.bulk_create([
+            ClothingItem(user=self.user, name=f'Top {i}', color='red', category='top', season='summer')
+            for i in range(PAGE_SIZE)
+        ])
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('wardrobe:wardrobe_list'), {'category': 'top'})
+        self.assertEqual(len(response.context['items']), PAGE_SIZE)
+        next_query = response.context['next_page_query']
+        self.assertIn('category=top', next_query)
+        self.assertIn('cursor=', next_query)
+
+        response = self.client.get(f"{reverse('wardrobe:wardrobe_list_page')}?{next_query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['items']), 1)
+        self.assertEqual(response.context['next_page_query'], '')
+        self.assertNotContains(response, 'infinite-scroll-sentinel')
+
+    def test_outfit_list_page_invalid_cursor(self):
+        """Поврежденный курсор возвращает первую страницу"""
+        Outfit.objects.create(user=self.user, name='Test Outfit', occasion='office', rating=4)
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('wardrobe:outfit_list_page'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['outfits']), 1)
+
     def test_analytics_view_with_items(self):
         """Тестирование страницы аналитики с вещами"""
         self.client.login(username='testuser', password='testpass123')
@@ -355,3 +582,1210 @@ class ViewTests(TestCase):
         
         response = self.client.get(reverse('wardrobe:generate_outfit'))
         self.assertEqual(response.status_code, 302)
+
+
+
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def create_photo_item(self, size=(1200, 800), orientation=None, description=None, filename='photo.jpg'):
+        """Вещь с JPEG-фото, при необходимости с EXIF-ориентацией и описанием"""
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        if description:
+            exif[0x010e] = description
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'blue').save(buffer, format='JPEG', exif=exif)
+
+        return ClothingItem.objects.create(
+            user=self.user,
+            name='Photo Shirt',
+            image=SimpleUploadedFile(filename, buffer.getvalue(), content_type='image/jpeg'),
+            color='blue',
+            category='top',
+            season='summer',
+        )
+
+    def test_process_item_image(self):
+        """Копии всех размеров в WebP и JPEG, повернутые по EXIF и без метаданных"""
+        # Ориентация 6 - снимок повернут на 90°, на экране он вертикальный
+        item = self.create_photo_item(orientation=6)
+        renditions = process_item_image(item)
+
+        self.assertEqual(set(renditions), set(RENDITION_SIZES))
+        storage = item.image.storage
+        for name, size in RENDITION_SIZES.items():
+            for fmt in RENDITION_FORMATS:
+                with storage.open(renditions[name][fmt]) as file:
+                    image = Image.open(file)
+                    self.assertEqual(max(image.size), size)
+                    self.assertLess(image.width, image.height)
+                    self.assertNotIn(0x0112, image.getexif())
+
+        item.refresh_from_db()
+        self.assertEqual(item.renditions, renditions)
+
+    def test_item_card_uses_srcset(self):
+        """Карточка вещи отдает копии через srcset вместо оригинала"""
+        item = self.create_photo_item()
+        process_item_image(item)
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('wardrobe:wardrobe_list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f"{item.rendition_urls['card']['jpeg']} 440w")
+        self.assertNotContains(response, f'src="{item.image.url}"')
+
+    def test_delete_item_removes_renditions(self):
+        """Удаление вещи удаляет файлы копий"""
+        item = self.create_photo_item()
+        renditions = process_item_image(item)
+        storage = item.image.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        for rendition in renditions.values():
+            self.assertFalse(storage.exists(rendition['webp']))
+            self.assertFalse(storage.exists(rendition['jpeg']))
+
+    def test_same_photo_is_stored_once(self):
+        """Повторная загрузка того же фото ссылается на тот же файл"""
+        first = self.create_photo_item()
+        second = self.create_photo_item()
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(content_hash(first.image.name), hashlib.sha256(first.image.read()).hexdigest())
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(first.image_blob, blob)
+
+        # Копии второй вещи берутся готовыми у файла фото
+        renditions = process_item_image(first)
+        second.refresh_from_db()
+        with mock.patch('wardrobe.image_utils.open_upright') as open_upright:
+            self.assertEqual(process_item_image(second), renditions)
+        open_upright.assert_not_called()
+
+        blob.refresh_from_db()
+        self.assertEqual(len(blob.phash), 16)
+
+    def test_blob_released_with_last_reference(self):
+        """Файл фото удаляется только вместе с последней ссылающейся вещью"""
+        first = self.create_photo_item()
+        second = self.create_photo_item()
+        process_item_image(first)
+        storage = first.image.storage
+        path = first.image.name
+
+        self.client.login(username='testuser', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('wardrobe:delete_item', args=[first.id]))
+        self.assertTrue(storage.exists(path))
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('wardrobe:delete_item', args=[second.id]))
+        self.assertFalse(storage.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+        for rendition in first.renditions.values():
+            self.assertFalse(storage.exists(rendition['jpeg']))
+
+    def test_shared_renditions_outlive_one_photo(self):
+        """Копии, совпавшие у двух разных фото, удаляются только вместе с последним"""
+        # Фото отличаются только EXIF: файлы разные, а копии без метаданных одинаковые
+        first = self.create_photo_item(description='first')
+        second = self.create_photo_item(description='second')
+        self.assertNotEqual(first.image_blob_id, second.image_blob_id)
+        self.assertEqual(process_item_image(first), process_item_image(second))
+        storage = first.image.storage
+        paths = [rendition['jpeg'] for rendition in first.renditions.values()]
+        self.assertEqual(RenditionFile.objects.filter(path__in=paths).count(), 2 * len(paths))
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(storage.exists(path) for path in paths))
+        # Владельцы файлов ищутся по индексу пути, а не LIKE по JSON копий
+        self.assertFalse([query['sql'] for query in queries if 'LIKE' in query['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(storage.exists(path) for path in paths))
+
+    def test_same_photo_with_other_extension(self):
+        """Те же байты под другим расширением не создают второй файл"""
+        items = [self.create_photo_item(filename=name) for name in ('photo.jpg', 'photo.JPEG', 'photo.png')]
+
+        self.assertEqual({item.image.name for item in items}, {items[0].image.name})
+        self.assertTrue(items[0].image.name.endswith('.jpg'))
+        self.assertEqual(ImageBlob.objects.get().ref_count, 3)
+
+    def test_perceptual_hash_of_similar_photos(self):
+        """Перцептивный хэш почти не меняется при уменьшении и пересжатии фото"""
+        image = Image.radial_gradient('L').convert('RGB').resize((800, 600))
+        buffer = io.BytesIO()
+        image.resize((400, 300)).save(buffer, format='JPEG', quality=60)
+        similar = Image.open(buffer)
+        other = image.transpose(Image.FLIP_LEFT_RIGHT).rotate(90)
+
+        def distance(first, second):
+            return bin(int(perceptual_hash(first), 16) ^ int(perceptual_hash(second), 16)).count('1')
+
+        self.assertLessEqual(distance(image, similar), 4)
+        self.assertGreater(distance(image, other), 4)
+
+    def test_served_blob_is_cached_forever(self):
+        """Фото из хранилища по содержимому отдаются с бессрочным кэшем"""
+        item = self.create_photo_item()
+        response = self.client.get(item.image.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_backfill_renditions_command(self):
+        """Команда создает копии только для вещей без них"""
+        item = self.create_photo_item()
+        output = io.StringIO()
+        call_command('backfill_renditions', stdout=output)
+
+        item.refresh_from_db()
+        self.assertEqual(set(item.renditions), set(RENDITION_SIZES))
+        self.assertIn('вещей 1', output.getvalue())
+
+        call_command('backfill_renditions', stdout=output)
+        self.assertIn('вещей 0', output.getvalue())
+
+
+class ImageJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def create_item(self, content):
+        """Вещь, добавленная как в add_clothing_item: фото под временным именем и задача в очереди"""
+        item = ClothingItem(
+            user=self.user,
+            name='Queued Shirt',
+            image=SimpleUploadedFile('queued.jpg', content, content_type='image/jpeg'),
+            color='blue',
+            category='top',
+            season='summer',
+            image_status=ClothingItem.IMAGE_PROCESSING,
+        )
+        stage_upload(item)
+        item.save()
+        return item, enqueue_image_job(item)
+
+    def test_unprocessed_upload_deleted_with_item(self):
+        """Загрузка, которую еще не обработали, удаляется вместе с вещью"""
+        item, job = self.create_item(b'not processed yet')
+        path = item.image.path
+        self.assertTrue(os.path.exists(path))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_run_pending_jobs(self):
+        """Обработчик создает копии, считает хэш и переводит вещь в ready"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), 'green').save(buffer, format='JPEG')
+        item, job = self.create_item(buffer.getvalue())
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        job.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(item.image_status, ClothingItem.IMAGE_READY)
+        self.assertEqual(item.image_hash, hashlib.sha256(buffer.getvalue()).hexdigest())
+        self.assertEqual(set(item.renditions), set(RENDITION_SIZES))
+
+        metrics = queue_metrics()
+        self.assertEqual(metrics['done'], 1)
+        self.assertEqual(metrics['pending'], 0)
+        self.assertEqual(metrics['done_last_hour'], 1)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """Ошибка откладывает задачу, после последней попытки вещь помечается failed"""
+        item, job = self.create_item(b'not an image')
+        self.enterContext(self.assertLogs('wardrobe.job_utils', level='WARNING'))
+
+        self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.PENDING)
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertIn('UnidentifiedImageError', job.last_error)
+
+        # Отложенную задачу обработчик не берет
+        self.assertIsNone(claim_job())
+        self.assertEqual(queue_metrics()['retrying'], 1)
+
+        for attempt in range(job.attempts, IMAGE_JOB_MAX_ATTEMPTS):
+            ImageJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+            run_pending_jobs()
+
+        job.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.FAILED)
+        self.assertEqual(job.attempts, IMAGE_JOB_MAX_ATTEMPTS)
+        self.assertEqual(item.image_status, ClothingItem.IMAGE_FAILED)
+
+    def test_job_is_claimed_once(self):
+        """Взятая задача больше не достается другим обработчикам"""
+        self.create_item(b'not an image')
+
+        self.assertIsNotNone(claim_job())
+        self.assertIsNone(claim_job())
+
+
+class GenerationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        
+        self.items = {}
+        for category in ('top', 'bottom', 'shoes'):
+            self.items[category] = [
+                ClothingItem.objects.create(
+                    user=self.user,
+                    name=f'{category} {i}',
+                    color='black',
+                    category=category,
+                    season='summer',
+                    occasion='office',
+                    rating=3
+                )
+                for i in range(5)
+            ]
+
+    def test_generate_outfit_constant_queries(self):
+        """Генерация образа выполняется за фиксированное число запросов"""
+        index = get_item_index(self.user.id)  # индекс вещей запрос получает один раз
+        with self.assertNumQueries(2):
+            outfit = generate_outfit_algorithm(self.user, ['top', 'bottom', 'shoes'], index)
+        
+        self.assertEqual([item.category for item in outfit], ['top', 'bottom', 'shoes'])
+
+    def test_generate_outfit_does_not_create_compatibility(self):
+        """Генерация не создает записи о совместимости"""
+        generate_outfit_algorithm(self.user, ['top', 'bottom'])
+        self.assertEqual(Compatibility.objects.filter(user=self.user).count(), 0)
+
+    def test_compatibility_matrix_scores(self):
+        """Матрица совместимости симметрична, отсутствующие пары равны 0"""
+        top, bottom = self.items['top'][0], self.items['bottom'][0]
+        Compatibility.objects.create(user=self.user, item1=top, item2=bottom, score=0.5)
+        
+        engine = OutfitEngine.for_user(self.user, ['top', 'bottom'])
+        
+        self.assertAlmostEqual(engine.score(top, bottom), 0.5)
+        self.assertAlmostEqual(engine.score(bottom, top), 0.5)
+        self.assertEqual(engine.score(top, self.items['bottom'][1]), 0)
+
+    def test_candidate_weights_use_all_selected_items(self):
+        """Кандидат оценивается по совместимости со всеми выбранными вещами"""
+        top, bottom = self.items['top'][0], self.items['bottom'][0]
+        shoes = self.items['shoes'][0]
+        Compatibility.objects.create(user=self.user, item1=top, item2=shoes, score=1.0)
+        
+        engine = OutfitEngine.for_user(self.user, ['top', 'bottom', 'shoes'])
+        selected = [engine.index[top.id], engine.index[bottom.id]]
+        weights = engine.candidate_weights(engine.candidates[2], selected)
+        
+        best = engine.items[engine.candidates[2][weights.argmax()]]
+        self.assertEqual(best, shoes)
+        # (3 + 1) * (0.5 + 2) / (0 + 1)
+        self.assertAlmostEqual(float(weights.max()), 10.0)
+
+    def test_generate_top_outfits(self):
+        """Лучевой поиск возвращает лучшие различные образы"""
+        top, bottom = self.items['top'][2], self.items['bottom'][3]
+        Compatibility.objects.create(user=self.user, item1=top, item2=bottom, score=1.0)
+        
+        index = get_item_index(self.user.id)  # индекс вещей запрос получает один раз
+        with self.assertNumQueries(2):
+            outfits = generate_top_outfits(self.user, ['bottom', 'top'], count=3, index=index)
+        
+        self.assertEqual(len(outfits), 3)
+        self.assertEqual(outfits[0], [top, bottom])
+        self.assertEqual(len({tuple(item.id for item in outfit) for outfit in outfits}), 3)
+
+    def test_update_compatibility_scores(self):
+        """Оценка образа обновляет все пары вещей пакетно"""
+        outfit = [self.items['top'][0], self.items['bottom'][0], self.items['shoes'][0]]
+        top, bottom = outfit[0], outfit[1]
+        Compatibility.objects.create(user=self.user, item1=top, item2=bottom, score=0.95, times_evaluated=2)
+        
+        with self.assertNumQueries(5):
+            update_compatibility_scores(self.user, outfit, 5)
+        
+        compatibilities = Compatibility.objects.filter(user=self.user)
+        self.assertEqual(compatibilities.count(), 3)
+        
+        existing = compatibilities.get(item1=top, item2=bottom)
+        self.assertEqual(existing.score, 1.0)
+        self.assertEqual(existing.times_evaluated, 3)
+        
+        for compatibility in compatibilities.exclude(pk=existing.pk):
+            self.assertAlmostEqual(compatibility.score, 0.2)
+            self.assertEqual(compatibility.times_evaluated, 1)
+
+    def test_rate_outfit_updates_times_shown(self):
+        """Низкая оценка увеличивает счетчик показов, высокая - нет"""
+        outfit = [self.items['top'][0], self.items['bottom'][0]]
+        self.client.login(username='testuser', password='testpass123')
+        
+        generation_session = GenerationSession.objects.create(user=self.user)
+        for rating, expected in ((2, 1), (5, 1)):
+            generation_session.set_outfit(outfit, ['top', 'bottom'])
+            generation_session.save()
+            
+            response = self.client.post(reverse('wardrobe:rate_outfit'), {'rating': rating})
+            self.assertEqual(response.status_code, 302)
+            
+            for item in outfit:
+                item.refresh_from_db()
+                self.assertEqual(item.times_shown, expected)
+
+    def test_generation_history_and_undo(self):
+        """Генерация хранит историю образов, undo возвращает предыдущий вместе с оценкой"""
+        self.client.login(username='testuser', password='testpass123')
+        session_data = dict(self.client.session)
+        
+        self.client.post(reverse('wardrobe:generate_outfit'), {'generate': '1', 'categories': ['top', 'bottom']})
+        first = GenerationSession.objects.get(user=self.user).current
+        self.client.post(reverse('wardrobe:rate_outfit'), {'rating': 5})
+        response = self.client.get(reverse('wardrobe:regenerate_outfit'))
+        
+        generation_session = GenerationSession.objects.get(user=self.user)
+        self.assertEqual(generation_session.categories, ['top', 'bottom'])
+        self.assertFalse(generation_session.rated)
+        self.assertEqual(generation_session.history, [{**first, 'rating': 5}])
+        self.assertEqual(len(response.context['history']), 1)
+        self.assertContains(response, 'Предыдущий образ')
+        
+        # Состояние генератора не пишется в сессию
+        self.assertEqual(dict(self.client.session), session_data)
+        
+        self.client.post(reverse('wardrobe:undo_outfit'))
+        generation_session.refresh_from_db()
+        self.assertEqual(generation_session.current, first)
+        self.assertTrue(generation_session.rated)
+        self.assertEqual(generation_session.last_rating, 5)
+        self.assertEqual(generation_session.history, [])
+
+    def test_generation_history_size(self):
+        """В истории остаются только последние HISTORY_SIZE образов"""
+        generation_session = GenerationSession(user=self.user)
+        outfit = [self.items['top'][0], self.items['bottom'][0]]
+        for _ in range(GenerationSession.HISTORY_SIZE + 3):
+            generation_session.set_outfit(outfit, ['top', 'bottom'])
+        
+        self.assertEqual(len(generation_session.history), GenerationSession.HISTORY_SIZE)
+
+
+class GenerationEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.items = [
+            ClothingItem.objects.create(user=self.user, name=f'{category} {i}', color='black', category=category, season='summer')
+            for category in ('top', 'bottom', 'shoes')
+            for i in range(2)
+        ]
+        self.client.login(username='testuser', password='testpass123')
+        
+        # Буфер общий для процесса - события других тестов в него не попадают
+        event_buffer.events.clear()
+        self.addCleanup(event_buffer.events.clear)
+
+    def generate_and_rate(self, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('wardrobe:generate_outfit'), {'generate': '1', 'categories': ['top', 'bottom', 'shoes']})
+            self.client.post(reverse('wardrobe:rate_outfit'), {'rating': rating})
+
+    def test_rate_outfit_logs_event(self):
+        """Сгенерированный и оцененный образ попадают в журнал с весами выбора"""
+        self.generate_and_rate(4)
+        flush_generation_events()
+        
+        generated, rated = GenerationEvent.objects.order_by('id')
+        self.assertIsNone(generated.rating)
+        self.assertEqual(rated.rating, 4)
+        self.assertEqual(rated.item_ids, generated.item_ids)
+        self.assertEqual(rated.categories, ['top', 'bottom', 'shoes'])
+        self.assertEqual(len(rated.weights), 3)
+        for weight in rated.weights:
+            self.assertGreater(weight, 0)
+            self.assertLessEqual(weight, 1)
+
+    def test_event_buffer_bulk_inserts(self):
+        """Буфер пишет события одним запросом, когда набирается size"""
+        buffer = EventBuffer(size=3, interval=60, timer=False)
+        outfit = GenerationEvent(user=self.user, item_ids=[1, 2])
+        
+        with self.assertNumQueries(0):
+            buffer.add(outfit)
+            buffer.add(GenerationEvent(user=self.user, item_ids=[1, 3]))
+        with self.assertNumQueries(1):
+            buffer.add(GenerationEvent(user=self.user, item_ids=[2, 3]))
+        self.assertEqual(GenerationEvent.objects.count(), 3)
+
+    def test_event_buffer_flushes_on_timer(self):
+        """Таймер записывает буфер через interval, даже если новых событий нет"""
+        buffer = EventBuffer(size=10, interval=0.2, timer=True)
+        with mock.patch.object(GenerationEvent.objects, 'bulk_create') as bulk_create:
+            buffer.add(GenerationEvent(user=self.user, item_ids=[1, 2]))
+            buffer.timer.join(5)
+        
+        bulk_create.assert_called_once()
+        self.assertEqual(buffer.events, [])
+        self.assertIsNone(buffer.timer)
+
+    def test_rebuild_compatibility_replays_log(self):
+        """Пересчет по журналу совпадает с онлайн-обновлением и меняется с правилом"""
+        for rating in (5, 1, 4, 5, 2):
+            self.generate_and_rate(rating)
+        flush_generation_events()
+        
+        live = {
+            (pair.item1_id, pair.item2_id): (round(pair.score, 6), pair.times_evaluated)
+            for pair in Compatibility.objects.filter(user=self.user)
+        }
+        
+        call_command('rebuild_compatibility', '--batch-size', '2', stdout=io.StringIO())
+        rebuilt = {
+            (pair.item1_id, pair.item2_id): (round(pair.score, 6), pair.times_evaluated)
+            for pair in Compatibility.objects.filter(user=self.user)
+        }
+        self.assertEqual(rebuilt, live)
+        
+        call_command('rebuild_compatibility', '--rule', 'ema', '--step', '0.5', stdout=io.StringIO())
+        for pair in Compatibility.objects.filter(user=self.user):
+            self.assertLess(abs(pair.score), 1)
+        self.assertNotEqual(
+            {(pair.item1_id, pair.item2_id): round(pair.score, 6) for pair in Compatibility.objects.all()},
+            {key: score for key, (score, times) in live.items()},
+        )
+
+    def test_rebuild_compatibility_per_user(self):
+        """Пары каждого пользователя пересчитываются по его событиям, без событий - удаляются"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        other_items = [
+            ClothingItem.objects.create(user=other, name=f'{category}', color='black', category=category, season='summer')
+            for category in ('top', 'bottom')
+        ]
+        idle = User.objects.create_user(username='idle', password='testpass123')
+        idle_items = [
+            ClothingItem.objects.create(user=idle, name=f'{category}', color='black', category=category, season='summer')
+            for category in ('top', 'bottom')
+        ]
+        Compatibility.objects.create(user=idle, item1=idle_items[0], item2=idle_items[1], score=0.5)
+        GenerationEvent.objects.create(user=self.user, item_ids=[self.items[0].id, self.items[2].id], rating=5)
+        GenerationEvent.objects.create(user=other, item_ids=[item.id for item in other_items], rating=1)
+        GenerationEvent.objects.create(user=self.user, item_ids=[self.items[0].id, self.items[2].id], rating=4)
+        
+        out = io.StringIO()
+        call_command('rebuild_compatibility', '--batch-size', '1', stdout=out)
+        self.assertIn('Пользователей: 2, событий: 3, пар: 2', out.getvalue())
+        
+        pair = Compatibility.objects.get(user=self.user)
+        self.assertEqual((pair.item1_id, pair.item2_id, pair.times_evaluated), (self.items[0].id, self.items[2].id, 2))
+        self.assertLess(Compatibility.objects.get(user=other).score, 0)
+        self.assertFalse(Compatibility.objects.filter(user=idle).exists())
+
+
+class OutfitScorerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.items = {
+            category: [
+                ClothingItem.objects.create(user=self.user, name=f'{category} {i}', color='black', category=category, season='summer', rating=3)
+                for i in range(3)
+            ]
+            for category in ('top', 'bottom', 'shoes')
+        }
+        self.client.login(username='testuser', password='testpass123')
+        event_buffer.events.clear()
+        self.addCleanup(event_buffer.events.clear)
+
+    def test_scorer_from_settings(self):
+        """Модель выбирается настройкой OUTFIT_SCORER по имени или пути к классу"""
+        self.assertIsInstance(OutfitEngine.for_user(self.user, ['top', 'bottom']).scorer, HeuristicScorer)
+        
+        with override_settings(OUTFIT_SCORER='thompson'):
+            self.assertIsInstance(OutfitEngine.for_user(self.user, ['top', 'bottom']).scorer, ThompsonScorer)
+        with override_settings(OUTFIT_SCORER='wardrobe.generation_utils.UCBScorer'):
+            self.assertIsInstance(OutfitEngine.for_user(self.user, ['top', 'bottom']).scorer, UCBScorer)
+
+    def test_rating_updates_posterior(self):
+        """Оценка образа добавляет успехи и неудачи всем парам"""
+        outfit = [self.items['top'][0], self.items['bottom'][0]]
+        update_compatibility_scores(self.user, outfit, 5)
+        update_compatibility_scores(self.user, outfit, 2)
+        
+        pair = Compatibility.objects.get(user=self.user)
+        self.assertAlmostEqual(pair.alpha, 1.25)
+        self.assertAlmostEqual(pair.beta, 0.75)
+
+    def test_thompson_prefers_confident_pair(self):
+        """Сэмплирование Томпсона чаще выбирает пару с уверенно хорошей историей"""
+        top, shoes = self.items['top'][0], self.items['shoes'][1]
+        Compatibility.objects.create(user=self.user, item1=top, item2=shoes, alpha=30, beta=0)
+        for other in (self.items['shoes'][0], self.items['shoes'][2]):
+            Compatibility.objects.create(user=self.user, item1=top, item2=other, alpha=0, beta=30)
+        
+        engine = OutfitEngine.for_user(self.user, ['top', 'shoes'], scorer=ThompsonScorer(seed=1))
+        selected = [engine.index[top.id]]
+        candidates = engine.candidates[1]
+        
+        best = [
+            engine.items[candidates[engine.candidate_weights(candidates, selected, sample=True).argmax()]]
+            for _ in range(20)
+        ]
+        self.assertEqual(best.count(shoes), 20)
+        self.assertEqual(engine.scorer.exploration_rate, 0)
+
+    def test_ucb_total_evaluations_kept_by_engine(self):
+        """Сумма оценок пар для бонуса UCB ведется в движке, а не пересчитывается по матрицам"""
+        top, bottom = self.items['top'][0], self.items['bottom'][0]
+        Compatibility.objects.create(user=self.user, item1=top, item2=bottom, alpha=3, beta=1)
+        engine = OutfitEngine.for_user(self.user, ['top', 'bottom'], scorer=UCBScorer())
+        self.assertEqual(engine.evaluations, 4)
+        
+        engine.learn([engine.index[top.id], engine.index[bottom.id], engine.index[self.items['bottom'][1].id]], 5, get_learning_rule())
+        self.assertAlmostEqual(engine.evaluations, float(engine.alpha.sum() + engine.beta.sum()) / 2)
+
+    def test_outfit_probability_matches_selection_weights(self):
+        """Вероятность образа равна произведению весов выбора из generate"""
+        engine = OutfitEngine.for_user(self.user, ['top', 'bottom', 'shoes'])
+        outfit = engine.generate()
+        positions = [engine.index[item.id] for item in outfit]
+        
+        expected = 1.0
+        for item in outfit:
+            expected *= item.selection_weight
+        self.assertAlmostEqual(engine.outfit_probability(positions), expected, places=5)
+
+    def test_evaluate_scorers_on_log(self):
+        """Офлайн-оценка проигрывает журнал и сравнивает все модели"""
+        for rating in (5, 4, 1, 5, 3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('wardrobe:generate_outfit'), {'generate': '1', 'categories': ['top', 'bottom', 'shoes']})
+                self.client.post(reverse('wardrobe:rate_outfit'), {'rating': rating})
+        flush_generation_events()
+        
+        metrics = evaluate_scorer(HeuristicScorer(), rated_events())
+        self.assertEqual(metrics['events'], 5)
+        self.assertEqual(metrics['ips_events'], 5)
+        self.assertAlmostEqual(metrics['logged_rating'], 3.6)
+        self.assertGreater(metrics['snips'], 0)
+        
+        output = io.StringIO()
+        call_command('evaluate_scorers', stdout=output)
+        for name in ('heuristic', 'thompson', 'ucb', 'embedding'):
+            self.assertIn(f'{name}: событий 5', output.getvalue())
+
+
+class ItemEmbeddingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.items = {
+            category: [
+                ClothingItem.objects.create(user=self.user, name=f'{category} {i}', color='black', category=category, season='summer')
+                for i in range(2)
+            ]
+            for category in ('top', 'bottom', 'shoes')
+        }
+        self.client.login(username='testuser', password='testpass123')
+
+    def log_rating(self, items, rating, times=10):
+        GenerationEvent.objects.bulk_create([
+            GenerationEvent(user=self.user, item_ids=[item.id for item in items], rating=rating)
+            for _ in range(times)
+        ])
+
+    @override_settings(OUTFIT_SCORER='embedding')
+    def test_rate_outfit_updates_embeddings(self):
+        """Оценка образа сразу дообучает векторы его вещей"""
+        self.client.post(reverse('wardrobe:generate_outfit'), {'generate': '1', 'categories': ['top', 'bottom', 'shoes']})
+        self.client.post(reverse('wardrobe:rate_outfit'), {'rating': 5})
+        
+        embeddings = ItemEmbedding.objects.all()
+        self.assertEqual(embeddings.count(), 3)
+        for embedding in embeddings:
+            self.assertEqual(len(embedding.vector), EMBEDDING_DIM * 4)
+            self.assertGreater(embedding.bias, 0)
+
+    def test_rate_outfit_skips_embeddings_for_other_scorers(self):
+        """Векторы не дообучаются, пока модель оценки их не использует"""
+        self.client.post(reverse('wardrobe:generate_outfit'), {'generate': '1', 'categories': ['top', 'bottom', 'shoes']})
+        self.client.post(reverse('wardrobe:rate_outfit'), {'rating': 5})
+        
+        self.assertFalse(ItemEmbedding.objects.exists())
+
+    def test_engine_learns_like_online_update(self):
+        """Движок дообучает векторы столько же шагов, сколько update_item_embeddings"""
+        items = [self.items['top'][0], self.items['bottom'][0], self.items['shoes'][0]]
+        engine = OutfitEngine.for_user(self.user, ['top', 'bottom', 'shoes'], scorer=EmbeddingScorer())
+        positions = [engine.index[item.id] for item in items]
+        engine.learn(positions, 5, get_learning_rule())
+        
+        update_item_embeddings(items, 5)
+        item_ids = sorted(item.id for item in items)
+        vectors, biases = load_embeddings(item_ids)
+        for item_id, vector, bias in zip(item_ids, vectors, biases):
+            position = engine.index[item_id]
+            self.assertAlmostEqual(float(engine.biases[position]), float(bias), places=5)
+            for learned, stored in zip(engine.vectors[position], vector):
+                self.assertAlmostEqual(float(learned), float(stored), places=5)
+
+    def test_embeddings_score_unseen_pairs(self):
+        """Обученные векторы оценивают пары, которые ни разу не оценивались вместе"""
+        top, bottom, shoes = self.items['top'][0], self.items['bottom'][0], self.items['shoes'][0]
+        bad_top, bad_bottom, bad_shoes = self.items['top'][1], self.items['bottom'][1], self.items['shoes'][1]
+        self.log_rating([top, bottom], 5)
+        self.log_rating([bottom, shoes], 5)
+        self.log_rating([bad_top, bad_bottom], 1)
+        self.log_rating([bad_bottom, bad_shoes], 1)
+        
+        call_command('train_embeddings', '--seed', '1', stdout=io.StringIO())
+        self.assertEqual(ItemEmbedding.objects.count(), 6)
+        
+        index = get_item_index(self.user.id)  # индекс вещей запрос получает один раз
+        with self.assertNumQueries(3):
+            engine = OutfitEngine.for_user(self.user, ['top', 'bottom', 'shoes'], scorer=EmbeddingScorer(), index=index)
+        
+        def predict(item1, item2):
+            return engine.scorer.predict(engine, [engine.index[item1.id], engine.index[item2.id]])
+        
+        self.assertGreater(predict(top, bottom), 4)
+        self.assertLess(predict(bad_top, bad_bottom), 2)
+        # top и shoes вместе не оценивались
+        self.assertGreater(predict(top, shoes), predict(bad_top, bad_shoes))
+        self.assertGreater(predict(top, shoes), 3)
+
+
+class SQLiteConnectionTests(TransactionTestCase):
+    def test_pragmas_applied_to_connection(self):
+        """Каждое соединение SQLite получает настройки из SQLITE_PRAGMAS"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_atomic_begins_immediate(self):
+        """Транзакция сразу берет блокировку записи"""
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                ClothingItem.objects.count()
+        
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_snapshot_replica(self):
+        """Снимок - копия основной базы, которую можно открыть только на чтение"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        ClothingItem.objects.create(user=user, name='Shirt', color='black', category='top', season='summer')
+        output = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'replica.sqlite3')
+        
+        call_command('snapshot_replica', '--output', output, stdout=io.StringIO())
+        
+        snapshot = sqlite3.connect(f'file:{output}?mode=ro', uri=True)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(snapshot.execute('SELECT name FROM wardrobe_clothingitem').fetchall(), [('Shirt',)])
+        self.assertEqual(snapshot.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+
+
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.enterContext(mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}))
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+
+    def read_alias(self, model):
+        return reads_from_replica(lambda request: self.router.db_for_read(model))(None)
+
+    def test_read_only_views_use_replica(self):
+        """Чтения представлений с reads_from_replica идут в реплику, запись - в основную базу"""
+        self.assertEqual(self.read_alias(ClothingItem), 'replica')
+        self.assertEqual(self.read_alias(User), 'default')
+        self.assertEqual(self.router.db_for_read(ClothingItem), 'default')
+        self.assertEqual(self.router.db_for_write(ClothingItem), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'wardrobe'))
+
+    def test_cached_analytics_read_primary(self):
+        """Аналитика, которая кэшируется под версией гардероба, не читает реплику"""
+        ClothingItem.objects.create(user=self.user, name='Shirt', color='black', category='top', season='summer')
+        # Соединения replica в тестах нет: чтение из нее завершилось бы ошибкой
+        self.assertEqual(self.client.get(reverse('wardrobe:analytics')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('wardrobe:analytics_charts')).status_code, 200)
+
+    def test_write_pins_reads_to_primary(self):
+        """После записи браузер получает cookie, и его чтения идут в основную базу"""
+        item = ClothingItem.objects.create(user=self.user, name='Shirt', color='black', category='top', season='summer')
+        response = self.client.post(reverse('wardrobe:delete_item', args=[item.id]))
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+        
+        with mock.patch('wardrobe.routers.replica_configured', return_value=False):
+            response = self.client.get(reverse('wardrobe:wardrobe_list'))
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+        
+        middleware = ReplicaPinMiddleware(reads_from_replica(
+            lambda request: HttpResponse(self.router.db_for_read(ClothingItem))
+        ))
+        request = RequestFactory().get('/')
+        self.assertEqual(middleware(request).content, b'replica')
+        request.COOKIES[REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(middleware(request).content, b'default')
+
+
+class ItemBitmapIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.shirt = ClothingItem.objects.create(
+            user=self.user, name='Рубашка', color='white', category='top',
+            season='summer,spring', occasion='office', rating=5, price=1500,
+        )
+        self.jeans = ClothingItem.objects.create(
+            user=self.user, name='Джинсы', color='blue', category='bottom',
+            season='summer', occasion='walk', rating=3,
+        )
+
+    def test_bitsets(self):
+        """Фильтры сводятся к побитовым операциям над наборами вещей"""
+        index = get_item_index(self.user.id)
+        self.assertEqual(index.size, 2)
+        self.assertEqual(index.to_ids(index.match({'season': 'summer'})), [self.shirt.id, self.jeans.id])
+        self.assertEqual(index.to_ids(index.match({'season': 'spring,summer', 'min_rating': '4'})), [self.shirt.id])
+        self.assertEqual(index.to_ids(index.match({'price_min': '1000'})), [self.shirt.id])
+        self.assertEqual(index.to_ids(index.match({'color': 'unknown'})), [])
+        self.assertEqual(index.to_ids(index.any_of('category', ['bottom', 'shoes'])), [self.jeans.id])
+        self.assertEqual(index.count(index.bitset('occasion', 'walk')), 1)
+        self.assertEqual(ItemBitmapIndex([]).to_ids(ItemBitmapIndex([]).all()), [])
+
+    def test_index_follows_changes(self):
+        """Индекс сверяется с вещами одним запросом и перестраивается после их изменения"""
+        index = get_item_index(self.user.id)
+        with self.assertNumQueries(1):
+            self.assertIs(get_item_index(self.user.id), index)
+        
+        self.jeans.color = 'black'
+        self.jeans.save()
+        with self.assertNumQueries(2):
+            index = get_item_index(self.user.id)
+        self.assertEqual(index.to_ids(index.bitset('color', 'black')), [self.jeans.id])
+        
+        self.shirt.delete()
+        self.assertEqual(get_item_index(self.user.id).size, 1)
+
+    def test_index_follows_changes_from_other_processes(self):
+        """Изменения, о которых кэш этого процесса не знает, тоже перестраивают индекс"""
+        get_item_index(self.user.id)
+        with mock.patch('wardrobe.signals.bump_wardrobe_version'):
+            ClothingItem.objects.filter(pk=self.jeans.pk).update(color='black', updated_at=timezone.now())
+            index = get_item_index(self.user.id)
+            self.assertEqual(index.to_ids(index.bitset('color', 'black')), [self.jeans.id])
+            
+            boots = ClothingItem.objects.create(user=self.user, name='Ботинки', color='black', category='shoes', season='winter', occasion='walk')
+            ClothingItem.objects.filter(pk=self.shirt.pk).delete()
+            index = get_item_index(self.user.id)
+            self.assertEqual(index.to_ids(index.bitset('color', 'black')), [self.jeans.id, boots.id])
+
+    def test_generator_checks_index_once_per_request(self):
+        """Страница генерации сверяет индекс с базой один раз, хотя им пользуются несколько функций"""
+        get_item_index(self.user.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('wardrobe:generate_outfit'), {'generate': '1', 'categories': ['top', 'bottom']})
+        fingerprints = [query for query in queries if 'MAX("wardrobe_clothingitem"."updated_at")' in query['sql']]
+        self.assertEqual(len(fingerprints), 1)
+
+    def test_generator_keeps_user_filter(self):
+        """Чужой индекс не добавляет в генератор чужие вещи; много кандидатов выбираются в SQL"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        ClothingItem.objects.create(user=other, name='Чужая', color='red', category='top', season='summer', occasion='walk')
+        engine = OutfitEngine.for_user(self.user, ['top', 'bottom'], index=get_item_index(other.id))
+        self.assertEqual(engine.items, [])
+        
+        with mock.patch('wardrobe.generation_utils.ITEM_INDEX_MAX_IDS', 1):
+            engine = OutfitEngine.for_user(self.user, ['top', 'bottom'])
+        self.assertEqual(sorted(item.id for item in engine.items), [self.shirt.id, self.jeans.id])
+
+    def test_shared_by_list_and_generator(self):
+        """Страница гардероба и генератор выбирают вещи по индексу"""
+        response = self.client.get(reverse('wardrobe:wardrobe_list'), {'season': 'spring'})
+        self.assertEqual(list(response.context['items']), [self.shirt])
+        self.assertEqual(get_categories_with_items(self.user, ['top', 'shoes']), ['top'])
+        engine = OutfitEngine.for_user(self.user, ['bottom'])
+        self.assertEqual([item.id for item in engine.items], [self.jeans.id])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        ClothingItem.objects.bulk_create([
+            ClothingItem(
+                user=self.user, name=f'Вещь {i}', color=color, category=category,
+                season=season, occasion=occasion, rating=rating, price=100 * i,
+            )
+            for i, (category, color, season, occasion, rating) in enumerate([
+                ('top', 'black', 'summer', 'office,walk', 5),
+                ('top', 'white', 'summer,spring', 'home', 3),
+                ('bottom', 'black', 'winter', 'office', 4),
+                ('bottom', 'blue', 'summer', 'walk,party', 2),
+                ('shoes', 'black', 'summer,autumn', 'any', 4),
+            ])
+        ])
+
+    def test_counts_match_filtering(self):
+        """Счетчик варианта равен числу вещей, если выбрать этот вариант при остальных фильтрах"""
+        items = ClothingItem.objects.filter(user=self.user)
+        today = timezone.localdate().isoformat()
+        get_item_index(self.user.id)
+        for filters in [
+            {},
+            {'color': 'black'},
+            {'season': 'summer', 'min_rating': '4'},
+            {'category': 'top', 'occasion': 'walk', 'price_max': '300'},
+            {'color': 'black', 'date_from': today, 'price_min': '150'},
+            {'date_to': today, 'q': 'вещь'},
+        ]:
+            with self.assertNumQueries(1):
+                grouped = facet_counts(items, filters)
+            with self.assertNumQueries(2 if filters.get('q') else 1):
+                indexed = facet_counts(items, filters, self.user.id)
+            for field, choices in FACET_CHOICES.items():
+                for value, label in choices:
+                    expected = filter_clothing_items(items, {**filters, field: value}).count()
+                    self.assertEqual(grouped[field].get(value, 0), expected, (filters, field, value))
+                    self.assertEqual(indexed[field].get(value, 0), expected, (filters, field, value))
+
+    def test_wardrobe_list_shows_counts(self):
+        """Панель фильтров показывает счетчики и скрывает пустые варианты"""
+        response = self.client.get(reverse('wardrobe:wardrobe_list'), {'color': 'black'})
+        self.assertContains(response, 'Верх (1)')
+        self.assertContains(response, 'Черный (3)')
+        self.assertContains(response, 'Лето (2)')
+        self.assertNotContains(response, 'Верхняя одежда (')
+        self.assertNotContains(response, 'Зеленый (')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+
+    def create_item(self, name, description='', user=None):
+        return ClothingItem.objects.create(
+            user=user or self.user, name=name, description=description,
+            color='black', category='top', season='summer',
+        )
+
+    def test_match_expression(self):
+        """Слова запроса ищутся по началу, синтаксис FTS5 из запроса не используется"""
+        self.assertEqual(match_expression('Рубашка'), '{name description} : ("Рубашка"*)')
+        self.assertEqual(
+            match_expression('"ёлка" OR', user_id=3),
+            'owner : "u3" AND {name description} : ("елка"* AND "OR"*)',
+        )
+        self.assertIsNone(match_expression(' -"* '))
+
+    def test_search_ranks_and_filters_by_owner(self):
+        """Совпадение в названии выше, чем в описании; чужие вещи не находятся"""
+        in_description = self.create_item('Блуза', 'Носить с синей рубашкой')
+        in_name = self.create_item('Синяя рубашка')
+        self.create_item('Джинсы')
+        self.create_item('Рубашка', user=self.other)
+        
+        found = list(search(ClothingItem.objects.all(), 'руб', self.user.id).order_by('search_rank'))
+        self.assertEqual(found, [in_name, in_description])
+        self.assertEqual(
+            list(filter_clothing_items(ClothingItem.objects.all(), {'q': 'СИН руб'}, self.user.id)
+                 .order_by('search_rank')),
+            [in_name, in_description],
+        )
+        self.assertFalse(search(ClothingItem.objects.all(), '!!!', self.user.id).exists())
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при сохранении и удалении, ё и е не различаются"""
+        item = self.create_item('Свитер')
+        item.name = 'Тёплый свитер'
+        item.save()
+        self.assertEqual(list(search(ClothingItem.objects.all(), 'теплый')), [item])
+        
+        outfit = Outfit.objects.create(user=self.user, name='Вечерний образ')
+        self.assertEqual(list(search(Outfit.objects.all(), 'вечер')), [outfit])
+        
+        item.delete()
+        outfit.delete()
+        self.assertFalse(search(ClothingItem.objects.all(), 'свитер').exists())
+        self.assertFalse(search(Outfit.objects.all(), 'вечер').exists())
+
+    def test_rebuild_search_index(self):
+        """Перестроение восстанавливает индекс после массовых изменений в обход сигналов"""
+        item = self.create_item('Пальто')
+        ClothingItem.objects.filter(pk=item.pk).update(name='Плащ')
+        self.assertFalse(search(ClothingItem.objects.all(), 'плащ').exists())
+        
+        self.assertEqual(rebuild_search_index(ClothingItem), 1)
+        self.assertEqual(list(search(ClothingItem.objects.all(), 'плащ')), [item])
+
+    def test_ranked_cursor_pagination(self):
+        """Результаты поиска листаются курсором по релевантности без пропусков"""
+        items = [self.create_item(f'Футболка {i}', 'футболка ' * (i % 3)) for i in range(7)]
+        queryset = search(ClothingItem.objects.all(), 'футболка', self.user.id)
+        expected = list(queryset.order_by('search_rank', 'pk'))
+        
+        page, cursor = paginate_by_cursor(queryset, page_size=3)
+        collected = list(page)
+        while cursor:
+            page, cursor = paginate_by_cursor(queryset, cursor, page_size=3)
+            collected.extend(page)
+        self.assertEqual(collected, expected)
+        self.assertCountEqual(collected, items)
+
+    def test_wardrobe_list_search(self):
+        """Поиск на странице гардероба и в админке"""
+        self.create_item('Кожаная куртка')
+        self.create_item('Шерстяная юбка')
+        
+        response = self.client.get(reverse('wardrobe:wardrobe_list'), {'q': 'кож'})
+        self.assertContains(response, 'Кожаная куртка')
+        self.assertNotContains(response, 'Шерстяная юбка')
+        
+        admin = User.objects.create_superuser(username='admin', password='adminpass123')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:wardrobe_clothingitem_changelist'), {'q': 'шерст'})
+        self.assertContains(response, 'Шерстяная юбка')
+        self.assertNotContains(response, 'Кожаная куртка')
+
+
+class OutfitPoolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        
+        for category in ('top', 'bottom'):
+            for i in range(3):
+                ClothingItem.objects.create(
+                    user=self.user,
+                    name=f'{category} {i}',
+                    color='black',
+                    category=category,
+                    season='summer',
+                    occasion='office'
+                )
+
+    def test_pop_outfit_from_pool(self):
+        """Образы достаются из заранее заполненного пула"""
+        self.assertEqual(pop_outfit(self.user, ['top', 'bottom']), (None, None))
+        self.assertEqual(refill_pool(self.user.id, ['bottom', 'top'], size=3), 3)
+        
+        for _ in range(3):
+            items, categories = pop_outfit(self.user, ['top', 'bottom'])
+            self.assertEqual([item.category for item in items], ['top', 'bottom'])
+            self.assertEqual(categories, ['top', 'bottom'])
+        
+        self.assertEqual(pop_outfit(self.user, ['top', 'bottom']), (None, None))
+
+    def test_pop_outfit_skips_deleted_items(self):
+        """Образы с удаленными вещами пропускаются"""
+        refill_pool(self.user.id, ['top', 'bottom'], size=5)
+        ClothingItem.objects.filter(user=self.user, category='top').exclude(name='top 0').delete()
+        
+        items, categories = pop_outfit(self.user, ['top', 'bottom'])
+        while items is not None:
+            self.assertEqual(items[0].name, 'top 0')
+            items, categories = pop_outfit(self.user, ['top', 'bottom'])
+
+    def test_pop_outfit_claims_each_outfit_once(self):
+        """Из двух запросов, одновременно прочитавших пул, образ получает только один"""
+        refill_pool(self.user.id, ['top', 'bottom'], size=2)
+        first_read = get_outfit_pool(self.user.id, ['top', 'bottom'])
+        second_read = get_outfit_pool(self.user.id, ['top', 'bottom'])
+        self.assertTrue(claim_outfit(first_read, 0))
+        self.assertFalse(claim_outfit(second_read, 0))
+        
+        # Запрос с устаревшим номером перечитывает пул и берет следующий образ
+        refill_pool(self.user.id, ['top', 'bottom'], size=2)
+        stale = get_outfit_pool(self.user.id, ['top', 'bottom'])
+        prefix = f'{_pool_key(self.user.id, ["top", "bottom"])}:{stale.generation}'
+        first, _ = pop_outfit(self.user, ['top', 'bottom'])
+        with mock.patch('wardrobe.pool_utils.get_outfit_pool', return_value=stale):
+            second, _ = pop_outfit(self.user, ['top', 'bottom'])
+        
+        self.assertEqual([item.id for item in first], cache.get(f'{prefix}:0')['item_ids'])
+        self.assertEqual([item.id for item in second], cache.get(f'{prefix}:1')['item_ids'])
+        self.assertEqual(pop_outfit(self.user, ['top', 'bottom']), (None, None))
+
+    def test_regenerate_uses_pool(self):
+        """Перегенерация берет образ из пула"""
+        refill_pool(self.user.id, ['top', 'bottom'], size=1)
+        self.client.login(username='testuser', password='testpass123')
+        GenerationSession.objects.create(user=self.user, categories=['top', 'bottom'])
+        
+        response = self.client.get(reverse('wardrobe:regenerate_outfit'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['generated_items']), 2)
+        self.assertIsNotNone(GenerationSession.objects.get(user=self.user).current)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+
+    def create_wardrobe(self, items_count):
+        items = [
+            ClothingItem.objects.create(
+                user=self.user,
+                name=f'Item {i}',
+                color='black',
+                category='top',
+                season='summer',
+                occasion='office',
+                price=100 * (i + 1)
+            )
+            for i in range(items_count)
+        ]
+        
+        outfit = Outfit.objects.create(user=self.user, name='Outfit', occasion='office')
+        outfit.items.add(*items[:2])
+        
+        return items
+
+    def test_usage_statistics(self):
+        """Статистика использования считается по количеству образов"""
+        items = self.create_wardrobe(4)
+        outfit = Outfit.objects.create(user=self.user, name='Outfit 2', occasion='office')
+        outfit.items.add(items[1])
+        
+        stats = get_usage_statistics(self.user, ClothingItem, Outfit)
+        
+        self.assertEqual(stats['popular_items'][0], {'item': items[1], 'outfit_count': 2})
+        self.assertEqual(len(stats['popular_items']), 2)
+        self.assertEqual(set(stats['unused_items']), set(items[2:]))
+        self.assertEqual(stats['unused_items_count'], 2)
+        self.assertEqual(stats['usage_percentage'], 50.0)
+
+    def test_usage_statistics_constant_queries(self):
+        """Количество запросов не зависит от размера гардероба"""
+        self.create_wardrobe(3)
+        with self.assertNumQueries(1):
+            get_usage_statistics(self.user, ClothingItem, Outfit)
+        
+        self.create_wardrobe(20)
+        with self.assertNumQueries(1):
+            get_usage_statistics(self.user, ClothingItem, Outfit)
+
+    def test_analytics_snapshot_context(self):
+        """Снимок гардероба отдает все ключи контекста аналитики"""
+        items = self.create_wardrobe(3)
+        
+        with self.assertNumQueries(2):
+            snapshot = AnalyticsSnapshot(self.user, ClothingItem, Outfit)
+            context = snapshot.as_context()
+        
+        self.assertEqual(context['total_items'], 3)
+        self.assertEqual(context['total_outfits'], 1)
+        self.assertEqual(context['total_price'], 600)
+        self.assertEqual(context['most_expensive_items'][0], items[2])
+        self.assertEqual(context['cheapest_items'][0], items[0])
+        self.assertEqual(context['category_budget']['Верх']['count'], 3)
+        self.assertEqual(context['season_stats']['Лето'], {'count': 3, 'percent': 100.0})
+        self.assertEqual(context['category_counts']['Верх'], 3)
+
+    def test_analytics_view_queries(self):
+        """Страница аналитики не делает запросов на каждую вещь"""
+        self.create_wardrobe(10)
+        self.client.login(username='testuser', password='testpass123')
+        
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('wardrobe:analytics'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_items'], 10)
+
+    def test_analytics_view_cached_until_wardrobe_changes(self):
+        """Повторный просмотр аналитики берется из кэша до изменения гардероба"""
+        items = self.create_wardrobe(3)
+        self.client.login(username='testuser', password='testpass123')
+        self.client.get(reverse('wardrobe:analytics'))
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('wardrobe:analytics'))
+        self.assertEqual(response.context['total_outfits'], 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            outfit = Outfit.objects.create(user=self.user, name='Outfit 2', occasion='office')
+        response = self.client.get(reverse('wardrobe:analytics'))
+        self.assertEqual(response.context['total_outfits'], 2)
+        self.assertEqual(response.context['usage_percentage'], 66.7)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            outfit.items.add(items[2])
+        response = self.client.get(reverse('wardrobe:analytics'))
+        self.assertEqual(response.context['usage_percentage'], 100.0)
+
+    def test_wardrobe_version_changes_after_commit(self):
+        """Версия гардероба меняется только после фиксации транзакции с изменением"""
+        version = get_wardrobe_version(self.user.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            ClothingItem.objects.create(user=self.user, name='Вещь', color='red', category='top', season='summer', occasion='office')
+            self.assertEqual(get_wardrobe_version(self.user.id), version)
+        
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_wardrobe_version(self.user.id), version)
+
+    def test_analytics_charts_endpoint(self):
+        """Графики отдаются отдельным JSON без встроенного plotly.js"""
+        self.create_wardrobe(3)
+        self.client.login(username='testuser', password='testpass123')
+        
+        page = self.client.get(reverse('wardrobe:analytics'))
+        self.assertContains(page, 'data-chart="color_chart"')
+        self.assertContains(page, 'plotly-3.3.0.min.js', count=1)
+        
+        response = self.client.get(reverse('wardrobe:analytics_charts'))
+        charts = response.json()
+        
+        self.assertEqual(charts['color_chart']['data'][0]['type'], 'pie')
+        self.assertEqual(charts['category_chart']['data'][0]['type'], 'bar')
+        self.assertIn('layout', charts['budget_chart'])
+        self.assertLess(len(response.content), 100_000)
+
+    def test_process_local_cache_warning(self):
+        """Проверка предупреждает, что кэш аналитики и версий не общий для процессов"""
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        filebased = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(TESTING=False, CACHES=locmem):
+            self.assertEqual([message.id for message in check_shared_cache(None)], ['wardrobe.W001'])
+        with override_settings(TESTING=False, CACHES=filebased):
+            self.assertEqual(check_shared_cache(None), [])
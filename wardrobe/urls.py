@@ -7,10 +7,13 @@ app_name = 'wardrobe'
 urlpatterns = [
     path('', views.home, name='home'),
     path('wardrobe/', views.wardrobe_list, name='wardrobe_list'),
+    path('wardrobe/page/', views.wardrobe_list_page, name='wardrobe_list_page'),
     path('wardrobe/add/', views.add_clothing_item, name='add_item'),
     path('outfits/', views.outfit_list, name='outfit_list'),
+    path('outfits/page/', views.outfit_list_page, name='outfit_list_page'),
     path('outfits/create/', views.create_outfit, name='create_outfit'),
     path('analytics/', views.analytics, name='analytics'),
+    path('analytics/charts/', views.analytics_charts, name='analytics_charts'),
     path('item/<int:item_id>/modal/', views.item_modal_view, name='item_modal'),
     path('outfit/<int:outfit_id>/modal/', views.outfit_modal_view, name='outfit_modal'),
     path('register/', views.register_view, name='register'),
@@ -21,6 +24,7 @@ urlpatterns = [
     path('generate/', views.generate_outfit, name='generate_outfit'),
     path('regenerate/', views.regenerate_outfit, name='regenerate_outfit'),
     path('rate/', views.rate_outfit, name='rate_outfit'),
+    path('undo/', views.undo_outfit, name='undo_outfit'),
     path('accounts/login/', RedirectView.as_view(pattern_name='wardrobe:login')),
     path('accounts/logout/', RedirectView.as_view(pattern_name='wardrobe:logout')),
 ]
\ No newline at end of file
@@ -1,5 +1,9 @@
 def get_display_from_comma_separated(obj, field_name, choices):
-    """Утилита для получения отображения строк с запятыми"""
+    """Утилита для получения отображения строк с запятыми
+
+    Поле может хранить строку кодов через запятую или битовую маску,
+    в которой бит i соответствует i-му варианту из choices.
+    """
     field_value = getattr(obj, field_name, None)
     if not field_value:
         return "Не указано"
@@ -7,7 +11,12 @@ def get_display_from_comma_separated(obj, field_name, choices):
     choices_dict = dict(choices)
     result = []
     
-    for code in field_value.split(','):
+    if isinstance(field_value, int):
+        codes = [code for bit, (code, name) in enumerate(choices) if field_value & (1 << bit)]
+    else:
+        codes = field_value.split(',')
+    
+    for code in codes:
         code = code.strip()
         if code in choices_dict:
             result.append(choices_dict[code])
@@ -3,6 +3,8 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import F
 from .models import ClothingItem, Outfit
 from .forms import (
     ClothingItemForm, OutfitForm, CustomUserCreationForm, 
@@ -13,8 +15,28 @@ from .generation_utils import (
     update_compatibility_scores,
     validate_categories_for_generation,
     generate_and_save_outfit,
-    prepare_generation_context
+    save_generated_outfit,
+    get_generation_session,
+    get_request_item_index,
+    prepare_generation_context,
+    uses_embeddings
 )
+from .pool_utils import pop_outfit, schedule_pool_refill
+from .job_utils import enqueue_image_job
+from .image_utils import stage_upload
+from .event_utils import log_generation_event
+from .embedding_utils import update_item_embeddings
+from .routers import reads_from_replica
+from .filter_utils import (
+    ITEM_FILTER_FIELDS,
+    OUTFIT_FILTER_FIELDS,
+    get_current_filters,
+    filter_clothing_items,
+    filter_outfits,
+    paginate_by_cursor,
+    next_page_query
+)
+from .facet_utils import facet_counts, facet_options
 
 
 def home(request):
@@ -26,7 +48,7 @@ def home(request):
         recent_items = ClothingItem.objects.filter(user=request.user) \
             .order_by('-created_at')[:4]
         
-        recent_outfits = Outfit.objects.filter(user=request.user) \
+        recent_outfits = Outfit.objects.filter(user=request.user).with_items() \
             .order_by('-created_at')[:4]
     else:
         total_items = 0
@@ -43,54 +65,32 @@ def home(request):
     return render(request, 'wardrobe/home.html', context)
 
 @login_required
+@reads_from_replica
 def wardrobe_list(request):
     """Страница со всеми вещами в гардеробе"""
-    items = ClothingItem.objects.filter(user=request.user)
-    
-    category = request.GET.get('category', '')
-    color = request.GET.get('color', '')
-    season = request.GET.get('season', '')
-    occasion = request.GET.get('occasion', '')
-    min_rating = request.GET.get('min_rating', '')
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
-    price_min = request.GET.get('price_min', '')
-    price_max = request.GET.get('price_max', '')
-    
-    if category:
-        items = items.filter(category=category)
-    if color:
-        items = items.filter(color=color)
-    if season:
-        items = items.filter(season__contains=season)
-    if occasion:
-        items = items.filter(occasion__contains=occasion) 
-    if min_rating:
-        items = items.filter(rating__gte=int(min_rating))
-    if date_from:
-        items = items.filter(created_at__gte=date_from)
-    if date_to:
-        items = items.filter(created_at__lte=date_to)
-    if price_min:
-        items = items.filter(price__gte=price_min)
-    if price_max:
-        items = items.filter(price__lte=price_max)
-    
-    context = {
+    context = get_wardrobe_page_context(request)
+    counts = facet_counts(ClothingItem.objects.filter(user=request.user), context['current_filters'], request.user.id)
+    context['facets'] = facet_options(counts, context['current_filters'])
+    return render(request, 'wardrobe/wardrobe_list.html', context)
+
+@login_required
+@reads_from_replica
+def wardrobe_list_page(request):
+    """Следующая страница вещей для бесконечной прокрутки"""
+    context = get_wardrobe_page_context(request)
+    return render(request, 'wardrobe/item_list_page.html', context)
+
+def get_wardrobe_page_context(request):
+    """Страница вещей гардероба с учетом фильтров и курсора"""
+    current_filters = get_current_filters(request.GET, ITEM_FILTER_FIELDS)
+    items = filter_clothing_items(ClothingItem.objects.filter(user=request.user), current_filters, request.user.id)
+    items, next_cursor = paginate_by_cursor(items, request.GET.get('cursor'))
+
+    return {
         'items': items,
-        'current_filters': {
-            'category': category,
-            'color': color,
-            'season': season,
-            'occasion': occasion,
-            'min_rating': min_rating,
-            'date_from': date_from,
-            'date_to': date_to,
-            'price_min': price_min,
-            'price_max': price_max,
-        }
+        'next_page_query': next_page_query(request.GET, next_cursor),
+        'current_filters': current_filters,
     }
-    return render(request, 'wardrobe/wardrobe_list.html', context)
 
 @login_required
 def add_clothing_item(request):
@@ -100,11 +100,12 @@ def add_clothing_item(request):
         if form.is_valid():
             item = form.save(commit=False)
             item.user = request.user
-            seasons = form.cleaned_data['season']
-            item.season = ','.join(seasons)
-            occasions = form.cleaned_data['occasion']
-            item.occasion = ','.join(occasions)
-            item.save()
+            # Фото хэширует и обрабатывает фоновый обработчик (run_image_worker)
+            stage_upload(item)
+            item.image_status = ClothingItem.IMAGE_PROCESSING
+            with transaction.atomic():
+                item.save()
+                enqueue_image_job(item)
             messages.success(request, 'Вещь успешно добавлена в гардероб!')
             return redirect('wardrobe:wardrobe_list')
     else:
@@ -114,34 +115,30 @@ def add_clothing_item(request):
     return render(request, 'wardrobe/add_item.html', context)
 
 @login_required
+@reads_from_replica
 def outfit_list(request):
     """Страница со всеми образами"""
-    outfits = Outfit.objects.filter(user=request.user)
-    
-    occasion = request.GET.get('occasion', '')
-    min_rating = request.GET.get('min_rating', '')
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
-    
-    if occasion:
-        outfits = outfits.filter(occasion=occasion)
-    if min_rating:
-        outfits = outfits.filter(rating__gte=int(min_rating))
-    if date_from:
-        outfits = outfits.filter(created_at__gte=date_from)
-    if date_to:
-        outfits = outfits.filter(created_at__lte=date_to)
-    
-    context = {
+    context = get_outfit_page_context(request)
+    return render(request, 'wardrobe/outfit_list.html', context)
+
+@login_required
+@reads_from_replica
+def outfit_list_page(request):
+    """Следующая страница образов для бесконечной прокрутки"""
+    context = get_outfit_page_context(request)
+    return render(request, 'wardrobe/outfit_list_page.html', context)
+
+def get_outfit_page_context(request):
+    """Страница образов с учетом фильтров и курсора"""
+    current_filters = get_current_filters(request.GET, OUTFIT_FILTER_FIELDS)
+    outfits = filter_outfits(Outfit.objects.filter(user=request.user).with_items(), current_filters, request.user.id)
+    outfits, next_cursor = paginate_by_cursor(outfits, request.GET.get('cursor'))
+
+    return {
         'outfits': outfits,
-        'current_filters': {
-            'occasion': occasion,
-            'min_rating': min_rating,
-            'date_from': date_from,
-            'date_to': date_to,
-        }
+        'next_page_query': next_page_query(request.GET, next_cursor),
+        'current_filters': current_filters,
     }
-    return render(request, 'wardrobe/outfit_list.html', context)
 
 @login_required
 def create_outfit(request):
@@ -151,8 +148,6 @@ def create_outfit(request):
         if form.is_valid():
             outfit = form.save(commit=False)
             outfit.user = request.user
-            occasions = form.cleaned_data['occasion']
-            outfit.occasion = ','.join(occasions)
             outfit.save()
             form.save_m2m()
             messages.success(request, 'Образ успешно создан!')
@@ -163,74 +158,33 @@ def create_outfit(request):
     context = {'form': form}
     return render(request, 'wardrobe/create_outfit.html', context)
 
+# Аналитика читает основную базу: она кэшируется под текущей версией
+# гардероба, и данные отстающей реплики остались бы в кэше для всех
 @login_required
 def analytics(request):
     """Страница аналитики гардероба"""
     from .models import ClothingItem, Outfit
-    from .analytics_utils import (
-        get_basic_statistics,
-        get_financial_statistics,
-        get_usage_statistics,
-        get_season_statistics,
-        get_recommendations_for_user,
-        get_charts_data
-    )
-    
-    items = ClothingItem.objects.filter(user=request.user)
-    
-    if not items.exists():
-        context = {'has_items': False}
-        return render(request, 'wardrobe/analytics.html', context)
-    
-    # Получаем все данные через утилиты
-    basic_stats = get_basic_statistics(request.user, ClothingItem, Outfit)
-    financial_stats = get_financial_statistics(request.user, ClothingItem)
-    usage_stats = get_usage_statistics(request.user, ClothingItem, Outfit)
-    season_stats = get_season_statistics(request.user, ClothingItem)
-    recommendations, category_counts = get_recommendations_for_user(request.user, ClothingItem, Outfit)
-    charts_data = get_charts_data(request.user, ClothingItem)
+    from .analytics_utils import get_analytics_context
     
-    context = {
-        'has_items': True,
-        
-        # Базовая статистика
-        'total_items': basic_stats['total_items'],
-        'total_outfits': basic_stats['total_outfits'],
-        'avg_rating': basic_stats['avg_rating'],
-        
-        # Финансовая аналитика
-        'total_price': financial_stats['total_price'],
-        'avg_price': financial_stats['avg_price'],
-        'most_expensive_items': financial_stats['most_expensive_items'],
-        'cheapest_items': financial_stats['cheapest_items'],
-        'category_budget': financial_stats['category_budget'],
-        
-        # Статистика использования
-        'popular_items': usage_stats['popular_items'],
-        'unused_items': usage_stats['unused_items'],
-        'usage_percentage': usage_stats['usage_percentage'],
-        
-        # Сезонная аналитика
-        'season_stats': season_stats,
-        
-        # Рекомендации
-        'recommendations': recommendations,
-        'category_counts': category_counts,
-        
-        # Графики
-        'color_chart': charts_data['color_chart'],
-        'category_chart': charts_data['category_chart'],
-        'budget_chart': charts_data['budget_chart']
-    }
+    context = get_analytics_context(request.user, ClothingItem, Outfit)
     return render(request, 'wardrobe/analytics.html', context)
 
+@login_required
+def analytics_charts(request):
+    """JSON фигур для графиков страницы аналитики"""
+    from .analytics_utils import get_charts_context
+    
+    return JsonResponse(get_charts_context(request.user, ClothingItem))
+
+@reads_from_replica
 def item_modal_view(request, item_id):
     item = get_object_or_404(ClothingItem, id=item_id)
     return render(request, 'wardrobe/item_modal.html', {'item': item, 'show_delete': False})
 
 
+@reads_from_replica
 def outfit_modal_view(request, outfit_id):
-    outfit = get_object_or_404(Outfit, id=outfit_id)
+    outfit = get_object_or_404(Outfit.objects.with_items(), id=outfit_id)
     return render(request, 'wardrobe/outfit_modal.html', {'outfit': outfit})
 
 def register_view(request):
@@ -300,6 +254,16 @@ def delete_outfit(request, outfit_id):
     messages.success(request, f'Образ "{outfit_name}" успешно удален!')
     return redirect('wardrobe:outfit_list')
 
+def pop_or_generate_outfit(request, categories):
+    """Берет образ из пула, а при пустом пуле генерирует его сразу"""
+    generated_items, valid_categories = pop_outfit(request.user, categories)
+    
+    if generated_items:
+        save_generated_outfit(request, generated_items, valid_categories)
+        return generated_items, None
+    
+    return generate_and_save_outfit(request, categories)
+
 @login_required
 def generate_outfit(request):
     """Главная страница генерации образов"""
@@ -314,10 +278,12 @@ def generate_outfit(request):
         
         if form.is_valid():
             categories = form.cleaned_data['categories']
-            request.session['selected_categories'] = categories
-            generated_items, error = generate_and_save_outfit(request, categories)
+            generation_session = get_generation_session(request)
+            generation_session.categories = categories
+            generated_items, error = pop_or_generate_outfit(request, categories)
             
             if error:
+                generation_session.save()
                 messages.error(request, error)
                 return redirect('wardrobe:generate_outfit')
             
@@ -341,34 +307,41 @@ def generate_outfit(request):
 def regenerate_outfit(request):
     """Генерировать новый образ с теми же категориями"""
     
-    saved_categories = request.session.get('selected_categories', [])
+    saved_categories = get_generation_session(request).categories
     
     if not saved_categories:
         messages.error(request, 'Сначала выберите категории в генераторе')
         return redirect('wardrobe:generate_outfit')
     
-    valid_categories, categories_with_items = validate_categories_for_generation(
-        request.user, 
-        saved_categories
-    )
+    # Готовый образ из пула не требует повторной проверки категорий
+    generated_items, valid_categories = pop_outfit(request.user, saved_categories)
     
-    if not valid_categories:
-        if len(categories_with_items) < 2:
-            messages.error(
-                request, 
-                f'В сохраненных категориях недостаточно вещей ({len(categories_with_items)} из минимум 2). '
-                f'Выберите другие категории.'
-            )
-        else:
-            messages.error(request, 'В сохраненных категориях недостаточно вещей')
+    if generated_items:
+        save_generated_outfit(request, generated_items, valid_categories)
+    else:
+        valid_categories, categories_with_items = validate_categories_for_generation(
+            request.user, 
+            saved_categories,
+            index=get_request_item_index(request)
+        )
         
-        return redirect('wardrobe:generate_outfit')
-    
-    generated_items, error = generate_and_save_outfit(request, saved_categories)
-    
-    if error:
-        messages.error(request, error)
-        return redirect('wardrobe:generate_outfit')
+        if not valid_categories:
+            if len(categories_with_items) < 2:
+                messages.error(
+                    request, 
+                    f'В сохраненных категориях недостаточно вещей ({len(categories_with_items)} из минимум 2). '
+                    f'Выберите другие категории.'
+                )
+            else:
+                messages.error(request, 'В сохраненных категориях недостаточно вещей')
+            
+            return redirect('wardrobe:generate_outfit')
+        
+        generated_items, error = generate_and_save_outfit(request, saved_categories)
+        
+        if error:
+            messages.error(request, error)
+            return redirect('wardrobe:generate_outfit')
     
     context = prepare_generation_context(
         request,
@@ -382,7 +355,9 @@ def regenerate_outfit(request):
 def rate_outfit(request):
     """Оценить сгенерированный образ"""
     
-    if request.method != 'POST' or 'generated_outfit' not in request.session:
+    generation_session = get_generation_session(request)
+    
+    if request.method != 'POST' or generation_session.current is None:
         messages.error(request, 'Не удалось оценить образ')
         return redirect('wardrobe:generate_outfit')
     
@@ -395,8 +370,7 @@ def rate_outfit(request):
         return redirect('wardrobe:generate_outfit')
     
     rating = int(rating_form.cleaned_data['rating'])
-    outfit_data = request.session['generated_outfit']
-    item_ids = outfit_data['item_ids']
+    item_ids = generation_session.current['item_ids']
     
     items = ClothingItem.objects.filter(id__in=item_ids, user=request.user)
     
@@ -404,19 +378,33 @@ def rate_outfit(request):
         messages.error(request, 'Ошибка: некоторые вещи не найдены')
         return redirect('wardrobe:generate_outfit')
     
-    update_compatibility_scores(request.user, items, rating)
+    with transaction.atomic():
+        update_compatibility_scores(request.user, items, rating)
+        if uses_embeddings():
+            update_item_embeddings(items, rating)
+        log_generation_event(request.user, generation_session.current, rating)
+        
+        # Понравившийся образ не увеличивает счетчик показов
+        if rating < 4:
+            items.update(times_shown=F('times_shown') + 1)
+        
+        # Оценки изменились - пулы пересобираются с новыми весами
+        schedule_pool_refill(request.user.id)
     
-    for item in items:
-        item.times_shown += 1
-        item.save()
+    generation_session.rate(rating)
+    generation_session.save()
     
-    if rating >= 4:
-        for item in items:
-            item.times_shown = max(0, item.times_shown - 1)
-            item.save()
+    messages.success(request, f'Спасибо за оценку {rating} ★! Система обучилась на ваших предпочтениях.')
+    return redirect('wardrobe:generate_outfit')
+
+@login_required
+def undo_outfit(request):
+    """Вернуться к предыдущему сгенерированному образу"""
+    generation_session = get_generation_session(request)
     
-    request.session['outfit_rated'] = True
-    request.session['last_rating'] = rating
+    if request.method == 'POST' and generation_session.undo():
+        generation_session.save()
+    else:
+        messages.error(request, 'Нет предыдущих образов')
     
-    messages.success(request, f'Спасибо за оценку {rating} ★! Система обучилась на ваших предпочтениях.')
     return redirect('wardrobe:generate_outfit')
\ No newline at end of file